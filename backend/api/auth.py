@@ -0,0 +1,62 @@
+# backend/api/auth.py
+# 登录：用访问密码换取短期会话令牌，之后的请求带 "Authorization: Bearer <令牌>"
+
+from fastapi import APIRouter, Request, HTTPException
+from pydantic import BaseModel
+from typing import List
+from backend.core.access_policy import get_policy, RATE_WINDOW
+from backend.core.security import verify_request
+from backend.core.logger import log_access
+from backend.api.profiling import require_local
+import ipaddress
+
+router = APIRouter()
+
+class LoginRequest(BaseModel):
+    password: str = ""
+
+@router.post("/login")
+def login(data: LoginRequest, request: Request):
+    ip = request.client.host
+    policy = get_policy()
+
+    if policy.is_blocked(ip):
+        raise HTTPException(429, detail=f"认证失败次数过多，请 {RATE_WINDOW} 秒后再试")
+    action = policy.rule(ip)
+    if action == "deny":
+        raise HTTPException(403, detail=f"未授权访问（IP {ip} 已被禁止）")
+    if action != "allow" and policy.require_password and not policy.check_password(data.password):
+        policy.record_failure(ip)
+        log_access(ip, "LOGIN", "-", False)
+        raise HTTPException(403, detail="密码错误")
+
+    token, ttl = policy.issue_token(ip)
+    log_access(ip, "LOGIN", "-", True)
+    return {"token": token, "expires_in": ttl}
+
+class GrantRequest(BaseModel):
+    paths: List[str]    # 允许读取的相对路径（文件或文件夹）
+    peer: str           # 被授权设备连接本机时使用的 IP
+
+@router.post("/grant")
+def grant(data: GrantRequest, request: Request):
+    """为另一台设备签发只读授权令牌，让它代为拉取 paths；调用方自己须已通过认证"""
+    verify_request(request)
+    ip = request.client.host
+    try:
+        ipaddress.ip_address(data.peer)
+    except ValueError:
+        raise HTTPException(400, detail="无效的设备地址")
+    paths = [p.strip() for p in data.paths if p.strip()]
+    if not paths:
+        raise HTTPException(400, detail="缺少有效路径")
+
+    token, ttl = get_policy().issue_grant(data.peer, paths)
+    log_access(ip, "GRANT", f"{data.peer} {','.join(paths)}", True)
+    return {"token": token, "expires_in": ttl}
+
+@router.get("/clients")
+def client_counters(request: Request):
+    """各客户端 IP 在当前计数窗口内的请求数和认证失败数（仅限本机访问）"""
+    require_local(request)
+    return get_policy().clients()
@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
-import pyperclip
 import hashlib
 import time
 from backend.core.logger import log_access
@@ -23,6 +22,7 @@ def get_clipboard(request: Request):
     verify_request(request)  # 权限认证
 
     try:
+        import pyperclip  # 很少使用，按需加载以加快启动
         content = pyperclip.paste()
         log_access(ip, "CLIPBOARD_GET", "-", True)
         return {"content": content, "md5": md5(content)}
@@ -36,6 +36,7 @@ def set_clipboard(data: ClipboardData, request: Request):
     verify_request(request)  # 权限认证
 
     try:
+        import pyperclip
         pyperclip.copy(data.content)
         log_access(ip, "CLIPBOARD_SET", "-", True)
         return {"status": "success"}
@@ -1,88 +1,171 @@
 # backend/api/files.py
-from zipfile import ZipFile, ZIP_DEFLATED
 from backend.core.logger import log_access
 from fastapi import APIRouter, Request, Query, HTTPException, Response, Header
 from backend.config import get_settings
 from backend.core.security import verify_request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 import os
-from typing import Optional
-import tempfile
-import uuid
-from io import BytesIO
+from typing import Optional, List
+from pydantic import BaseModel
+from backend.core.dir_index import list_directory, listing_etag, stat_paths, revalidate_entries
+from backend.core.tree_walk import TreeWalk
+from backend.core.change_feed import get_change_feed
+from backend.core.hashing import file_digest, quick_digest, locate, DEFAULT_PIECE_SIZE, MIN_PIECE_SIZE, MAX_PIECE_SIZE
+from backend.core.archive_cache import get_archive_cache, collect_entries, manifest_key
+from backend.core.archive_jobs import archive_jobs
+from backend.core.request_profile import span
+from backend.core.sparse import is_sparse, sparse_stream, SPARSE_MEDIA_TYPE
+from backend.core.block_cache import get_block_cache
+from backend.core.compression import is_compressible, gzip_stream
+from backend.core.transfer_history import track
+from backend.core.preview import get_preview_cache, preview_kind, normalize_size, KINDS
+from urllib.parse import quote
+from email.utils import formatdate
+import json
+import time
+import asyncio
 
 router = APIRouter()
 
+def start_zip_build(settings, rel_paths):
+    """展开路径、计算缓存键并取得（或启动）对应的打包"""
+    root = settings["share_path"]
+
+    # 以“路径 + 大小 + mtime”清单作为缓存键，内容没变就复用已有的压缩包
+    with span("traverse"):
+        common_root, entries = collect_entries(root, rel_paths)
+    key = manifest_key(entries)
+
+    # 判断是否为单个文件夹
+    if len(rel_paths) == 1 and os.path.isdir(os.path.join(root, rel_paths[0])):
+        zip_filename = f"{os.path.basename(rel_paths[0])}.zip"
+    else:
+        zip_filename = f"flydrop-{key[:8]}.zip"
+
+    # 相同的并发请求共享同一次打包，边打包边传输；返回的打包已 pin 住，调用方用完后 unpin
+    return get_archive_cache(settings).get_or_build(key, entries, zip_filename)
+
+def zip_response(request, build, label, chunks=None):
+    headers = {
+        "Content-Disposition": f"attachment; filename={build.filename}",
+        "X-Zip-Filename": build.filename  # 返回 zip 文件名
+    }
+    if build.done and not build.error:
+        headers["Content-Length"] = str(build.committed)  # 已完成时大小已知
+    body = track(get_settings(), chunks if chunks is not None else build.stream(), request.client.host, "zip", label)
+    return StreamingResponse(body, media_type="application/zip", headers=headers)
+
 @router.get("/zip")
 def download_zip(request: Request, paths: str = Query(...)):
     verify_request(request)
 
-    # 获取设置
-    settings = get_settings()
-    root = settings["share_path"]
-
     # 路径处理
     rel_paths = [p.strip() for p in paths.split(",") if p.strip()]
     if not rel_paths:
         raise HTTPException(400, detail="缺少有效路径")
 
-    # 找出最外层路径（假设根目录为最外层）
-    common_root = os.path.commonpath([os.path.join(root, p) for p in rel_paths])
+    try:
+        build = start_zip_build(get_settings(), rel_paths)
+    except Exception as e:
+        raise HTTPException(500, detail=f"打包失败: {e}")
+    try:
+        return zip_response(request, build, ",".join(rel_paths))
+    finally:
+        build.cache.unpin(build.key)  # 响应体已登记为读者，不再需要 pin
 
-    # 判断是否为单个文件夹
-    if len(rel_paths) == 1 and os.path.isdir(os.path.join(root, rel_paths[0])):
-        zip_filename = f"{os.path.basename(rel_paths[0])}.zip"
-    else:
-        zip_filename = f"flydrop-{uuid.uuid4().hex[:8]}.zip"
+class ZipJobRequest(BaseModel):
+    paths: List[str]
 
-    # 创建临时文件保存 zip
-    temp_dir = tempfile.gettempdir()
-    zip_path = os.path.join(temp_dir, zip_filename)
+@router.post("/zip/jobs")
+def create_zip_job(data: ZipJobRequest, request: Request):
+    """创建异步打包任务，立即返回任务 ID 和初始进度"""
+    verify_request(request)
+    ip = request.client.host
 
-    try:
-        with ZipFile(zip_path, "w", ZIP_DEFLATED) as zipf:
-            for rel_path in rel_paths:
-                abs_path = os.path.abspath(os.path.join(root, rel_path))
-
-                # 处理路径越界的情况
-                if not abs_path.startswith(common_root):
-                    continue  # 忽略越界路径
-
-                # 如果是文件夹，递归添加其中的文件
-                if os.path.isdir(abs_path):
-                    for foldername, subfolders, filenames in os.walk(abs_path):
-                        for filename in filenames:
-                            full_path = os.path.join(foldername, filename)
-                            arcname = os.path.relpath(full_path, common_root)
-                            zipf.write(full_path, arcname=arcname)
-
-                # 如果是文件，直接添加
-                elif os.path.isfile(abs_path):
-                    arcname = os.path.relpath(abs_path, common_root)
-                    zipf.write(abs_path, arcname=arcname)
-
-        # 以流的形式返回 zip 文件并删除
-        def file_stream():
-            with open(zip_path, "rb") as f:
-                yield from f
-            os.remove(zip_path)  # 下载完后自动删除
-
-        return StreamingResponse(
-            file_stream(),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={zip_filename}",
-                "X-Zip-Filename": zip_filename  # 返回 zip 文件名
-            }
-        )
+    rel_paths = [p.strip() for p in data.paths if p.strip()]
+    if not rel_paths:
+        raise HTTPException(400, detail="缺少有效路径")
 
+    try:
+        build = start_zip_build(get_settings(), rel_paths)
     except Exception as e:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        log_access(ip, "ZIP_JOB", ",".join(rel_paths), False)
         raise HTTPException(500, detail=f"打包失败: {e}")
 
+    job = archive_jobs.create(build, ip)
+    log_access(ip, "ZIP_JOB", ",".join(rel_paths), True)
+    return job.status()
+
+def get_zip_job(job_id):
+    job = archive_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="打包任务不存在")
+    return job
+
+@router.get("/zip/jobs/{job_id}")
+def zip_job_status(job_id: str, request: Request):
+    verify_request(request)
+    return get_zip_job(job_id).status()
+
+@router.get("/zip/jobs/{job_id}/events")
+async def zip_job_events(job_id: str, request: Request):
+    """以 Server-Sent Events 推送进度，直到任务结束或客户端断开；在事件循环里等待，不占用线程池"""
+    verify_request(request)
+    job = get_zip_job(job_id)
+
+    async def event_stream():
+        while True:
+            status = job.status()
+            yield f"data: {json.dumps(status)}\n\n"
+            if status["state"] != "building" or await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@router.get("/zip/jobs/{job_id}/download")
+def zip_job_download(job_id: str, request: Request):
+    """下载任务结果；任务尚未完成时边打包边传输"""
+    verify_request(request)
+    job = get_zip_job(job_id)
+    if job.state in ("failed", "canceled"):
+        raise HTTPException(409, detail=f"打包任务已{'取消' if job.state == 'canceled' else '失败'}")
+    try:
+        chunks = job.stream()
+    except FileNotFoundError:
+        # 已完整下载过一次的任务不再 pin 住压缩包，之后可能被淘汰
+        raise HTTPException(410, detail="压缩包已被清理，请重新打包")
+    return zip_response(request, job.build, f"job:{job_id}", chunks)
+
+@router.delete("/zip/jobs/{job_id}")
+def cancel_zip_job(job_id: str, request: Request):
+    verify_request(request)
+    job = archive_jobs.cancel(job_id, get_archive_cache(get_settings()))
+    if job is None:
+        raise HTTPException(404, detail="打包任务不存在")
+    log_access(request.client.host, "ZIP_JOB_CANCEL", job_id, True)
+    return job.status()
+
+@router.get("/cache")
+def read_cache_stats(request: Request):
+    """热文件块缓存的命中率等统计"""
+    verify_request(request)
+    return get_block_cache(get_settings()).stats()
+
 @router.get("/list")
-def list_files(request: Request, path: str = Query(default="")):
+def list_files(
+    request: Request,
+    response: Response,
+    path: str = Query(default=""),
+    offset: int = Query(default=0, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1),
+    sort: str = Query(default="name"),
+    desc: bool = Query(default=False),
+    show_hidden: bool = Query(default=True),
+    q: str = Query(default=""),
+    fields: str = Query(default="size"),
+    if_none_match: Optional[str] = Header(default=None)
+):
     verify_request(request)  # ✅ 验证访问权限
     ip = request.client.host
 
@@ -96,27 +179,228 @@ def list_files(request: Request, path: str = Query(default="")):
     if not os.path.isdir(abs_path):
         raise HTTPException(404, detail="路径不存在")
 
-    file_list = []
+    # 排序、过滤、分页都在服务端完成；fields 为空时只返回名称和类型，元数据由 /stat 按需获取
+    need_stat = bool(fields.strip())
     try:
-        for name in os.listdir(abs_path):
-            full_path = os.path.join(abs_path, name)
-            rel_path = os.path.relpath(full_path, root)
-            if os.path.isdir(full_path):
-                file_list.append({"type": "dir", "path": rel_path, "name": name})
-            elif os.path.isfile(full_path):
-                file_list.append({"type": "file", "path": rel_path, "name": name})
+        entries = list_directory(abs_path, root, sort=sort, desc=desc,
+                                 show_hidden=show_hidden, q=q.strip(), need_stat=need_stat)
         log_access(ip, "LIST", path, True)
     except Exception as e:
         log_access(ip, "LIST", path, False)
         raise HTTPException(500, detail=str(e))
 
-    return file_list
+    page = entries[offset:offset + limit] if limit else entries[offset:]
+    if need_stat:
+        # 目录 mtime 看不出文件被原地改写，逐项确认这一页；按大小或时间排序时顺序可能也变了，重新排序
+        if revalidate_entries(abs_path, page, root) and sort in ("size", "mtime"):
+            entries = list_directory(abs_path, root, sort=sort, desc=desc,
+                                     show_hidden=show_hidden, q=q.strip(), need_stat=need_stat)
+            page = entries[offset:offset + limit] if limit else entries[offset:]
+    else:
+        page = [{"type": e["type"], "path": e["path"], "name": e["name"]} for e in page]
+
+    # 校验值由目录 mtime 和本页内容共同决定，客户端缓存没过期时返回 304，不再传条目
+    etag = listing_etag(abs_path, page, len(entries))
+    headers = {"ETag": etag, "X-Total-Count": str(len(entries))}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return page
+
+@router.get("/tree")
+def list_tree(
+    request: Request,
+    path: str = Query(default=""),
+    depth: int = Query(default=1),
+    recursive: bool = Query(default=False),
+    show_hidden: bool = Query(default=True),
+    q: str = Query(default=""),
+    fields: str = Query(default="size")
+):
+    """
+    一次返回整棵子树：服务端并行遍历各子目录，每行一个 JSON 条目（NDJSON），边遍历边输出。
+    条目顺序不固定；最后一行是 {"type": "end", "count", "errors", "truncated"}，没有收到说明传输中断。
+    """
+    verify_request(request)
+    ip = request.client.host
+
+    settings = get_settings()
+    root = settings["share_path"]
+    abs_path = os.path.abspath(os.path.join(root, path))
+
+    if not abs_path.startswith(os.path.abspath(root)):
+        raise HTTPException(403, detail="非法路径")
+
+    if not os.path.isdir(abs_path):
+        raise HTTPException(404, detail="路径不存在")
+
+    walk = TreeWalk(abs_path, root, depth=-1 if recursive else depth,
+                    show_hidden=show_hidden, q=q.strip(), need_stat=bool(fields.strip()))
+    log_access(ip, "TREE", path, True)
+
+    def ndjson():
+        for batch in walk.batches():
+            yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+        yield json.dumps({"type": "end", "count": walk.count, "errors": walk.errors,
+                          "truncated": walk.truncated}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.get("/changes")
+async def watch_changes(
+    request: Request,
+    paths: List[str] = Query(default=[]),
+    cursor: str = Query(default=""),
+    timeout: float = Query(default=25, ge=0, le=60)
+):
+    """
+    长轮询目录变化。paths 是客户端正在浏览的目录（每次请求同时续期对它们的监视），
+    cursor 是上次返回的游标；返回游标之后这些目录里的 created / deleted / modified / renamed 事件，
+    没有事件时最多等待 timeout 秒。reset 为 true 表示中间的事件已丢失，stale 是刚开始监视的目录，
+    客户端都应重新确认这些目录的列表（带 ETag，没变化时很便宜）。
+    """
+    verify_request(request)
+    feed = get_change_feed(get_settings())
+    since, missing = feed.subscribe(paths)
+    seq = feed.parse_cursor(cursor)
+    if seq is None:
+        # 首次订阅或服务端已重启：从现在开始记录，之前的状态由客户端自己确认
+        return {"cursor": feed.cursor(), "events": [], "reset": True, "stale": [], "missing": missing}
+
+    stale = [rel for rel, started in since.items() if started > seq]
+    deadline = time.monotonic() + timeout
+    while True:
+        events, reset, current = feed.since(seq, since)
+        remaining = deadline - time.monotonic()
+        if events or reset or stale or missing or remaining <= 0:
+            break
+        await feed.wait(current, remaining)
+    return {"cursor": f"{feed.id}:{current}", "events": events, "reset": reset,
+            "stale": stale, "missing": missing}
+
+class StatRequest(BaseModel):
+    paths: List[str]
+
+@router.post("/stat")
+def stat_files(data: StatRequest, request: Request):
+    verify_request(request)
+    settings = get_settings()
+    with span("traverse"):
+        return stat_paths(settings["share_path"], data.paths[:1000])
+
+@router.get("/hash")
+def hash_file(
+    request: Request,
+    path: str = Query(...),
+    piece_size: int = Query(default=DEFAULT_PIECE_SIZE, ge=MIN_PIECE_SIZE, le=MAX_PIECE_SIZE),
+    quick: bool = Query(default=False)
+):
+    """
+    返回文件的 sha256 和分片哈希，多源下载据此识别相同文件并校验每个分片。
+    quick=1 且尚未缓存完整哈希时只返回大小和首尾分片的哈希，不读完整个文件
+    """
+    verify_request(request)
+    settings = get_settings()
+    root = settings["share_path"]
+    abs_path = os.path.abspath(os.path.join(root, path))
+
+    if not abs_path.startswith(os.path.abspath(root)):
+        raise HTTPException(403, detail="非法路径")
+    if not os.path.isfile(abs_path):
+        raise HTTPException(404, detail="文件不存在")
+
+    digest = quick_digest(abs_path, piece_size) if quick else file_digest(abs_path, piece_size)
+    return {"path": path, **digest}
+
+@router.get("/locate")
+def locate_file(
+    request: Request,
+    sha256: str = Query(...),
+    size: int = Query(..., ge=0),
+    name: str = Query(default="")
+):
+    """在本机共享目录中查找内容相同的文件"""
+    verify_request(request)
+    settings = get_settings()
+    rel_path = locate(settings["share_path"], sha256, size, name)
+    if rel_path is None:
+        raise HTTPException(404, detail="未找到相同文件")
+    return {"path": rel_path}
+
+@router.get("/preview")
+async def preview_file(
+    request: Request,
+    path: str = Query(...),
+    kind: str = Query(default="auto"),
+    size: int = Query(default=0, ge=0),
+    wait: float = Query(default=5, ge=0, le=30),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    文件预览：kind 为 thumb（JPEG 缩略图，size 为长边像素）、text（开头 size KB 的文本）、
+    archive（压缩包目录）、media（图片/音视频的基本信息）或 auto（按扩展名选择）。
+    预览在后台生成并缓存；wait 秒内没生成完返回 202，客户端稍后重试同一请求即可。
+    """
+    verify_request(request)
+    ip = request.client.host
+    if kind not in KINDS:
+        raise HTTPException(400, detail="不支持的预览类型")
+
+    settings = get_settings()
+    root = settings["share_path"]
+    abs_path = os.path.abspath(os.path.join(root, path))
+    if not abs_path.startswith(os.path.abspath(root)):
+        raise HTTPException(403, detail="非法路径")
+    if not os.path.isfile(abs_path):
+        raise HTTPException(404, detail="文件不存在")
+
+    if kind == "auto":
+        kind = preview_kind(abs_path)
+    size = normalize_size(kind, size)
+    key, future = get_preview_cache(settings).request(abs_path, os.stat(abs_path), kind, size)
+    headers = {"ETag": f'"{key}"', "X-Preview-Kind": kind, "Cache-Control": "private, max-age=3600"}
+    if if_none_match and headers["ETag"] in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        # shield：等待超时不取消生成，下一次请求直接拿到结果
+        result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), wait)
+    except asyncio.TimeoutError:
+        return JSONResponse({"state": "pending"}, status_code=202, headers={"Retry-After": "1"})
+
+    if isinstance(result, dict) and "error" in result:
+        log_access(ip, "PREVIEW", path, False)
+        raise HTTPException(415, detail=result["error"])
+    log_access(ip, "PREVIEW", path, True)
+    if isinstance(result, bytes):
+        return Response(result, media_type="image/jpeg", headers=headers)
+    return JSONResponse(result, headers=headers)
+
+def content_disposition(filename):
+    """非 ASCII 文件名按 RFC 5987 编码，否则响应头无法编码"""
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quoted}"
+
+def open_range_start(range_header):
+    """没有 Range 时返回 0，“bytes=N-” 返回 N；带结束位置的区间返回 None（走普通下载）"""
+    if not range_header:
+        return 0
+    try:
+        unit, range_str = range_header.strip().split("=")
+        start_str, end_str = range_str.split("-")
+        return int(start_str or 0) if unit == "bytes" and not end_str else None
+    except ValueError:
+        return None
 
 @router.get("/download")
 def download_file(
     request: Request,
     path: str = Query(...),
-    range: Optional[str] = Header(None)
+    range: Optional[str] = Header(None),
+    x_accept_sparse: Optional[str] = Header(None),
+    x_accept_compression: Optional[str] = Header(None)
 ):
     ip = request.client.host
     action = "DOWNLOAD"
@@ -136,46 +420,68 @@ def download_file(
             log_access(ip, action, path, success=False)
             raise HTTPException(404, detail="文件不存在")
 
-        file_size = os.path.getsize(abs_path)
+        st = os.stat(abs_path)
+        file_size = st.st_size
+
+        # 客户端支持稀疏模式且文件大部分是空洞时，只发送有数据的区段和空洞表
+        if x_accept_sparse and is_sparse(st):
+            offset = open_range_start(range)
+            if offset is not None and offset < file_size:
+                length, body = sparse_stream(abs_path, file_size, offset)
+                log_access(ip, "DOWNLOAD_SPARSE", path, success=True)
+                body = track(settings, body, ip, "download", path, range_start=offset or None,
+                             file_size=file_size, compression="sparse")
+                return StreamingResponse(body, media_type=SPARSE_MEDIA_TYPE, headers={
+                    "Content-Length": str(length),
+                    "X-Sparse-Size": str(file_size),
+                    "Content-Disposition": content_disposition(os.path.basename(abs_path))
+                })
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            "Content-Disposition": content_disposition(os.path.basename(abs_path))
+        }
+        # 整个文件和 Range 请求都经过热文件块缓存，多人同时下载同一文件时只读一次磁盘
+        cache = get_block_cache(settings)
 
         if not range:
             log_access(ip, action, path, success=True)
-            return FileResponse(
-                abs_path,
-                filename=os.path.basename(abs_path),
-                media_type="application/octet-stream"
-            )
+            # 慢速链路上的客户端会请求压缩；压缩后长度未知，原始大小放在 X-Decoded-Length
+            if x_accept_compression == "gzip" and is_compressible(abs_path, file_size):
+                headers["Content-Encoding"] = "gzip"
+                headers["X-Decoded-Length"] = str(file_size)
+                body = track(settings, gzip_stream(cache.read_range(abs_path, st, 0, file_size - 1)),
+                             ip, "download", path, file_size=file_size, compression="gzip")
+                return StreamingResponse(body, headers=headers, media_type="application/octet-stream")
+            headers["Content-Length"] = str(file_size)
+            body = track(settings, cache.read_range(abs_path, st, 0, file_size - 1),
+                         ip, "download", path, file_size=file_size)
+            return StreamingResponse(body, headers=headers, media_type="application/octet-stream")
 
         # ✅ 解析 Range: bytes=xxx-yyy
         try:
             unit, range_str = range.strip().split("=")
             start_str, end_str = range_str.split("-")
             start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
+            end = min(int(end_str), file_size - 1) if end_str else file_size - 1
         except Exception:
             log_access(ip, action, path, success=False)
             raise HTTPException(416, detail="无效的 Range 格式")
 
         if start >= file_size:
             log_access(ip, action, path, success=False)
-            raise HTTPException(416, detail="起始位置超过文件大小")
+            # 带上文件大小，续传方据此判断本地文件是否已经完整
+            raise HTTPException(416, detail="起始位置超过文件大小", headers={"Content-Range": f"bytes */{file_size}"})
 
         chunk_size = end - start + 1
-
-        def file_stream():
-            with open(abs_path, "rb") as f:
-                f.seek(start)
-                yield f.read(chunk_size)
-
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(chunk_size),
-            "Content-Disposition": f'attachment; filename="{os.path.basename(abs_path)}"'
-        }
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(chunk_size)
 
         log_access(ip, action, path, success=True)
-        return StreamingResponse(file_stream(), status_code=206, headers=headers, media_type="application/octet-stream")
+        body = track(settings, cache.read_range(abs_path, st, start, end), ip, "download", path,
+                     range_start=start, range_end=end, file_size=file_size)
+        return StreamingResponse(body, status_code=206, headers=headers, media_type="application/octet-stream")
 
     except Exception as e:
         # 如果上面忘了记录，这里兜底一次（避免漏掉）
@@ -0,0 +1,16 @@
+# backend/api/outbox.py
+
+from fastapi import APIRouter, Request
+from backend.api.profiling import require_local
+from backend.core import outbox
+
+router = APIRouter()
+
+@router.get("/outbox")
+def outbox_status(request: Request):
+    """发件箱的监视状态、待发送文件数和最近的通知记录（仅限本机访问）"""
+    require_local(request)
+    service = outbox.outbox_service
+    if service is None:
+        return {"watching": False, "backend": None, "outboxes": []}
+    return service.status()
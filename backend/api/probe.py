@@ -0,0 +1,38 @@
+# backend/api/probe.py
+# 链路探测：客户端用空响应测往返时间，用一段不可压缩的数据测吞吐，据此为每台设备调整传输参数
+
+import os
+from fastapi import APIRouter, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from backend.core.security import verify_request
+
+router = APIRouter()
+
+PROBE_BLOCK = 256 * 1024            # 重复发送的随机数据块
+MAX_PROBE_SIZE = 16 * 1024 * 1024   # 单次探测最多返回的字节数
+
+_block = None
+
+def _probe_block():
+    global _block
+    if _block is None:
+        _block = os.urandom(PROBE_BLOCK)  # 随机数据不可压缩，测到的是真实线路吞吐
+    return _block
+
+@router.get("/probe")
+def probe(request: Request, size: int = Query(default=0, ge=0, le=MAX_PROBE_SIZE)):
+    """返回 size 字节的随机数据；size 为 0 时只返回响应头，用于测量往返时间"""
+    verify_request(request)
+    headers = {"Cache-Control": "no-store", "Content-Length": str(size)}
+    if not size:
+        return Response(status_code=200, headers=headers)
+
+    def body():
+        block = _probe_block()
+        remaining = size
+        while remaining:
+            n = min(remaining, len(block))
+            yield block[:n] if n < len(block) else block
+            remaining -= n
+
+    return StreamingResponse(body(), media_type="application/octet-stream", headers=headers)
@@ -0,0 +1,42 @@
+# backend/api/profiling.py
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import List
+from pydantic import BaseModel
+from backend.core.request_profile import request_profiler
+
+router = APIRouter()
+
+def require_local(request: Request):
+    if request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="该接口仅限本机访问")
+
+class ProfileConfig(BaseModel):
+    enabled: bool
+    sample_rate: float = 1.0   # 采样比例 0~1
+    routes: List[str] = []     # 只分析这些路径前缀，留空表示全部
+
+@router.get("/profile")
+def profile_status(request: Request):
+    """当前配置和各路由的阶段耗时汇总"""
+    require_local(request)
+    return request_profiler.status()
+
+@router.post("/profile")
+def configure_profile(data: ProfileConfig, request: Request):
+    require_local(request)
+    request_profiler.configure(data.enabled, data.sample_rate, data.routes)
+    return request_profiler.status()
+
+@router.get("/profile/stacks", response_class=PlainTextResponse)
+def profile_stacks(request: Request):
+    """折叠调用栈（微秒），可直接交给 flamegraph.pl 或 speedscope"""
+    require_local(request)
+    return request_profiler.collapsed()
+
+@router.delete("/profile")
+def reset_profile(request: Request):
+    require_local(request)
+    request_profiler.reset()
+    return request_profiler.status()
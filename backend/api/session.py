@@ -0,0 +1,225 @@
+# backend/api/session.py
+# 每个对端一条持久 WebSocket 会话：列目录、元数据、剪贴板和小文件内容复用同一条连接，
+# 省去大量小请求各自的 HTTPS 往返。大文件仍走 /api/files/download 的 Range 流。
+#
+# 二进制帧：1 字节类型 + 4 字节流 ID（大端）+ 负载
+#   REQUEST  客户端 -> 服务端  JSON {"op": ..., 参数..., "window": 初始窗口}
+#   RESPONSE 服务端 -> 客户端  JSON 结果；read 操作之后还会跟 DATA 帧
+#   DATA     服务端 -> 客户端  文件内容，受流控窗口限制
+#   END      服务端 -> 客户端  read 数据结束
+#   ERROR    服务端 -> 客户端  JSON {"status", "detail"}
+#   CREDIT   客户端 -> 服务端  4 字节，增加该流的发送窗口
+#   CANCEL   客户端 -> 服务端  放弃该流
+
+import asyncio
+import json
+import os
+import struct
+import time
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Response
+from starlette.concurrency import run_in_threadpool
+from backend.config import get_settings
+from backend.core.security import verify_request, bind_session
+from backend.core.logger import log_access
+from backend.core.block_cache import get_block_cache
+from backend.core.transfer_history import get_transfer_history, COMPLETED, ABORTED
+from backend.api import files, clipboard, devices
+
+router = APIRouter()
+
+FRAME = struct.Struct(">BI")
+CREDIT = struct.Struct(">I")
+T_REQUEST, T_RESPONSE, T_DATA, T_END, T_ERROR, T_CREDIT, T_CANCEL = range(1, 8)
+
+SMALL_FILE_MAX = 4 * 1024 * 1024   # 超过该大小的文件请客户端改用 HTTP Range
+DATA_CHUNK = 256 * 1024
+DEFAULT_WINDOW = 1024 * 1024
+MAX_STREAMS = 64                   # 每个会话同时处理的请求数
+
+
+def _list(ws, args):
+    response = Response()
+    entries = files.list_files(
+        request=ws, response=response, path=args.get("path", ""), offset=args.get("offset", 0),
+        limit=args.get("limit"), sort=args.get("sort", "name"), desc=args.get("desc", False),
+        show_hidden=args.get("show_hidden", True), q=args.get("q", ""), fields=args.get("fields", "size"),
+        if_none_match=args.get("etag"))
+    if isinstance(entries, Response):  # 304：客户端缓存仍然有效
+        return {"not_modified": True, "etag": entries.headers["ETag"],
+                "total": int(entries.headers["X-Total-Count"])}
+    return {"entries": entries, "total": int(response.headers.get("X-Total-Count", len(entries))),
+            "etag": response.headers.get("ETag")}
+
+
+def _hash(ws, args):
+    # 直接调用时参数默认值是 Query(...) 对象（恒为真），必须显式传入；分片大小按 HTTP 接口的范围校验
+    try:
+        piece_size = int(args.get("piece_size") or files.DEFAULT_PIECE_SIZE)
+    except (TypeError, ValueError):
+        raise HTTPException(400, detail="无效的分片大小")
+    piece_size = min(max(piece_size, files.MIN_PIECE_SIZE), files.MAX_PIECE_SIZE)
+    return files.hash_file(ws, args["path"], piece_size, quick=bool(args.get("quick")))
+
+
+# 直接复用 HTTP 接口的实现（路径检查、日志都一致；鉴权沿用会话建立时的结果）
+OPS = {
+    "ping": lambda ws, args: {"time": time.time()},
+    "list": _list,
+    "stat": lambda ws, args: files.stat_files(files.StatRequest(paths=args.get("paths", [])), ws),
+    "hash": _hash,
+    "devices": lambda ws, args: devices.list_devices(ws),
+    "clipboard_get": lambda ws, args: clipboard.get_clipboard(ws),
+    "clipboard_set": lambda ws, args: clipboard.set_clipboard(clipboard.ClipboardData(content=args.get("content", "")), ws),
+}
+
+
+def _open_small_file(ws, path):
+    """（线程池）校验并读出小文件，返回 (元数据, 内容)"""
+    verify_request(ws)
+    settings = get_settings()
+    root = settings["share_path"]
+    abs_path = os.path.abspath(os.path.join(root, path))
+    if not abs_path.startswith(os.path.abspath(root)):
+        raise HTTPException(403, detail="非法路径")
+    if not os.path.isfile(abs_path):
+        raise HTTPException(404, detail="文件不存在")
+    st = os.stat(abs_path)
+    if st.st_size > SMALL_FILE_MAX:
+        raise HTTPException(413, detail="文件过大，请使用 HTTP 下载")
+    data = b"".join(get_block_cache(settings).read_range(abs_path, st, 0, st.st_size - 1)) if st.st_size else b""
+    log_access(ws.client.host, "DOWNLOAD_WS", path, True)
+    return {"size": len(data), "mtime": st.st_mtime}, data
+
+
+class _Stream:
+    def __init__(self, window):
+        self.credit = window
+        self.sent = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+
+class MuxSession:
+    def __init__(self, ws):
+        self.ws = ws
+        self.streams = {}
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, frame_type, stream_id, payload=b""):
+        async with self.send_lock:
+            await self.ws.send_bytes(FRAME.pack(frame_type, stream_id) + payload)
+
+    async def send_json(self, frame_type, stream_id, obj):
+        await self.send(frame_type, stream_id, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.ws.receive_bytes()
+                if len(message) < FRAME.size:
+                    continue
+                frame_type, stream_id = FRAME.unpack_from(message)
+                payload = message[FRAME.size:]
+                if frame_type == T_REQUEST:
+                    self.start(stream_id, payload)
+                elif frame_type == T_CREDIT and stream_id in self.streams:
+                    if len(payload) != CREDIT.size:
+                        # 格式错误的帧只结束这个流，不影响会话里的其它流
+                        self.streams[stream_id].task.cancel()
+                        asyncio.ensure_future(self._send_error(stream_id, 400, "CREDIT 帧长度错误"))
+                        continue
+                    stream = self.streams[stream_id]
+                    stream.credit += CREDIT.unpack(payload)[0]
+                    stream.wakeup.set()
+                elif frame_type == T_CANCEL and stream_id in self.streams:
+                    self.streams[stream_id].task.cancel()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for stream in list(self.streams.values()):
+                stream.task.cancel()
+
+    def start(self, stream_id, payload):
+        try:
+            request = json.loads(payload.decode("utf-8"))
+        except ValueError:
+            request = None
+        if stream_id in self.streams or len(self.streams) >= MAX_STREAMS or not isinstance(request, dict):
+            status = 400 if not isinstance(request, dict) else 429
+            asyncio.ensure_future(self.send_json(T_ERROR, stream_id, {"status": status, "detail": "请求无效或并发过多"}))
+            return
+        try:
+            window = int(request.get("window") or DEFAULT_WINDOW)
+        except (TypeError, ValueError):
+            asyncio.ensure_future(self._send_error(stream_id, 400, "无效的窗口大小"))
+            return
+        stream = _Stream(window)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.ensure_future(self.handle(stream_id, stream, request))
+
+    async def handle(self, stream_id, stream, request):
+        op = request.get("op")
+        recorder = None
+        try:
+            if op == "read":
+                path = request.get("path", "")
+                meta, data = await run_in_threadpool(_open_small_file, self.ws, path)
+                history = get_transfer_history(get_settings())
+                if history is not None:
+                    recorder = history.recorder(self.ws.client.host, "ws", path, file_size=len(data))
+                await self.send_json(T_RESPONSE, stream_id, meta)
+                await self.send_data(stream_id, stream, data)
+                await self.send(T_END, stream_id)
+                if recorder is not None:
+                    recorder.sent(stream.sent)
+                    recorder.finish(COMPLETED)
+                    recorder = None
+            elif op in OPS:
+                result = await run_in_threadpool(OPS[op], self.ws, request)
+                await self.send_json(T_RESPONSE, stream_id, result)
+            else:
+                raise HTTPException(400, detail=f"未知操作: {op}")
+        except asyncio.CancelledError:
+            pass
+        except HTTPException as e:
+            await self._send_error(stream_id, e.status_code, e.detail)
+        except Exception as e:
+            await self._send_error(stream_id, 500, str(e))
+        finally:
+            self.streams.pop(stream_id, None)
+            if recorder is not None:  # 对端取消或连接断开，数据没有发完
+                recorder.sent(stream.sent)
+                recorder.finish(ABORTED)
+
+    async def _send_error(self, stream_id, status, detail):
+        try:
+            await self.send_json(T_ERROR, stream_id, {"status": status, "detail": detail})
+        except Exception:
+            pass  # 连接已断开
+
+    async def send_data(self, stream_id, stream, data):
+        """按对端授予的窗口发送，窗口用完就等 CREDIT 帧"""
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            while stream.credit <= 0:
+                stream.wakeup.clear()
+                await stream.wakeup.wait()
+            n = min(DATA_CHUNK, stream.credit, len(view) - offset)
+            await self.send(T_DATA, stream_id, bytes(view[offset:offset + n]))
+            stream.credit -= n
+            stream.sent += n
+            offset += n
+
+
+@router.websocket("/session")
+async def session(websocket: WebSocket):
+    try:
+        verify_request(websocket)
+    except HTTPException:
+        await websocket.close(code=1008)  # 鉴权失败
+        return
+    bind_session(websocket)  # 只在握手时认证一次，会话内的操作不再校验令牌
+    await websocket.accept()
+    await MuxSession(websocket).run()
@@ -0,0 +1,139 @@
+# backend/api/transfers.py
+
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List
+from pydantic import BaseModel
+from backend.config import get_settings
+from backend.core.security import verify_request
+from backend.core.logger import log_access
+from backend.core.transfer_jobs import transfer_jobs
+from backend.core.transfer_history import get_transfer_history
+from backend.core.device_manager import device_manager
+from backend.api.profiling import require_local
+from urllib.parse import urlsplit
+import json
+import os
+import time
+
+router = APIRouter()
+
+class PullRequest(BaseModel):
+    source_url: str            # 源设备地址，如 https://192.168.1.20:8010，须是已发现的设备
+    source_token: str          # 源设备签发给本机的只读授权令牌（/api/auth/grant）
+    paths: List[str]           # 源设备上的相对路径（文件或文件夹）
+    dest: str = ""             # 保存到本机共享目录下的相对路径
+
+def known_source(source_url):
+    """
+    只允许从已发现的设备或 pull_sources 中配置的地址拉取，
+    防止借本机去访问任意地址、把任意内容写进共享目录
+    """
+    try:
+        parts = urlsplit(source_url)
+        parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("https", "http") or not parts.hostname or parts.username or parts.password \
+            or parts.path.strip("/") or parts.query or parts.fragment:
+        return False
+    if device_manager.find_by_ip(parts.hostname):
+        return True
+    base = f"{parts.scheme}://{parts.netloc}".lower()
+    return any(base == s.rstrip("/").lower() for s in get_settings().get("pull_sources", []))
+
+@router.post("/pull")
+def create_pull(data: PullRequest, request: Request):
+    """让本机直接从另一台设备拉取文件，客户端只需查询进度"""
+    verify_request(request)
+    ip = request.client.host
+
+    if not known_source(data.source_url):
+        log_access(ip, "PULL", data.source_url, False)
+        raise HTTPException(403, detail="源设备不在已发现的设备中")
+    paths = [p.strip() for p in data.paths if p.strip()]
+    if not paths:
+        raise HTTPException(400, detail="缺少有效路径")
+
+    root = os.path.abspath(get_settings()["share_path"])
+    dest_dir = os.path.abspath(os.path.join(root, data.dest))
+    if not dest_dir.startswith(root):
+        raise HTTPException(403, detail="非法路径")
+
+    job = transfer_jobs.create(data.source_url.rstrip("/"), data.source_token, paths, dest_dir, ip)
+    log_access(ip, "PULL", f"{data.source_url} {','.join(paths)} -> {data.dest or '/'}", True)
+    return job.status()
+
+# 传输历史查询，仅限本机；必须定义在 /{job_id} 之前
+def history_store():
+    history = get_transfer_history(get_settings())
+    if history is None:
+        raise HTTPException(404, detail="传输历史未开启")
+    history.flush()
+    return history
+
+@router.get("/history")
+def transfer_history(
+    request: Request,
+    order: str = Query(default="slowest"),
+    limit: int = Query(default=20, ge=1, le=1000),
+    hours: float = Query(default=24, gt=0),
+    client: str = Query(default=""),
+    outcome: str = Query(default="")
+):
+    """最慢（吞吐最低）或最大（发出字节最多）的传输，以及这段时间的汇总"""
+    require_local(request)
+    if order not in ("slowest", "largest"):
+        raise HTTPException(400, detail="order 只能是 slowest 或 largest")
+    history = history_store()
+    since = time.time() - hours * 3600
+    return {"summary": history.summary(since),
+            "transfers": history.top(order, limit, since, client, outcome)}
+
+@router.get("/history/throughput")
+def transfer_throughput(
+    request: Request,
+    hours: float = Query(default=24, gt=0),
+    bucket: int = Query(default=300, ge=10),
+    client: str = Query(default="")
+):
+    """按时间分桶的出口流量和吞吐"""
+    require_local(request)
+    history = history_store()
+    return {"bucket": bucket, "series": history.throughput(time.time() - hours * 3600, bucket, client)}
+
+def get_pull_job(job_id):
+    job = transfer_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="传输任务不存在")
+    return job
+
+@router.get("/{job_id}")
+def pull_status(job_id: str, request: Request):
+    verify_request(request)
+    return get_pull_job(job_id).status()
+
+@router.get("/{job_id}/events")
+def pull_events(job_id: str, request: Request):
+    """以 Server-Sent Events 推送进度，直到任务结束"""
+    verify_request(request)
+    job = get_pull_job(job_id)
+
+    def event_stream():
+        while True:
+            status = job.status()
+            yield f"data: {json.dumps(status)}\n\n"
+            if status["state"] not in ("listing", "running"):
+                return
+            time.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@router.delete("/{job_id}")
+def cancel_pull(job_id: str, request: Request):
+    verify_request(request)
+    job = transfer_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, detail="传输任务不存在")
+    log_access(request.client.host, "PULL_CANCEL", job_id, True)
+    return job.status()
@@ -1,8 +1,26 @@
 import os
-import subprocess
+import json
 import socket
 import datetime
-from OpenSSL import crypto
+import ipaddress
+import ssl
+import threading
+
+# pyOpenSSL 的底层实现就是 cryptography，这里直接使用它来生成 ECDSA 证书，
+# 不再依赖外部的 openssl 可执行文件
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+CERT_VALID_DAYS = 365
+KEY_TYPE = "ec-p256"
+
+# 只保留 ECDHE + AEAD 套件，ECDSA 证书握手比 RSA-2048 便宜得多
+TLS_CIPHERS = "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-ECDSA-AES256-GCM-SHA384"
+
+_meta_cache = {}  # cert_path -> 元数据（进程内缓存，避免重复解析）
+
 
 def get_local_ip():
     try:
@@ -14,39 +32,262 @@ def get_local_ip():
     except Exception:
         return "127.0.0.1"
 
-def cert_is_valid(cert_path: str, valid_days=7) -> bool:
+
+def get_local_names():
+    """收集本机所有主机名和接口地址，用作证书的 SAN"""
+    hostnames = {"localhost"}
+    ips = {"127.0.0.1", "::1", get_local_ip()}
+
+    hostname = socket.gethostname()
+    if hostname:
+        hostnames.add(hostname)
+        hostnames.add(f"{hostname.split('.')[0]}.local")
+    try:
+        fqdn = socket.getfqdn()
+        if fqdn:
+            hostnames.add(fqdn)
+    except Exception:
+        pass
+
+    try:
+        for info in socket.getaddrinfo(hostname, None):
+            ips.add(info[4][0].split("%")[0])
+    except Exception:
+        pass
+
+    valid_ips = set()
+    for ip in ips:
+        try:
+            valid_ips.add(str(ipaddress.ip_address(ip)))
+        except ValueError:
+            continue
+    return sorted(hostnames), sorted(valid_ips)
+
+
+def _meta_path(cert_path):
+    return f"{cert_path}.meta.json"
+
+
+def _load_meta(cert_path):
+    """读取证书的有效期元数据，证书文件变化时重新解析 PEM"""
+    try:
+        st = os.stat(cert_path)
+    except OSError:
+        return None
+    stamp = [st.st_mtime_ns, st.st_size]
+
+    meta = _meta_cache.get(cert_path)
+    if meta and meta.get("stamp") == stamp:
+        return meta
+
+    try:
+        with open(_meta_path(cert_path), "r") as f:
+            meta = json.load(f)
+        if meta.get("stamp") == stamp and "managed" in meta:
+            _meta_cache[cert_path] = meta
+            return meta
+    except Exception:
+        pass
+
+    # 元数据缺失或过期，解析一次 PEM 并写回
+    with open(cert_path, "rb") as f:
+        cert = x509.load_pem_x509_certificate(f.read())
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        names = [str(v) for v in san.get_values_for_type(x509.DNSName)]
+        names += [str(v) for v in san.get_values_for_type(x509.IPAddress)]
+    except x509.ExtensionNotFound:
+        names = []
+    key_type = KEY_TYPE if isinstance(cert.public_key(), ec.EllipticCurvePublicKey) else "other"
+
+    not_after = getattr(cert, "not_valid_after_utc", None) or cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+
+    meta = {
+        "stamp": stamp,
+        "not_after": not_after.timestamp(),
+        "sans": sorted(names),
+        "key_type": key_type,
+        "managed": _looks_generated(cert),
+    }
+    _save_meta(cert_path, meta)
+    return meta
+
+
+def _looks_generated(cert):
+    """
+    没有元数据标记时，按 FlyDrop 签发证书的特征识别：自签名，主题只有一个 CN，且 CN 是 IP 地址
+    （早期版本用 openssl 生成的 RSA 证书和现在的 ECDSA 证书都是这样）
+    """
+    if cert.issuer != cert.subject or len(cert.subject) != 1:
+        return False
+    common_names = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    if not common_names:
+        return False
+    try:
+        ipaddress.ip_address(common_names[0].value)
+        return True
+    except ValueError:
+        return False
+
+
+def cert_is_managed(cert_path):
+    """证书是否由 FlyDrop 自己签发；用户自备的证书不能被覆盖"""
+    try:
+        if os.path.getsize(cert_path) == 0:
+            return True  # 上次生成中途退出留下的空文件
+        meta = _load_meta(cert_path)
+    except Exception as e:
+        print(f"⚠️ 证书读取失败: {e}")
+        return False
+    return bool(meta and meta.get("managed"))
+
+
+def _save_meta(cert_path, meta):
+    _meta_cache[cert_path] = meta
+    try:
+        with open(_meta_path(cert_path), "w") as f:
+            json.dump(meta, f, indent=2)
+    except Exception as e:
+        print(f"⚠️ 证书元数据写入失败: {e}")
+
+
+def cert_is_valid(cert_path: str, valid_days=7, required_names=None, key_types=(KEY_TYPE,)) -> bool:
     if not os.path.exists(cert_path):
         return False
     try:
-        with open(cert_path, "rb") as f:
-            cert_data = f.read()
-        cert = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data)
-        expires = datetime.datetime.strptime(cert.get_notAfter().decode('ascii'), "%Y%m%d%H%M%SZ")
-        remaining = (expires - datetime.datetime.utcnow()).days
-        return remaining >= valid_days
+        meta = _load_meta(cert_path)
+        if not meta or (key_types and meta.get("key_type") not in key_types):
+            return False
+        remaining = meta["not_after"] - datetime.datetime.now(datetime.timezone.utc).timestamp()
+        if remaining < valid_days * 86400:
+            return False
+        # 网卡地址或主机名变了也需要重新签发
+        if required_names and not set(required_names).issubset(meta.get("sans", [])):
+            return False
+        return True
     except Exception as e:
         print(f"⚠️ 证书读取失败: {e}")
         return False
 
+
+def _write_file(path, data, mode):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def key_matches_cert(cert_path, key_path):
+    """私钥和证书是否成对（写入中途崩溃可能留下新私钥配旧证书）"""
+    try:
+        with open(cert_path, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        with open(key_path, "rb") as f:
+            key = serialization.load_pem_private_key(f.read(), password=None)
+    except Exception:
+        return False
+    der = serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    return key.public_key().public_bytes(*der) == cert.public_key().public_bytes(*der)
+
+
+def generate_cert(cert_path, key_path, hostnames, ips):
+    """在进程内生成 ECDSA P-256 自签名证书"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    primary = ips[0] if ips else "localhost"
+    for ip in ips:
+        if ip not in ("127.0.0.1", "::1"):
+            primary = ip
+            break
+
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, primary)])
+    san = [x509.DNSName(h) for h in hostnames] + [x509.IPAddress(ipaddress.ip_address(ip)) for ip in ips]
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=CERT_VALID_DAYS))
+        .add_extension(x509.SubjectAlternativeName(san), critical=False)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    # 先把两份文件完整写到临时文件，再依次改名（证书最后），旧的一对在新文件落盘前一直可用。
+    # 两次改名之间崩溃会留下不匹配的一对，下次启动时 ensure_https_cert 会发现并重新签发
+    key_tmp, cert_tmp = f"{key_path}.tmp", f"{cert_path}.tmp"
+    _write_file(key_tmp, key_pem, 0o600)
+    _write_file(cert_tmp, cert.public_bytes(serialization.Encoding.PEM), 0o644)
+    os.replace(key_tmp, key_path)
+    os.replace(cert_tmp, cert_path)
+
+    st = os.stat(cert_path)
+    _save_meta(cert_path, {
+        "stamp": [st.st_mtime_ns, st.st_size],
+        "not_after": (now + datetime.timedelta(days=CERT_VALID_DAYS)).timestamp(),
+        "sans": sorted(hostnames + ips),
+        "key_type": KEY_TYPE,
+        "managed": True,
+    })
+
+
 def ensure_https_cert(cert_path="cert.pem", key_path="key.pem"):
-    if cert_is_valid(cert_path) and cert_is_valid(cert_path,7):
-        return  # 已存在有效证书
+    if os.path.exists(cert_path) and not cert_is_managed(cert_path):
+        # 用户自备的证书：原样使用，即使快过期或不是 ECDSA 也不替换，只提示
+        if not os.path.exists(key_path):
+            print(f"❌ 找到证书 {cert_path}，但缺少私钥 {key_path}")
+            exit(1)
+        if not cert_is_valid(cert_path, 7, key_types=None):
+            print(f"⚠️ 证书 {cert_path} 不是 FlyDrop 签发的，将原样使用；它已过期或即将过期，请自行更新")
+        return
 
-    ip = get_local_ip()
-    print(f"🔐 正在为 {ip} 生成新的 HTTPS 自签名证书...")
+    hostnames, ips = get_local_names()
+    paired = os.path.exists(key_path) and key_matches_cert(cert_path, key_path)
+    if cert_is_valid(cert_path, 7, hostnames + ips) and paired:
+        return  # 已存在有效证书
 
-    subj = f"/CN={ip}"
-    cmd = [
-        "openssl", "req", "-x509", "-newkey", "rsa:2048",
-        "-keyout", key_path,
-        "-out", cert_path,
-        "-days", "365", "-nodes",
-        "-subj", subj
-    ]
+    if cert_is_valid(cert_path, 7) and paired:
+        # 证书仍可用，只是本机地址变了：先用旧证书启动，后台重新签发，下次启动生效
+        print("🔁 本机地址已变化，将在后台重新签发证书（下次启动生效）")
+        threading.Thread(target=generate_cert, args=(cert_path, key_path, hostnames, ips), daemon=True).start()
+        return
 
+    print(f"🔐 正在为 {', '.join(ips)} 生成新的 HTTPS 自签名证书 (ECDSA P-256)...")
     try:
-        subprocess.run(cmd, check=True)
-        print(f"✅ 证书生成成功: {cert_path} (有效期 365 天)")
+        generate_cert(cert_path, key_path, hostnames, ips)
+        print(f"✅ 证书生成成功: {cert_path} (有效期 {CERT_VALID_DAYS} 天)")
     except Exception as e:
         print("❌ 生成证书失败:", e)
-        exit(1)
\ No newline at end of file
+        exit(1)
+
+
+def tls_ciphers_for(cert_path):
+    """ECDSA 证书只开放 ECDSA 套件；用户自备的 RSA 等证书沿用 uvicorn 的默认套件，否则无法握手"""
+    try:
+        meta = _load_meta(cert_path)
+    except Exception:
+        meta = None
+    return TLS_CIPHERS if meta and meta.get("key_type") == KEY_TYPE else "TLSv1"
+
+
+def tune_tls_context(ctx: ssl.SSLContext):
+    """开启会话票据与会话复用，减少重复握手的开销"""
+    if ctx is None:
+        return
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.options &= ~ssl.OP_NO_TICKET  # TLS 1.2 会话票据
+    if hasattr(ctx, "num_tickets"):
+        ctx.num_tickets = 4  # TLS 1.3 每次握手下发的票据数量
+    try:
+        ctx.set_ecdh_curve("prime256v1")
+    except (ValueError, ssl.SSLError):
+        pass
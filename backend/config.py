@@ -1,5 +1,8 @@
 import json
 import os
+import threading
+import uuid
+from backend.core.request_profile import span
 
 CONFIG_PATH = "config.json"
 
@@ -7,31 +10,84 @@ DEFAULTS = {
     "share_path": os.path.expanduser("~/"),
     "port": 8010,
     "device_name": "未命名设备",
+    "device_id": "",                # 首次启动时生成，用于区分同名设备
     "discovery_port": 17257,
     "access_password": "",
-    "allowed_ips": ["127.0.0.1"],
+    "allowed_ips": ["127.0.0.1"],   # 免密码访问的地址或网段（CIDR）
+    "denied_ips": [],               # 禁止访问的地址或网段，比白名单优先
+    "auth_token_ttl": 900,          # 登录换取的会话令牌有效期（秒）
     "https_enabled": True,
     "cert_path": "cert.pem",
-    "key_path": "key.pem"
+    "key_path": "key.pem",
+    "zip_cache_dir": "",            # 打包缓存目录，留空使用系统临时目录
+    "zip_cache_budget_mb": 4096,    # 打包缓存的磁盘预算
+    "read_cache_mb": 256,           # 热文件块缓存的内存预算，0 表示关闭
+    "outboxes": [],                 # 发件箱：[{"path", "peers", "password", "dest"}]，password 是对方的访问密码，见 core/outbox.py
+    "outbox_settle_seconds": 2,     # 文件大小和修改时间保持多久不变才算写完
+    "pull_sources": [],             # 除已发现的设备外，允许 /api/transfers/pull 拉取的源地址，如 "https://10.0.0.5:8010"
+    "preview_cache_dir": "",        # 预览缓存目录，留空使用系统临时目录
+    "preview_cache_budget_mb": 256, # 预览缓存的磁盘预算
+    "preview_workers": 2,           # 后台生成预览的线程数
+    "transfer_history_enabled": True,  # 把每次下载记进本地 SQLite，供 /api/transfers/history 查询
+    "transfer_history_path": "",    # 留空使用 logs/transfers.db
+    "transfer_history_days": 30     # 历史保留天数
 }
 
+_cache = None  # ((mtime_ns, size), 配置)，文件没变化时直接复用
+
+def _stamp():
+    try:
+        st = os.stat(CONFIG_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
 def get_settings():
+    with span("settings"):
+        return _load_settings()
+
+def _load_settings():
+    global _cache
+    stamp = _stamp()
+    if _cache and stamp and _cache[0] == stamp:
+        return dict(_cache[1])
+
     config = {}
-    if os.path.exists(CONFIG_PATH):
+    readable = True
+    if stamp:
         try:
             with open(CONFIG_PATH, "r") as f:
                 config = json.load(f)
         except Exception:
+            readable = False
             print("⚠️ config.json 无法读取，使用默认配置")
     else:
         print("📂 config.json 不存在，将使用默认配置")
 
-    # 合并并写回
-    config = {**DEFAULTS, **config}
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
-    return config
+    # 合并；只有缺少配置项时才写回，避免每次读取都重写文件。读取失败时不写回，以免覆盖用户的配置
+    merged = {**DEFAULTS, **config}
+    if merged != config and readable:
+        _write(merged)
+        stamp = _stamp()
+    _cache = (stamp, merged) if readable else None
+    return dict(merged)
+
+def _write(data):
+    # 先写临时文件再替换，其它线程/进程不会读到写了一半的配置
+    tmp_path = f"{CONFIG_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, CONFIG_PATH)
 
 def save_settings(data):
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(data, f, indent=2)
\ No newline at end of file
+    global _cache
+    _write(data)
+    _cache = None
+
+def get_device_id():
+    """返回本机固定的设备 ID，没有时生成一个并写回配置"""
+    settings = get_settings()
+    if not settings.get("device_id"):
+        settings["device_id"] = uuid.uuid4().hex
+        save_settings(settings)
+    return settings["device_id"]
@@ -0,0 +1,344 @@
+# backend/core/access_policy.py
+# 访问策略：由配置编译一次，之后每个请求只做内存里的查表和一次 HMAC。
+#   - allowed_ips / denied_ips 支持单个地址和 CIDR 网段，按最长前缀匹配
+#   - /api/auth/login 用密码换取短期会话令牌，之后的请求带令牌，密码不再每次发送
+#   - 按客户端 IP 计数，认证失败过多时暂时拒绝该 IP
+#   - 授权令牌：让另一台设备代为拉取指定路径，只能读取这些路径，不必把访问密码交给它
+
+import base64
+import hashlib
+import hmac
+import ipaddress
+import os
+import posixpath
+import threading
+import time
+
+from backend.config import get_settings
+
+REFRESH_INTERVAL = 2        # 每隔多少秒检查一次配置是否变化
+RATE_WINDOW = 60            # 计数窗口（秒）
+MAX_AUTH_FAILURES = 20      # 一个窗口内允许的认证失败次数
+MAX_CLIENTS = 4096          # 计数表和地址匹配缓存的条目上限
+DEFAULT_TOKEN_TTL = 900
+GRANT_IDLE = 300            # 授权令牌闲置多久后失效（秒）；有请求正在进行时不算闲置
+GRANT_MAX_AGE = 86400       # 授权令牌自签发起最长有效期（秒）
+MAX_GRANTS = 4096
+# 授权令牌只能访问的只读接口，且请求的 path 参数必须在授权范围内
+GRANT_ENDPOINTS = ("/api/files/tree", "/api/files/list", "/api/files/download", "/api/files/hash")
+
+# 进程启动时随机生成，重启后旧令牌全部失效
+_PROCESS_SECRET = os.urandom(32)
+
+
+class PrefixTable:
+    """按前缀长度分桶的网段表，查找时从最长前缀开始，命中即返回对应动作"""
+
+    def __init__(self):
+        self.tables = {4: {}, 6: {}}   # IP 版本 -> {前缀长度: {网络号: 动作}}
+        self.lengths = {4: [], 6: []}
+
+    def add(self, cidr, action):
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        bits = network.max_prefixlen
+        buckets = self.tables[network.version]
+        key = int(network.network_address) >> (bits - network.prefixlen)
+        buckets.setdefault(network.prefixlen, {})[key] = action
+        self.lengths[network.version] = sorted(buckets, reverse=True)
+
+    def lookup(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        bits = address.max_prefixlen
+        value = int(address)
+        buckets = self.tables[address.version]
+        for length in self.lengths[address.version]:
+            action = buckets[length].get(value >> (bits - length))
+            if action is not None:
+                return action
+        return None
+
+
+class _Counter:
+    __slots__ = ("window", "requests", "failures")
+
+    def __init__(self, window):
+        self.window = window
+        self.requests = 0
+        self.failures = 0
+
+
+class AccessPolicy:
+    def __init__(self, settings):
+        self.rules = PrefixTable()
+        for cidr in settings.get("allowed_ips", []):
+            self._add_rule(cidr, "allow")
+        for cidr in settings.get("denied_ips", []):
+            self._add_rule(cidr, "deny")   # 同一网段同时出现时拒绝优先
+        password = settings.get("access_password", "")
+        self.password = password.encode("utf-8")
+        self.require_password = bool(password)
+        # 密钥和密码绑定，改密码后旧令牌随之失效
+        self.key = hmac.new(_PROCESS_SECRET, self.password, hashlib.sha256).digest()
+        self.token_ttl = int(settings.get("auth_token_ttl", DEFAULT_TOKEN_TTL))
+        self.decisions = {}       # IP -> 动作（allow / deny / None），避免重复解析地址
+        self.counters = {}        # IP -> _Counter
+        self.grants = {}          # 授权 ID -> {"paths", "created", "used", "idle", "active"}
+        self.lock = threading.Lock()
+
+    def _add_rule(self, cidr, action):
+        try:
+            self.rules.add(cidr, action)
+        except ValueError:
+            print(f"⚠️ 无效的地址规则：{cidr}")
+
+    def rule(self, ip):
+        action = self.decisions.get(ip, "")
+        if action == "":
+            action = self.rules.lookup(ip)
+            if len(self.decisions) >= MAX_CLIENTS:
+                self.decisions.clear()
+            self.decisions[ip] = action
+        return action
+
+    # --- 计数 ---
+    def _counter(self, ip):
+        """调用方持有 self.lock"""
+        window = int(time.monotonic() // RATE_WINDOW)
+        counter = self.counters.get(ip)
+        if counter is None or counter.window != window:
+            if counter is None and len(self.counters) >= MAX_CLIENTS:
+                self.counters = {k: c for k, c in self.counters.items() if c.window == window}
+                if len(self.counters) >= MAX_CLIENTS:
+                    self.counters.clear()
+            counter = self.counters[ip] = _Counter(window)
+        return counter
+
+    def clients(self):
+        with self.lock:
+            return {ip: {"requests": c.requests, "failures": c.failures, "blocked": c.failures >= MAX_AUTH_FAILURES}
+                    for ip, c in self.counters.items()}
+
+    # --- 令牌 ---
+    def _sign(self, payload):
+        signature = hmac.new(self.key, payload.encode("utf-8"), hashlib.sha256).digest()
+        return ".".join(base64.urlsafe_b64encode(part).rstrip(b"=").decode("ascii")
+                        for part in (payload.encode("utf-8"), signature))
+
+    def _unsign(self, token):
+        """签名正确时返回载荷字符串，否则返回 None"""
+        try:
+            payload_b64, signature_b64 = token.split(".")
+            payload = base64.urlsafe_b64decode(payload_b64 + "=" * (-len(payload_b64) % 4))
+            signature = base64.urlsafe_b64decode(signature_b64 + "=" * (-len(signature_b64) % 4))
+            expected = hmac.new(self.key, payload, hashlib.sha256).digest()
+            if not hmac.compare_digest(signature, expected):
+                return None
+            return payload.decode("utf-8")
+        except ValueError:
+            return None
+
+    def issue_token(self, ip):
+        """签发绑定客户端 IP 的会话令牌，返回 (令牌, 有效秒数)"""
+        expires = int(time.time()) + self.token_ttl
+        return self._sign(f"{expires}:{ip}"), self.token_ttl
+
+    def _verify_token(self, token, ip):
+        payload = self._unsign(token)
+        if payload is None:
+            return False
+        try:
+            expires, token_ip = payload.split(":", 1)
+            expires = int(expires)
+        except ValueError:
+            return False
+        return token_ip == ip and expires > time.time()
+
+    # --- 授权令牌 ---
+    def issue_grant(self, ip, paths, idle=GRANT_IDLE):
+        """
+        签发只允许 ip 读取 paths（及其子路径）的授权令牌，返回 (令牌, 闲置有效秒数)。
+        授权范围保存在本机，令牌里只有授权 ID 和 IP；每个请求结束后重新计算闲置时间，
+        请求进行中（例如一次很长的下载）不会因闲置失效
+        """
+        grant_id = os.urandom(12).hex()
+        now = time.time()
+        idle = min(max(int(idle), GRANT_IDLE), GRANT_MAX_AGE)
+        with self.lock:
+            self._expire_grants(now)
+            if len(self.grants) >= MAX_GRANTS:
+                oldest = min(self.grants, key=lambda g: self.grants[g]["used"])
+                del self.grants[oldest]
+            self.grants[grant_id] = {"paths": [_normalize(p) for p in paths], "created": now, "used": now,
+                                     "idle": idle, "active": 0}
+        return self._sign(f"g:{grant_id}:{ip}"), idle
+
+    def revoke_grant(self, token):
+        payload = self._unsign(token)
+        if payload and payload.startswith("g:"):
+            with self.lock:
+                self.grants.pop(payload.split(":", 2)[1], None)
+
+    def _expire_grants(self, now):
+        """调用方持有 self.lock"""
+        for grant_id, grant in list(self.grants.items()):
+            if _grant_expired(grant, now):
+                del self.grants[grant_id]
+
+    def _grant_id(self, token):
+        payload = self._unsign(token)
+        if payload is None or not payload.startswith("g:"):
+            return None
+        return payload.split(":", 2)[1]
+
+    def hold_grant(self, token):
+        """
+        授权令牌的请求开始处理前调用，返回授权 ID（不是有效的授权令牌时返回 None）。
+        请求结束前该授权不会因闲置失效，结束时须调用 release_grant
+        """
+        grant_id = self._grant_id(token)
+        if grant_id is None:
+            return None
+        with self.lock:
+            grant = self.grants.get(grant_id)
+            if grant is None or _grant_expired(grant, time.time()):
+                return None
+            grant["active"] += 1
+        return grant_id
+
+    def release_grant(self, grant_id):
+        """请求（包括流式响应体）结束：从此刻重新计算闲置时间"""
+        with self.lock:
+            grant = self.grants.get(grant_id)
+            if grant is not None:
+                grant["active"] -= 1
+                grant["used"] = time.time()
+
+    def _verify_grant(self, token, ip, resource):
+        endpoint, path = resource
+        if endpoint not in GRANT_ENDPOINTS:
+            return False
+        payload = self._unsign(token)
+        if payload is None or not payload.startswith("g:"):
+            return False
+        _, grant_id, token_ip = payload.split(":", 2)
+        if token_ip != ip:
+            return False
+        now = time.time()
+        with self.lock:
+            grant = self.grants.get(grant_id)
+            if grant is None or _grant_expired(grant, now):
+                return False
+            if not _in_scope(_normalize(path or ""), grant["paths"]):
+                return False
+            grant["used"] = now
+        return True
+
+    def check_password(self, password):
+        return hmac.compare_digest(password.encode("utf-8"), self.password)
+
+    # --- 判定 ---
+    def check(self, ip, authorization, resource=None):
+        """
+        返回 None 表示放行，否则返回 (HTTP 状态码, 错误信息)。
+        resource 为 (接口路径, 请求的 path 参数)，授权令牌据此限定可访问的范围
+        """
+        with self.lock:
+            counter = self._counter(ip)
+            counter.requests += 1
+            blocked = counter.failures >= MAX_AUTH_FAILURES
+
+        action = self.rule(ip)
+        if action == "deny":
+            return 403, f"未授权访问（IP {ip} 已被禁止）"
+        if action == "allow" or not self.require_password:
+            return None  # ✅ 白名单 IP 直接放行
+
+        # 已签发的令牌照常有效；失败过多的 IP 不再校验密码，防止暴力猜测
+        if authorization and authorization.startswith("Bearer "):
+            if self._verify_token(authorization[7:], ip):
+                return None
+            if resource is not None and self._verify_grant(authorization[7:], ip, resource):
+                return None
+        elif authorization and not blocked and self.check_password(authorization):
+            return None  # 兼容直接发送密码的旧客户端
+
+        if blocked:
+            return 429, f"认证失败次数过多，请 {RATE_WINDOW} 秒后再试"
+        self.record_failure(ip)
+        return 403, f"未授权访问（IP {ip} 不在白名单，且密码或令牌无效）"
+
+    def record_failure(self, ip):
+        with self.lock:
+            self._counter(ip).failures += 1
+
+    def is_blocked(self, ip):
+        with self.lock:
+            return self._counter(ip).failures >= MAX_AUTH_FAILURES
+
+
+def _grant_expired(grant, now):
+    if now - grant["created"] > GRANT_MAX_AGE:
+        return True
+    return not grant["active"] and now - grant["used"] > grant["idle"]
+
+
+class GrantUseMiddleware:
+    """
+    授权令牌访问的请求在整个响应（包括流式下载的响应体）结束前保持授权有效，
+    结束后才重新计算闲置时间；其它请求原样放行
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in GRANT_ENDPOINTS:
+            return await self.app(scope, receive, send)
+        authorization = dict(scope["headers"]).get(b"authorization", b"")
+        if not authorization.startswith(b"Bearer "):
+            return await self.app(scope, receive, send)
+        policy = get_policy()
+        grant_id = policy.hold_grant(authorization[7:].decode("latin-1"))
+        if grant_id is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            policy.release_grant(grant_id)
+
+
+def _normalize(path):
+    path = posixpath.normpath(path.replace("\\", "/")).strip("/")
+    return "" if path == "." else path
+
+
+def _in_scope(path, granted):
+    return any(g == "" or path == g or path.startswith(g + "/") for g in granted)
+
+
+_policy = None
+_policy_source = None
+_checked_at = 0.0
+_policy_lock = threading.Lock()
+
+
+def get_policy():
+    """返回当前的访问策略；相关配置变化后重新编译，计数在重新编译后清零"""
+    global _policy, _policy_source, _checked_at
+    now = time.monotonic()
+    if _policy is not None and now - _checked_at < REFRESH_INTERVAL:
+        return _policy
+    with _policy_lock:
+        if _policy is None or now - _checked_at >= REFRESH_INTERVAL:
+            settings = get_settings()
+            source = repr([settings.get(k) for k in ("allowed_ips", "denied_ips", "access_password", "auth_token_ttl")])
+            if source != _policy_source:
+                _policy = AccessPolicy(settings)
+                _policy_source = source
+            _checked_at = now
+    return _policy
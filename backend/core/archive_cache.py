@@ -0,0 +1,404 @@
+# backend/core/archive_cache.py
+# 打包下载的磁盘缓存：按“所选路径 + 大小 + mtime”清单做键，LRU 淘汰，
+# 相同的并发请求合并到同一次打包，等待者边写边读
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP64_LIMIT
+
+from backend.core.request_profile import span, propagate
+from backend.core.sparse import is_sparse, data_extents
+
+COPY_CHUNK = 1024 * 1024
+_ZEROS = memoryview(bytes(COPY_CHUNK))  # 稀疏文件的空洞直接用它喂给压缩器，不从磁盘读
+FLUSH_EVERY = 1024 * 1024   # 每写出这么多字节就刷新一次，读者才能看到
+WAIT_TIMEOUT = 1.0
+
+
+class ArchiveCanceled(Exception):
+    pass
+
+
+def collect_entries(root, rel_paths):
+    """展开所选路径，返回 (公共根目录, [(绝对路径, 压缩包内路径, 大小, mtime_ns)])"""
+    abs_root = os.path.abspath(root)
+    common_root = os.path.commonpath([os.path.abspath(os.path.join(root, p)) for p in rel_paths])
+    if not common_root.startswith(abs_root):
+        common_root = abs_root
+
+    entries = []
+
+    def add(full_path):
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return
+        entries.append((full_path, os.path.relpath(full_path, common_root), st.st_size, st.st_mtime_ns))
+
+    for rel_path in rel_paths:
+        abs_path = os.path.abspath(os.path.join(root, rel_path))
+
+        # 处理路径越界的情况
+        if not abs_path.startswith(abs_root) or not abs_path.startswith(common_root):
+            continue  # 忽略越界路径
+
+        # 如果是文件夹，递归添加其中的文件
+        if os.path.isdir(abs_path):
+            for foldername, subfolders, filenames in os.walk(abs_path):
+                for filename in filenames:
+                    add(os.path.join(foldername, filename))
+
+        # 如果是文件，直接添加
+        elif os.path.isfile(abs_path):
+            add(abs_path)
+
+    return common_root, entries
+
+
+def manifest_key(entries, options=None):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(options or {}, sort_keys=True).encode("utf-8"))
+    for abs_path, arcname, size, mtime_ns in entries:
+        digest.update(f"{abs_path}\0{arcname}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _StreamingSink:
+    """
+    只追加、不可 seek 的写入端。ZipFile 检测到不可 seek 时会改用数据描述符，
+    已经写出的字节不会再被回头修改，读者可以放心边写边读。
+    """
+
+    def __init__(self, build, f):
+        self.build = build
+        self.f = f
+        self._unflushed = 0
+
+    def write(self, data):
+        n = self.f.write(data)
+        self._unflushed += n
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+        return n
+
+    def flush(self):
+        self.f.flush()
+        self._unflushed = 0
+        self.build.publish(self.f.tell())
+
+
+class ArchiveBuild:
+    """一次打包任务；进度字段也供异步打包任务接口使用"""
+
+    def __init__(self, cache, key, entries, filename):
+        self.cache = cache
+        self.key = key
+        self.entries = entries
+        self.filename = filename
+        self.final_path = cache.path_for(key)
+        self.tmp_path = f"{self.final_path}.{uuid.uuid4().hex[:8]}.part"
+        self.cond = threading.Condition()
+        self.committed = 0          # 已刷新到磁盘、可被读取的字节数
+        self.done = False
+        self.error = None
+        self.canceled = False
+        self.files_total = len(entries)
+        self.bytes_total = sum(e[2] for e in entries)
+        self.files_done = 0
+        self.bytes_done = 0          # 已读入的原始字节数
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def completed(cls, cache, key, entries, filename):
+        build = cls(cache, key, entries, filename)
+        build.committed = os.path.getsize(build.final_path)
+        build.done = True
+        build.finished_at = build.started_at
+        return build
+
+    def publish(self, committed):
+        with self.cond:
+            self.committed = committed
+            self.cond.notify_all()
+
+    def cancel(self):
+        self.canceled = True
+
+    def eta(self):
+        if self.done or not self.bytes_done:
+            return 0 if self.done else None
+        elapsed = time.time() - self.started_at
+        return elapsed * (self.bytes_total - self.bytes_done) / self.bytes_done
+
+    def run(self):
+        try:
+            with span("zip_build"), open(self.tmp_path, "wb") as f:
+                sink = _StreamingSink(self, f)
+                with ZipFile(sink, "w", ZIP_DEFLATED) as zipf:
+                    for full_path, arcname, size, _ in self.entries:
+                        self._add_file(zipf, full_path, arcname, size)
+                sink.flush()
+            with self.cond:
+                os.replace(self.tmp_path, self.final_path)
+                self.done = True
+                self.finished_at = time.time()
+                self.cond.notify_all()
+        except Exception as e:
+            with self.cond:
+                self.error = e
+                self.done = True
+                self.finished_at = time.time()
+                self.cond.notify_all()
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+        finally:
+            self.cache.build_finished(self)
+
+    def _add_file(self, zipf, full_path, arcname, size):
+        if self.canceled:
+            raise ArchiveCanceled("打包已取消")
+        zinfo = ZipInfo.from_file(full_path, arcname)
+        zinfo.compress_type = ZIP_DEFLATED
+        with open(full_path, "rb") as src, zipf.open(zinfo, "w", force_zip64=size * 1.05 > ZIP64_LIMIT) as dest:
+            st = os.fstat(src.fileno())
+            if is_sparse(st):
+                self._copy_sparse(src, dest, st.st_size)
+            else:
+                self._copy_range(src, dest, None)
+        self.files_done += 1
+
+    def _copy_range(self, src, dest, length):
+        """复制 length 字节（None 表示到文件末尾）"""
+        while length is None or length > 0:
+            if self.canceled:
+                raise ArchiveCanceled("打包已取消")
+            with span("read"):
+                data = src.read(COPY_CHUNK if length is None else min(COPY_CHUNK, length))
+            if not data:
+                break
+            dest.write(data)
+            self.bytes_done += len(data)
+            if length is not None:
+                length -= len(data)
+
+    def _copy_sparse(self, src, dest, size):
+        """只读取有数据的区段，空洞部分写入全 0"""
+        pos = 0
+        for start, length in data_extents(src.fileno(), size) + [(size, 0)]:
+            while pos < start:
+                if self.canceled:
+                    raise ArchiveCanceled("打包已取消")
+                n = min(COPY_CHUNK, start - pos)
+                dest.write(_ZEROS[:n])
+                self.bytes_done += n
+                pos += n
+            src.seek(start)
+            self._copy_range(src, dest, length)
+            pos = start + length
+
+    def open_for_read(self):
+        """打开当前可读的文件；打包完成后会被改名，所以在锁内选择路径"""
+        with self.cond:
+            return open(self.final_path if self.done and not self.error else self.tmp_path, "rb")
+
+    def stream(self, chunk_size=COPY_CHUNK, on_close=None):
+        """
+        边写边读：只读取已刷新的部分，读到末尾时等待打包继续推进。
+        调用时就登记为读者并打开文件，返回 StreamingResponse 之前压缩包已不会被淘汰
+        """
+        return _ArchiveReader(self, chunk_size, on_close)
+
+    def _read(self, f, chunk_size):
+        offset = 0
+        while True:
+            with self.cond:
+                if offset >= self.committed and not self.done:
+                    # 读者追上了打包进度，等待的时间就是压缩耗时
+                    with span("compress"):
+                        while offset >= self.committed and not self.done:
+                            self.cond.wait(WAIT_TIMEOUT)
+                if self.error:
+                    raise self.error
+                available = self.committed - offset
+                finished = self.done
+            if available <= 0 and finished:
+                return
+            with span("read"):
+                data = f.read(min(chunk_size, available))
+            if not data:
+                if finished:
+                    return
+                continue
+            offset += len(data)
+            yield data
+
+
+class _ArchiveReader:
+    """
+    一个下载连接的读取端。创建时计入读者，读完、出错、关闭或被回收时释放；
+    响应体从未开始迭代（客户端提前断开）也不会一直占着读者计数
+    """
+
+    def __init__(self, build, chunk_size, on_close=None):
+        self.build = build
+        self.on_close = on_close   # on_close(finished)：finished 表示完整读到了末尾
+        self.finished = False
+        self.closed = False
+        build.cache.acquire(build.key)
+        try:
+            self.f = build.open_for_read()
+        except OSError:
+            self.f = None
+            self.close()
+            raise
+        self.chunks = build._read(self.f, chunk_size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.finished = True
+            self.close()
+            raise
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.f is not None:
+            self.chunks.close()
+            self.f.close()
+        try:
+            if self.on_close is not None:
+                self.on_close(self.finished)
+        finally:
+            self.build.cache.release(self.build.key)
+
+    def __del__(self):
+        self.close()
+
+
+class ArchiveCache:
+    def __init__(self, cache_dir, budget_bytes):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self.building = {}   # key -> ArchiveBuild（进行中的打包，用于合并请求）
+        self.readers = {}    # key -> 正在读取的连接数，淘汰时跳过
+        self.pinned = {}     # key -> 还会被读取的引用数（请求处理中、异步任务尚未下载），淘汰时跳过
+        os.makedirs(cache_dir, exist_ok=True)
+        self._cleanup_partial()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.zip")
+
+    def _cleanup_partial(self):
+        # 上次异常退出留下的半成品
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def get_or_build(self, key, entries, filename):
+        """
+        命中缓存直接返回；同样的打包正在进行时加入它；否则启动新的打包。
+        返回前已在锁内 pin 住该键，调用方不再需要时 unpin
+        """
+        with self.lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+            build = self.building.get(key)
+            if build is not None and not build.canceled:
+                return build
+            final_path = self.path_for(key)
+            if os.path.exists(final_path):
+                os.utime(final_path)  # 更新 LRU 时间
+                return ArchiveBuild.completed(self, key, entries, filename)
+            build = ArchiveBuild(self, key, entries, filename)
+            open(build.tmp_path, "wb").close()  # 先建好文件，读者可能在打包线程启动前就开始读
+            self.building[key] = build
+        # 打包线程沿用发起请求的分析记录，压缩耗时记在 zip_build 下
+        threading.Thread(target=propagate(build.run), daemon=True).start()
+        return build
+
+    def build_finished(self, build):
+        with self.lock:
+            if self.building.get(build.key) is build:
+                del self.building[build.key]
+        self.evict()
+
+    def acquire(self, key):
+        with self.lock:
+            self.readers[key] = self.readers.get(key, 0) + 1
+
+    def release(self, key):
+        with self.lock:
+            count = self.readers.get(key, 0) - 1
+            if count > 0:
+                self.readers[key] = count
+            else:
+                self.readers.pop(key, None)
+        self.evict()
+
+    def unpin(self, key):
+        with self.lock:
+            count = self.pinned.get(key, 0) - 1
+            if count > 0:
+                self.pinned[key] = count
+            else:
+                self.pinned.pop(key, None)
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰，直到总大小不超过预算"""
+        with self.lock:
+            files = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".zip"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, name[:-4], path))
+            total = sum(f[1] for f in files)
+            for _, size, key, path in sorted(files):
+                if total <= self.budget_bytes:
+                    break
+                if key in self.readers or key in self.pinned or key in self.building:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_archive_cache(settings):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_dir = settings.get("zip_cache_dir") or os.path.join(tempfile.gettempdir(), "flydrop-zip-cache")
+            budget = int(settings.get("zip_cache_budget_mb", 4096)) * 1024 * 1024
+            _cache = ArchiveCache(cache_dir, budget)
+        return _cache
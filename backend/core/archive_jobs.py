@@ -0,0 +1,119 @@
+# backend/core/archive_jobs.py
+# 异步打包任务：创建后立即返回任务 ID，客户端轮询/订阅进度、取消或边打包边下载
+
+import threading
+import time
+import uuid
+
+from backend.core.archive_cache import ArchiveCanceled
+
+JOB_TTL = 3600  # 结束后保留多久（秒）
+
+
+class ArchiveJob:
+    def __init__(self, build, client_ip):
+        self.id = uuid.uuid4().hex
+        self.build = build
+        self.client_ip = client_ip
+        self.created_at = time.time()
+        self.canceled = False
+        self.readers = 0   # 本任务自己的下载连接数（/zip/jobs/{id}/download）
+        self.pinned = True  # 创建时沿用 get_or_build 的 pin，完整下载一次、取消或过期后才放开
+        self.lock = threading.Lock()
+
+    def stream(self):
+        """经由本任务下载：计入本任务的读者，取消时据此区分其它 /zip 下载"""
+        with self.lock:
+            self.readers += 1
+        try:
+            return self.build.stream(on_close=self._reader_closed)
+        except BaseException:
+            self._reader_closed(False)
+            raise
+
+    def _reader_closed(self, finished):
+        with self.lock:
+            self.readers -= 1
+        if finished:
+            self.unpin()
+
+    def unpin(self):
+        with self.lock:
+            if not self.pinned:
+                return
+            self.pinned = False
+        self.build.cache.unpin(self.build.key)
+
+    @property
+    def state(self):
+        build = self.build
+        if self.canceled or isinstance(build.error, ArchiveCanceled):
+            return "canceled"
+        if build.error:
+            return "failed"
+        return "done" if build.done else "building"
+
+    def status(self):
+        build = self.build
+        eta = build.eta()
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "filename": build.filename,
+            "files_done": build.files_total if build.done and not build.error else build.files_done,
+            "files_total": build.files_total,
+            "bytes_done": build.bytes_total if build.done and not build.error else build.bytes_done,
+            "bytes_total": build.bytes_total,
+            "archive_bytes": build.committed,   # 已可下载的压缩包字节数
+            "eta": None if eta is None else round(eta, 1),
+            "error": str(build.error) if build.error else "",
+        }
+
+
+class ArchiveJobManager:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create(self, build, client_ip):
+        job = ArchiveJob(build, client_ip)
+        with self.lock:
+            self._expire()
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            self._expire()
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id, cache):
+        """
+        取消任务；同一份打包还有其它未取消的任务，或有不属于任何任务的 /zip 下载在读时只取消本任务。
+        中止打包时本任务自己的下载连接也随之结束
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.canceled = True
+            sharing = [j for j in self.jobs.values() if j.build is job.build]
+            shared = any(not j.canceled for j in sharing)
+            job_readers = sum(j.readers for j in sharing)
+        with cache.lock:
+            outside_readers = cache.readers.get(job.build.key, 0) - job_readers
+        if not shared and not job.build.done and outside_readers <= 0:
+            job.build.cancel()
+        job.unpin()
+        return job
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            finished_at = job.build.finished_at
+            if (finished_at or job.canceled) and now - (finished_at or job.created_at) > JOB_TTL:
+                del self.jobs[job_id]
+                job.unpin()
+
+
+archive_jobs = ArchiveJobManager()
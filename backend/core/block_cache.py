@@ -0,0 +1,235 @@
+# backend/core/block_cache.py
+# 热文件块缓存：多个客户端同时下载同一批文件时，每个块只从磁盘读一次。
+# 按 (路径, mtime, 大小, 块号) 缓存 1MB 块，LRU 按内存预算淘汰；文件句柄跨请求复用，
+# 同一块的并发未命中合并为一次读取；顺序读时用 posix_fadvise 提示内核预读。
+
+import os
+import threading
+from collections import OrderedDict
+
+from backend.core.request_profile import span
+
+BLOCK_SIZE = 1024 * 1024
+READAHEAD_BLOCKS = 4        # 未命中时提示内核预读后面几个块
+MAX_OPEN_FILES = 64         # 复用的文件句柄上限
+
+
+class _Handle:
+    """带引用计数的文件句柄；被淘汰时等最后一个读者用完再关闭"""
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self.refs = 0
+        self.retired = False
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+
+    def willneed(self, offset, length):
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(self.fd, offset, length, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+
+    def pread(self, length, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, length, offset)
+        with _seek_lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, length)
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+_seek_lock = threading.Lock()  # 没有 pread 的平台上保护 lseek + read
+
+
+class BlockCache:
+    def __init__(self, budget_bytes, block_size=BLOCK_SIZE):
+        self.budget_bytes = budget_bytes
+        self.block_size = block_size
+        self.max_file_size = budget_bytes // 2   # 更大的文件直接读，避免把缓存整个冲掉
+        self.lock = threading.Lock()
+        self.blocks = OrderedDict()   # (path, stamp, 块号) -> bytes
+        self.paths = {}               # path -> (stamp, {块键})，文件变化时整体失效
+        self.loading = {}             # 块键 -> Event，合并并发未命中
+        self.handles = OrderedDict()  # (path, stamp) -> _Handle
+        self.cached_bytes = 0
+        self.hits = self.misses = self.waits = self.evictions = 0
+        self.hit_bytes = self.miss_bytes = self.bypass_bytes = 0
+
+    # --- 文件句柄 ---
+    def _acquire(self, path, stamp):
+        with self.lock:
+            handle = self.handles.get((path, stamp))
+            if handle is not None:
+                self.handles.move_to_end((path, stamp))
+                handle.refs += 1
+                return handle
+        handle = _Handle(path)
+        handle.refs = 1
+        with self.lock:
+            existing = self.handles.get((path, stamp))
+            if existing is not None:  # 别的线程先打开了
+                existing.refs += 1
+                handle.refs = 0
+                handle.retired = True
+            else:
+                self.handles[(path, stamp)] = handle
+                while len(self.handles) > MAX_OPEN_FILES:
+                    _, old = self.handles.popitem(last=False)
+                    self._retire(old)
+        if handle.retired:
+            handle.close()
+            return existing
+        return handle
+
+    def _release(self, handle):
+        with self.lock:
+            handle.refs -= 1
+            close = handle.retired and handle.refs == 0
+        if close:
+            handle.close()
+
+    def _retire(self, handle):
+        """调用方持有 self.lock"""
+        handle.retired = True
+        if handle.refs == 0:
+            handle.close()
+
+    # --- 块 ---
+    def _invalidate(self, path, stamp):
+        """调用方持有 self.lock；文件的 mtime 或大小变化后丢弃旧块和旧句柄"""
+        known = self.paths.get(path)
+        if known is None or known[0] == stamp:
+            return
+        for key in known[1]:
+            data = self.blocks.pop(key, None)
+            if data is not None:
+                self.cached_bytes -= len(data)
+        del self.paths[path]
+        handle = self.handles.pop((path, known[0]), None)
+        if handle is not None:
+            self._retire(handle)
+
+    def _evict(self):
+        """调用方持有 self.lock"""
+        while self.cached_bytes > self.budget_bytes and self.blocks:
+            key, data = self.blocks.popitem(last=False)
+            self.cached_bytes -= len(data)
+            self.evictions += 1
+            known = self.paths.get(key[0])
+            if known is not None:
+                known[1].discard(key)
+
+    def _get_block(self, handle, path, stamp, index):
+        key = (path, stamp, index)
+        while True:
+            with self.lock:
+                data = self.blocks.get(key)
+                if data is not None:
+                    self.blocks.move_to_end(key)
+                    self.hits += 1
+                    self.hit_bytes += len(data)
+                    return data
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    break
+                self.waits += 1
+            event.wait()  # 同一块正在被别的请求读取，读完后再查一次缓存
+
+        try:
+            offset = index * self.block_size
+            handle.willneed(offset + self.block_size, self.block_size * READAHEAD_BLOCKS)
+            with span("read"):
+                data = handle.pread(self.block_size, offset)
+            with self.lock:
+                self.misses += 1
+                self.miss_bytes += len(data)
+                known = self.paths.get(path)
+                if known is None or known[0] == stamp:
+                    if known is None:
+                        known = self.paths[path] = (stamp, set())
+                    self.blocks[key] = data
+                    known[1].add(key)
+                    self.cached_bytes += len(data)
+                    self._evict()
+            return data
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+            event.set()
+
+    def read_range(self, path, st, start, end):
+        """
+        生成器：按块返回 [start, end] 的内容。st 为请求开始时的 os.stat 结果，
+        它的 mtime 和大小是缓存键的一部分，文件被修改后自然读到新内容。
+        """
+        stamp = (st.st_mtime_ns, st.st_size)
+        cacheable = self.budget_bytes > 0 and st.st_size <= self.max_file_size
+        if cacheable:
+            with self.lock:
+                self._invalidate(path, stamp)
+
+        handle = self._acquire(path, stamp)
+        try:
+            pos = start
+            while pos <= end:
+                index = pos // self.block_size
+                block_start = index * self.block_size
+                if cacheable:
+                    block = self._get_block(handle, path, stamp, index)
+                else:
+                    with span("read"):
+                        block = handle.pread(self.block_size, block_start)
+                    with self.lock:
+                        self.bypass_bytes += len(block)
+                if not block:
+                    return  # 文件被截短
+                if pos == block_start and end - block_start + 1 >= len(block):
+                    data = block  # 整块直接交出去，不复制
+                else:
+                    data = block[pos - block_start:end - block_start + 1]
+                pos += len(data)
+                yield data
+        finally:
+            self._release(handle)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "budget_bytes": self.budget_bytes,
+                "cached_bytes": self.cached_bytes,
+                "cached_blocks": len(self.blocks),
+                "cached_files": len(self.paths),
+                "open_files": len(self.handles),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced_waits": self.waits,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "byte_hit_ratio": round(self.hit_bytes / (self.hit_bytes + self.miss_bytes), 4)
+                if self.hit_bytes + self.miss_bytes else None,
+                "bypass_bytes": self.bypass_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_block_cache(settings):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BlockCache(int(settings.get("read_cache_mb", 256)) * 1024 * 1024)
+        return _cache
@@ -0,0 +1,217 @@
+# backend/core/change_feed.py
+# 目录变化订阅：客户端把正在浏览的目录交给 /api/files/changes，服务端用 fs_watch 非递归地
+# 监视这些目录，把变化按序号记进环形缓冲区。客户端拿着游标长轮询，只取游标之后、自己订阅的
+# 目录里发生的事件，在本地就地更新对应的行，不必整棵树重新列出。
+#
+# 游标形如 "<feed id>:<序号>"，服务端重启后 feed id 变化，旧游标一律要求客户端重新加载。
+# 一个目录在 LEASE_SECONDS 内没有客户端再订阅就停止监视。
+# 订阅的目录按 realpath 解析，经符号链接指向共享目录之外的一律拒绝。
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from backend.core.fs_watch import create_watcher
+
+LEASE_SECONDS = 90          # 订阅多久没有续期就停止监视
+MAX_EVENTS = 10000          # 环形缓冲区保留的事件数，游标比这更旧时要求客户端重新加载
+MAX_WATCHED = 4096          # 同时监视的目录上限
+
+
+class ChangeFeed:
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.reset_seq = 0      # 最近一次事件丢失（队列溢出）时的序号
+        self.dropped_seq = 0    # 已被挤出缓冲区的最新事件的序号
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.watched = {}       # 相对目录 -> [开始监视时的序号, 租约到期时间, 真实路径]
+        self.by_abs = {}        # 真实路径 -> {相对目录}（经符号链接订阅时可能有多个名字）
+        self.lock = threading.Lock()
+        self.waiters = set()    # (事件循环, asyncio.Event)
+        self.watcher = create_watcher([], self.on_events, recursive=False, track_moves=True)
+
+    # --- 游标 ---
+    def cursor(self):
+        return f"{self.id}:{self.seq}"
+
+    def parse_cursor(self, cursor):
+        """返回游标中的序号；不是本次运行发出的游标返回 None"""
+        feed_id, _, seq = (cursor or "").partition(":")
+        if feed_id != self.id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    # --- 订阅 ---
+    def _rel(self, abs_path):
+        rel = os.path.relpath(abs_path, self.root)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    def _abs(self, rel_path):
+        """解析成真实路径；解析后不在共享目录之内（包括经符号链接逃出）时返回 None"""
+        abs_path = os.path.realpath(os.path.join(self.root, rel_path))
+        if abs_path != self.root and not abs_path.startswith(self.root + os.sep):
+            return None
+        return abs_path
+
+    def subscribe(self, dirs):
+        """
+        续期或开始监视 dirs，返回 (开始监视时的序号 {目录: 序号}, 不存在的目录列表)。
+        开始监视之前的变化不会出现在事件里，调用方据此判断是否需要重新确认列表。
+        """
+        now = time.monotonic()
+        since, missing = {}, []
+        with self.lock:
+            self._expire(now)
+            for rel in dirs:
+                rel = rel.strip("/")
+                state = self.watched.get(rel)
+                if state is None:
+                    abs_path = self._abs(rel)
+                    if abs_path is None or not os.path.isdir(abs_path) or len(self.watched) >= MAX_WATCHED:
+                        missing.append(rel)
+                        continue
+                    if abs_path not in self.by_abs:
+                        self.watcher.add_tree(abs_path)
+                    self.by_abs.setdefault(abs_path, set()).add(rel)
+                    # 占用一个序号作为开始监视的位置，游标早于它的客户端需要重新确认这个目录
+                    self.seq += 1
+                    state = self.watched[rel] = [self.seq, 0.0, abs_path]
+                state[1] = now + LEASE_SECONDS
+                since[rel] = state[0]
+        return since, missing
+
+    def _expire(self, now):
+        """（调用方持有 self.lock）停止监视租约已到期的目录"""
+        for rel in [rel for rel, (_, expires, _) in self.watched.items() if expires < now]:
+            self._unwatch(rel)
+
+    def _unwatch(self, rel):
+        """（调用方持有 self.lock）"""
+        abs_path = self.watched.pop(rel)[2]
+        names = self.by_abs.get(abs_path)
+        if names is not None:
+            names.discard(rel)
+            if not names:
+                del self.by_abs[abs_path]
+                self.watcher.remove_tree(abs_path)
+
+    def _moved(self, old_path, new_path):
+        """
+        （调用方持有 self.lock）被监视的目录（或其上级）改名后，监视线程已改用新路径报告事件，
+        订阅也随之改用新名字；客户端按新名字续订时沿用原来的起始序号
+        """
+        prefix = old_path + os.sep
+        for abs_path in [p for p in self.by_abs if p == old_path or p.startswith(prefix)]:
+            moved = new_path + abs_path[len(old_path):]
+            for rel in self.by_abs.pop(abs_path):
+                state = self.watched.pop(rel)
+                new_rel = self._rel(moved)
+                if new_rel in self.watched or self._abs(new_rel) != moved:
+                    continue  # 新名字已被订阅，或已移出共享目录
+                state[2] = moved
+                self.watched[new_rel] = state
+                self.by_abs.setdefault(moved, set()).add(new_rel)
+            if moved not in self.by_abs:
+                self.watcher.remove_tree(moved)
+
+    # --- 事件 ---
+    def on_events(self, events):
+        """（监视线程）把文件系统事件转换成按目录归类的变化记录"""
+        with self.lock:
+            last = None
+            for kind, path, is_dir in events:
+                if kind == "overflow":
+                    self.seq += 1
+                    self.reset_seq = self.seq
+                    continue
+                if kind == "renamed":
+                    old_path, path = path
+                    if is_dir:
+                        self._moved(old_path, path)
+                    if os.path.dirname(old_path) == os.path.dirname(path):
+                        last = self._record("renamed", path, is_dir, old_path=old_path)
+                        continue
+                    # 跨目录移动：对两个目录分别是删除和新建
+                    self._record("deleted", old_path, is_dir)
+                    kind = "created"
+                if kind == "modified":
+                    if is_dir:
+                        continue  # 目录自身的属性变化对列表没有影响
+                    if last and last["type"] == "modified" and last["abs"] == path:
+                        continue  # 连续写入合并为一条
+                last = self._record(kind, path, is_dir)
+            waiters = list(self.waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _record(self, kind, path, is_dir, old_path=None):
+        """（调用方持有 self.lock）只记录仍在监视的目录里发生的变化，每个订阅名各记一条"""
+        record = None
+        name = os.path.basename(path)
+        for rel_dir in sorted(self.by_abs.get(os.path.dirname(path), ())):
+            self.seq += 1
+            record = {"seq": self.seq, "type": kind, "dir": rel_dir, "path": _join(rel_dir, name),
+                      "name": name, "is_dir": is_dir, "abs": path}
+            if old_path:
+                record["old_path"] = _join(rel_dir, os.path.basename(old_path))
+            if len(self.events) == self.events.maxlen:
+                self.dropped_seq = self.events[0]["seq"]
+            self.events.append(record)
+        return record
+
+    def since(self, seq, dirs):
+        """
+        取序号 seq 之后、dirs 中发生的变化；返回 (事件列表, 是否需要整体重新加载, 当前序号)。
+        游标之后有事件被挤出缓冲区或发生过溢出时，中间的事件已经丢失。
+        """
+        dirs = set(dirs)
+        with self.lock:
+            if seq < self.reset_seq or seq < self.dropped_seq:
+                return [], True, self.seq
+            events = [{k: v for k, v in e.items() if k != "abs"}
+                      for e in self.events if e["seq"] > seq and e["dir"] in dirs]
+            return events, False, self.seq
+
+    async def wait(self, seen, timeout):
+        """等到序号超过 seen（有任何新事件）或超时"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.lock:
+            if self.seq > seen:
+                return
+            self.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                self.waiters.discard(waiter)
+
+    def stop(self):
+        self.watcher.stop()
+
+
+def _join(rel_dir, name):
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_change_feed(settings):
+    """共享目录改变后重新建立订阅，旧的游标随之失效"""
+    global _feed
+    with _feed_lock:
+        root = os.path.realpath(settings["share_path"])
+        if _feed is None or _feed.root != root:
+            if _feed is not None:
+                _feed.stop()
+            _feed = ChangeFeed(root)
+        return _feed
@@ -0,0 +1,41 @@
+# backend/core/compression.py
+# 下载时的可选 gzip 压缩：只在客户端声明 X-Accept-Compression（慢速链路）、整文件请求、
+# 且内容确实能压下去时使用。先按扩展名排除已压缩格式，再试压文件开头一段判断。
+
+import os
+import zlib
+
+MIN_SIZE = 16 * 1024                # 太小的文件压缩收益不值得一次额外的读取
+SAMPLE_SIZE = 64 * 1024             # 试压的样本大小
+MIN_RATIO = 0.85                    # 样本压缩后不到原来的这个比例才压缩
+LEVEL = 1                           # 最快的压缩级别，目的是省带宽而不是省空间
+
+# 本身已经压缩过的格式，不再尝试
+COMPRESSED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".lz4", ".br",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".m4a", ".ogg", ".opus", ".flac",
+    ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".apk", ".jar", ".dmg", ".iso",
+}
+
+
+def is_compressible(abs_path, size):
+    if size < MIN_SIZE or os.path.splitext(abs_path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return False
+    try:
+        with open(abs_path, "rb") as f:
+            sample = f.read(SAMPLE_SIZE)
+    except OSError:
+        return False
+    return len(zlib.compress(sample, LEVEL)) < len(sample) * MIN_RATIO
+
+
+def gzip_stream(chunks):
+    """把按块产生的数据流压缩成 gzip 格式"""
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, 31)  # wbits=31：带 gzip 头和校验
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
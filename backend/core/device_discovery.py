@@ -3,49 +3,101 @@ import threading
 import time
 import json
 import platform
-from backend.config import get_settings
+from backend.config import get_settings, get_device_id
 from backend.core.device_manager import device_manager
 
-_discovered = {}  # 设备名称 -> IP 映射表（全局缓存）
+FLUSH_INTERVAL = 0.5          # 批量处理广播的间隔（秒）
+MAX_PENDING = 20000           # 两次批处理之间最多缓存的来源数，超出后丢弃
+RECV_BUFFER = 4 * 1024 * 1024 # 内核接收缓冲区，突发广播时减少丢包
+MAX_DATAGRAM = 1024
 
 
 class DeviceDiscoveryThread(threading.Thread):
-    def __init__(self, on_device_found):
+    """
+    接收循环只做 recvfrom 和按 (来源, 内容) 去重；JSON 解析、更新设备表和回调
+    每 FLUSH_INTERVAL 批量做一次，同一设备在一个批次里重复广播只处理一次。
+    """
+
+    def __init__(self, on_device_found, port=None, manager=None):
         super().__init__(daemon=True)
         self.on_device_found = on_device_found
         self.running = True
-        self.port = get_settings().get("discovery_port", 17257)
+        self.port = port or get_settings().get("discovery_port", 17257)
+        self.manager = manager or device_manager
+        self.pending = {}       # (ip, 原始数据) -> 最后收到的时间
+        self.received = 0       # 统计：收到的数据报
+        self.processed = 0      # 统计：去重后实际处理的公告
+        self._parsed = {}       # 原始数据 -> (device_id, name)，同一设备的广播内容不变
+        self.bound = threading.Event()
 
     def run(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        except OSError:
+            pass
         try:
             sock.bind(("", self.port))
-            sock.settimeout(1.0)
+            sock.settimeout(FLUSH_INTERVAL)
             print(f"📡 正在监听设备广播 (port {self.port}) ...")
         except OSError as e:
             print(f"❌ 无法绑定 UDP 端口 {self.port}：", e)
             return
+        self.bound.set()
 
+        next_flush = time.monotonic() + FLUSH_INTERVAL
         while self.running:
             try:
-                data, addr = sock.recvfrom(1024)
-                info = json.loads(data.decode("utf-8"))
-                name = info.get("name", addr[0])
-                ip = addr[0]
-
-                # ✅ 更新全局设备缓存
-                device_manager.update_device(name, ip)
-
-                # ✅ 通知 UI 回调
-                self.on_device_found(name, ip)
-
+                data, addr = sock.recvfrom(MAX_DATAGRAM)
+                self.received += 1
+                key = (addr[0], data)
+                if len(self.pending) < MAX_PENDING or key in self.pending:
+                    self.pending[key] = time.time()
             except socket.timeout:
-                continue
+                pass
             except Exception as e:
                 print("❌ UDP 接收错误:", e)
 
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + FLUSH_INTERVAL
+
+        self.flush()
         sock.close()
 
+    def _parse(self, data, ip):
+        parsed = self._parsed.get(data)
+        if parsed is None:
+            try:
+                info = json.loads(data.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                return None
+            if not isinstance(info, dict):
+                return None
+            parsed = (str(info.get("id") or ""), str(info.get("name") or ip))
+            if len(self._parsed) >= MAX_PENDING:
+                self._parsed.clear()
+            self._parsed[data] = parsed
+        return parsed
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        announcements = []
+        for (ip, data), seen in batch.items():
+            parsed = self._parse(data, ip)
+            if parsed:
+                announcements.append((parsed[0], parsed[1], ip, seen))
+        self.processed += len(announcements)
+
+        # ✅ 一次加锁批量更新全局设备表，只对新设备/名称或 IP 变化的设备通知回调
+        for info in self.manager.update_many(announcements):
+            try:
+                self.on_device_found(info["name"], info["ip"])
+            except Exception as e:
+                print("❌ 设备回调出错:", e)
+
     def stop(self):
         self.running = False
 
@@ -57,6 +109,7 @@ class BroadcastThread(threading.Thread):
         self.config = get_settings()
         self.port = self.config.get("discovery_port", 17257)
         self.device_name = self.config.get("device_name", platform.node())
+        self.device_id = get_device_id()
 
     def run(self):
         while self.running:
@@ -70,7 +123,7 @@ class BroadcastThread(threading.Thread):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
-        msg = json.dumps({"name": self.device_name}).encode("utf-8")
+        msg = json.dumps({"id": self.device_id, "name": self.device_name}).encode("utf-8")
         sock.sendto(msg, ("255.255.255.255", self.port))
         sock.close()
 
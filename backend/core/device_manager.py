@@ -3,27 +3,103 @@
 import threading
 import time
 
+DEVICE_TTL = 15          # 超过这么久没有广播的设备视为离线（秒）
+MAX_DEVICES = 10000      # 设备表上限，防止伪造广播把内存撑爆
+
+
 class DeviceManager:
+    """
+    以设备 ID 为主键的设备表，另建 IP、名称索引。
+    同名设备（例如都叫“未命名设备”）不再互相覆盖；旧版本不带 ID 的广播按 IP 生成 ID。
+    """
+
     def __init__(self):
-        self.devices = {}  # name -> {ip, last_seen}
+        self.devices = {}  # device_id -> {id, name, ip, last_seen}
+        self.by_ip = {}    # ip -> {device_id}
+        self.by_name = {}  # name -> {device_id}
         self.lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def _index_add(self, index, key, device_id):
+        index.setdefault(key, set()).add(device_id)
+
+    def _index_remove(self, index, key, device_id):
+        ids = index.get(key)
+        if ids:
+            ids.discard(device_id)
+            if not ids:
+                del index[key]
 
-    def update_device(self, name, ip):
+    def _remove(self, device_id):
+        info = self.devices.pop(device_id)
+        self._index_remove(self.by_ip, info["ip"], device_id)
+        self._index_remove(self.by_name, info["name"], device_id)
+
+    def _prune(self, now):
+        expired = [d for d, info in self.devices.items() if now - info["last_seen"] > DEVICE_TTL]
+        for device_id in expired:
+            self._remove(device_id)
+        self._last_prune = now
+
+    def update_many(self, announcements):
+        """
+        批量更新：announcements 为 [(device_id, name, ip, last_seen)]，整批只加一次锁。
+        返回新出现（或换了名称/IP）的设备列表，供调用方通知。
+        """
+        changed = []
         with self.lock:
-            self.devices[name] = {
-                "ip": ip,
-                "last_seen": time.time()
-            }
+            now = time.time()
+            if now - self._last_prune > DEVICE_TTL:
+                self._prune(now)
+            for device_id, name, ip, seen in announcements:
+                device_id = device_id or f"ip:{ip}"
+                info = self.devices.get(device_id)
+                if info is None:
+                    if len(self.devices) >= MAX_DEVICES:
+                        continue
+                    info = {"id": device_id, "name": name, "ip": ip, "last_seen": seen}
+                    self.devices[device_id] = info
+                    self._index_add(self.by_ip, ip, device_id)
+                    self._index_add(self.by_name, name, device_id)
+                    changed.append(dict(info))
+                    continue
+                if info["ip"] != ip or info["name"] != name:
+                    self._index_remove(self.by_ip, info["ip"], device_id)
+                    self._index_remove(self.by_name, info["name"], device_id)
+                    info["ip"], info["name"] = ip, name
+                    self._index_add(self.by_ip, ip, device_id)
+                    self._index_add(self.by_name, name, device_id)
+                    changed.append(dict(info))
+                info["last_seen"] = max(info["last_seen"], seen)
+        return changed
+
+    def update_device(self, name, ip, device_id=None):
+        self.update_many([(device_id, name, ip, time.time())])
+
+    def _alive(self, ids, now):
+        return [
+            {"id": info["id"], "name": info["name"], "ip": info["ip"]}
+            for info in (self.devices[d] for d in ids)
+            if now - info["last_seen"] <= DEVICE_TTL
+        ]
 
     def get_devices(self):
         with self.lock:
             # 只返回最近15秒有响应的设备（防止过期设备）
-            now = time.time()
-            return [
-                {"name": name, "ip": info["ip"]}
-                for name, info in self.devices.items()
-                if now - info["last_seen"] <= 15
-            ]
+            return self._alive(self.devices, time.time())
+
+    def find_by_ip(self, ip):
+        with self.lock:
+            return self._alive(self.by_ip.get(ip, ()), time.time())
+
+    def find_by_name(self, name):
+        with self.lock:
+            return self._alive(self.by_name.get(name, ()), time.time())
+
+    def get(self, device_id):
+        with self.lock:
+            info = self.devices.get(device_id)
+            return dict(info) if info else None
 
 # 单例
-device_manager = DeviceManager()
\ No newline at end of file
+device_manager = DeviceManager()
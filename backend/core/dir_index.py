@@ -0,0 +1,136 @@
+# backend/core/dir_index.py
+# 目录列表缓存：大目录分页时不必每页都重新 scandir + 排序
+
+import hashlib
+import json
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from backend.core.request_profile import span
+
+MAX_CACHED_DIRS = 32
+SORT_KEYS = ("name", "size", "mtime", "type")
+
+_cache = OrderedDict()  # (abs_path, mtime_ns, sort, desc, show_hidden, q) -> entries
+_lock = threading.Lock()
+
+
+def _scan(abs_path, root, need_stat):
+    entries = []
+    with os.scandir(abs_path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if not is_dir and not entry.is_file():
+                    continue
+                item = {
+                    "type": "dir" if is_dir else "file",
+                    "path": os.path.relpath(entry.path, root),
+                    "name": entry.name,
+                }
+                if need_stat:
+                    st = entry.stat()
+                    item["size"] = 0 if is_dir else st.st_size
+                    item["mtime"] = st.st_mtime
+                entries.append(item)
+            except OSError:
+                continue  # 扫描过程中被删除或无权限
+    return entries
+
+
+def list_directory(abs_path, root, sort="name", desc=False, show_hidden=True, q="", need_stat=False):
+    """
+    返回排序、过滤后的完整条目列表（调用方负责切片分页）。
+    以目录 mtime 作为缓存失效依据，目录内容变化后自动重新扫描。
+    原地改写文件不会改变目录 mtime，调用方对要返回的那一页调用 revalidate_entries 更新大小和时间。
+    """
+    if sort not in SORT_KEYS:
+        sort = "name"
+    need_stat = need_stat or sort in ("size", "mtime")
+    mtime_ns = os.stat(abs_path).st_mtime_ns
+    key = (abs_path, mtime_ns, sort, desc, show_hidden, q, need_stat)
+
+    with _lock:
+        entries = _cache.get(key)
+        if entries is not None:
+            _cache.move_to_end(key)
+            return entries
+
+    with span("traverse"):
+        entries = _scan(abs_path, root, need_stat)
+    if not show_hidden:
+        entries = [e for e in entries if not e["name"].startswith(".")]
+    if q:
+        q_lower = q.lower()
+        entries = [e for e in entries if q_lower in e["name"].lower()]
+
+    if sort == "name":
+        entries.sort(key=lambda e: (e["type"] != "dir", e["name"].lower()), reverse=desc)
+    elif sort == "type":
+        entries.sort(key=lambda e: (e["type"], os.path.splitext(e["name"])[1].lower(), e["name"].lower()), reverse=desc)
+    else:
+        entries.sort(key=lambda e: (e[sort], e["name"].lower()), reverse=desc)
+
+    with _lock:
+        _cache[key] = entries
+        while len(_cache) > MAX_CACHED_DIRS:
+            _cache.popitem(last=False)
+    return entries
+
+
+def revalidate_entries(abs_path, page, root):
+    """
+    重新 stat 这一页的文件，原地更新缓存里的大小和修改时间。
+    有变化且缓存按大小或时间排序时丢弃这些排序结果，下次请求重新排序。
+    """
+    changed = False
+    for item in page:
+        if item["type"] != "file" or "size" not in item:
+            continue
+        try:
+            st = os.stat(os.path.join(root, item["path"]))
+        except OSError:
+            continue  # 已被删除，目录 mtime 随之变化，下次请求会重新扫描
+        if st.st_size != item["size"] or st.st_mtime != item["mtime"]:
+            item["size"] = st.st_size
+            item["mtime"] = st.st_mtime
+            changed = True
+    if changed:
+        with _lock:
+            for key in [k for k in _cache if k[0] == abs_path and k[2] in ("size", "mtime")]:
+                del _cache[key]
+    return changed
+
+
+def listing_etag(abs_path, page, total):
+    """列表的弱校验值：目录 mtime 加上这一页内容（含子项大小和时间）的摘要"""
+    try:
+        mtime_ns = os.stat(abs_path).st_mtime_ns
+    except OSError:
+        mtime_ns = 0
+    digest = hashlib.blake2b(json.dumps([total, page], separators=(",", ":")).encode("utf-8"),
+                             digest_size=12).hexdigest()
+    return f'W/"{mtime_ns:x}-{digest}"'
+
+
+def stat_paths(root, rel_paths):
+    """批量获取文件大小和修改时间，供前端按需加载可见行的元数据"""
+    abs_root = os.path.abspath(root)
+    result = {}
+    for rel_path in rel_paths:
+        abs_path = os.path.abspath(os.path.join(root, rel_path))
+        if not abs_path.startswith(abs_root):
+            continue
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        is_dir = stat.S_ISDIR(st.st_mode)
+        result[rel_path] = {
+            "type": "dir" if is_dir else "file",
+            "size": 0 if is_dir else st.st_size,
+            "mtime": st.st_mtime,
+        }
+    return result
@@ -0,0 +1,297 @@
+# backend/core/fs_watch.py
+# 目录变化监视：Linux 上通过 ctypes 直接调用 inotify，其它平台退回定时扫描对比快照。
+# 回调每次收到一批事件 [(类型, 绝对路径, 是否目录)]，类型为
+# created / modified / deleted / overflow（事件队列溢出，调用方应重新扫描）。
+# recursive=False 时只监视给定目录本身的直接子项；track_moves=True 时同一批内能配对的
+# 移入/移出合并为 ("renamed", (旧路径, 新路径), 是否目录)，否则拆成 deleted + created。
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT = struct.Struct("iIII")   # wd, mask, cookie, len
+POLL_INTERVAL = 2.0             # 没有 inotify 时的扫描间隔（秒）
+
+_libc = None
+
+
+def _inotify():
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+    return _libc or None
+
+
+def inotify_available():
+    return _inotify() is not None
+
+
+class InotifyWatcher(threading.Thread):
+    """监视若干目录；递归模式下新建的子目录会自动加入监视"""
+
+    def __init__(self, paths, on_events, recursive=True, track_moves=False):
+        super().__init__(daemon=True)
+        self.libc = _inotify()
+        self.on_events = on_events
+        self.recursive = recursive
+        self.track_moves = track_moves
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.dirs = {}      # wd -> 目录绝对路径
+        self.running = True
+        self.lock = threading.Lock()
+        for path in paths:
+            self.add_tree(os.path.abspath(path))
+
+    def add_tree(self, top):
+        """监视 top（递归模式下连同所有子目录），返回新加入的目录数"""
+        added = 0
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                if path == top:
+                    print(f"⚠️ 无法监视目录 {path}: {os.strerror(errno)}")
+                continue
+            with self.lock:
+                self.dirs[wd] = path
+            added += 1
+            if not self.recursive:
+                break
+            try:
+                with os.scandir(path) as it:
+                    stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+        return added
+
+    def remove_tree(self, top):
+        """停止监视 top（递归模式下连同其子目录）"""
+        prefix = top + os.sep
+        with self.lock:
+            wds = [wd for wd, path in self.dirs.items()
+                   if path == top or (self.recursive and path.startswith(prefix))]
+            for wd in wds:
+                del self.dirs[wd]
+        for wd in wds:
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        try:
+            while self.running:
+                if not poller.poll(500):
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                events = self._parse(data)
+                if events:
+                    try:
+                        self.on_events(events)
+                    except Exception as e:
+                        print(f"⚠️ 目录变化回调出错: {e}")
+        finally:
+            os.close(self.fd)
+
+    def _parse(self, data):
+        events = []
+        moved_from = {}     # cookie -> 该移出事件在 events 中的位置
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("overflow", None, False))
+                continue
+            with self.lock:
+                base = self.dirs.get(wd)
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+            if base is None or mask & IN_IGNORED:
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & IN_MOVE_SELF and self.track_moves:
+                continue  # 父目录的移入/移出事件已经报告过
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                events.append(("deleted", base, True))
+                continue
+            path = os.path.join(base, os.fsdecode(name))
+            if self.track_moves and mask & IN_MOVED_TO and cookie in moved_from:
+                index = moved_from.pop(cookie)
+                old_path = events[index][1]
+                events[index] = ("renamed", (old_path, path), is_dir)
+                if is_dir:
+                    self._rename_watches(old_path, path)
+                continue
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if is_dir and self.recursive:
+                    self.add_tree(path)   # 监视新目录，并补报建立监视前已经写进去的文件
+                    events.extend(("created", p, d) for p, d in _walk(path))
+                events.append(("created", path, is_dir))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                if mask & IN_MOVED_FROM:
+                    moved_from[cookie] = len(events)
+                events.append(("deleted", path, is_dir))
+            else:
+                events.append(("modified", path, is_dir))
+        return events
+
+    def _rename_watches(self, old_path, new_path):
+        """目录改名后 wd 不变，只更新记录的路径"""
+        prefix = old_path + os.sep
+        with self.lock:
+            for wd, path in self.dirs.items():
+                if path == old_path:
+                    self.dirs[wd] = new_path
+                elif path.startswith(prefix):
+                    self.dirs[wd] = new_path + path[len(old_path):]
+
+    def stop(self):
+        self.running = False
+
+
+def _walk(top):
+    """列出 top 下所有条目 [(路径, 是否目录)]"""
+    result = []
+    stack = [top]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    result.append((entry.path, is_dir))
+                    if is_dir:
+                        stack.append(entry.path)
+        except OSError:
+            pass
+    return result
+
+
+def _children(top):
+    try:
+        with os.scandir(top) as it:
+            return [(e.path, e.is_dir(follow_symlinks=False)) for e in it]
+    except OSError:
+        return []
+
+
+def _snapshot(paths, recursive=True):
+    state = {}
+    for top in paths:
+        for path, is_dir in (_walk(top) if recursive else _children(top)):
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size, is_dir)
+    return state
+
+
+class PollingWatcher(threading.Thread):
+    """没有 inotify 的平台：定时扫描，对比前后两次快照"""
+
+    def __init__(self, paths, on_events, interval=POLL_INTERVAL, recursive=True, track_moves=False):
+        super().__init__(daemon=True)
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.on_events = on_events
+        self.interval = interval
+        self.recursive = recursive   # 扫描无法配对移动，track_moves 不起作用
+        self.running = True
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.state = _snapshot(self.paths, recursive)
+
+    def add_tree(self, top):
+        top = os.path.abspath(top)
+        snapshot = _snapshot([top], self.recursive)
+        with self.lock:
+            self.paths.append(top)
+            self.state.update(snapshot)
+        return 1
+
+    def remove_tree(self, top):
+        with self.lock:
+            self.paths = [p for p in self.paths if p != top]
+            self.state = {p: v for p, v in self.state.items() if os.path.dirname(p) != top
+                          and not (self.recursive and p.startswith(top + os.sep))}
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.interval)
+            if not self.running:
+                return
+            with self.lock:
+                paths = list(self.paths)
+            current = _snapshot(paths, self.recursive)
+            events = []
+            for path, (mtime, size, is_dir) in current.items():
+                old = self.state.get(path)
+                if old is None:
+                    events.append(("created", path, is_dir))
+                elif old[:2] != (mtime, size) and not is_dir:
+                    events.append(("modified", path, is_dir))
+            with self.lock:
+                if self.paths != paths:
+                    continue  # 扫描期间监视的目录有变化，以下次扫描为准
+                events.extend(("deleted", path, old[2]) for path, old in self.state.items() if path not in current)
+                self.state = current
+            if events:
+                try:
+                    self.on_events(events)
+                except Exception as e:
+                    print(f"⚠️ 目录变化回调出错: {e}")
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+
+def create_watcher(paths, on_events, recursive=True, track_moves=False):
+    """创建并启动监视线程；优先 inotify，不可用时定时扫描"""
+    watcher = None
+    if inotify_available():
+        try:
+            watcher = InotifyWatcher(paths, on_events, recursive, track_moves)
+        except OSError as e:
+            print(f"⚠️ inotify 不可用，改为定时扫描: {e}")
+    if watcher is None:
+        watcher = PollingWatcher(paths, on_events, recursive=recursive, track_moves=track_moves)
+    watcher.start()
+    return watcher
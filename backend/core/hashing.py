@@ -0,0 +1,111 @@
+# backend/core/hashing.py
+# 文件内容哈希（整体 + 分片），按 size/mtime 缓存，供多源下载识别相同文件并校验分片
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_PIECE_SIZE = 4 * 1024 * 1024
+MIN_PIECE_SIZE = 64 * 1024
+MAX_PIECE_SIZE = 64 * 1024 * 1024
+MAX_CACHED = 4096
+LOCATE_SCAN_LIMIT = 20000  # 按文件名查找候选时最多扫描的条目数
+
+_cache = OrderedDict()   # (abs_path, size, mtime_ns, piece_size) -> digest
+_by_hash = {}            # sha256 -> set(abs_path)
+_lock = threading.Lock()
+
+
+def file_digest(abs_path, piece_size=DEFAULT_PIECE_SIZE):
+    """一次读完文件，同时计算整体 sha256 和每个分片的 sha256"""
+    st = os.stat(abs_path)
+    key = (abs_path, st.st_size, st.st_mtime_ns, piece_size)
+    with _lock:
+        digest = _cache.get(key)
+        if digest is not None:
+            _cache.move_to_end(key)
+            return digest
+
+    whole = hashlib.sha256()
+    pieces = []
+    with open(abs_path, "rb") as f:
+        while True:
+            data = f.read(piece_size)
+            if not data:
+                break
+            whole.update(data)
+            pieces.append(hashlib.sha256(data).hexdigest())
+
+    digest = {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": whole.hexdigest(),
+        "piece_size": piece_size,
+        "pieces": pieces,
+    }
+    with _lock:
+        _cache[key] = digest
+        _by_hash.setdefault(digest["sha256"], set()).add(abs_path)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return digest
+
+
+def quick_digest(abs_path, piece_size=DEFAULT_PIECE_SIZE):
+    """
+    已算过完整哈希时直接返回；否则只读首尾两个分片，返回大小和抽样分片哈希，
+    供多源下载快速判断副本是否相同（其余分片由下载方逐片校验），不必先读完整个文件
+    """
+    st = os.stat(abs_path)
+    with _lock:
+        digest = _cache.get((abs_path, st.st_size, st.st_mtime_ns, piece_size))
+    if digest is not None:
+        return digest
+
+    count = max(1, -(-st.st_size // piece_size))
+    samples = {}
+    with open(abs_path, "rb") as f:
+        for index in sorted({0, count - 1}):
+            f.seek(index * piece_size)
+            samples[str(index)] = hashlib.sha256(f.read(piece_size)).hexdigest()
+    return {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "piece_size": piece_size,
+        "samples": samples,
+    }
+
+
+def locate(root, sha256, size, name=""):
+    """
+    在共享目录里找内容相同的文件，返回相对路径或 None。
+    先查已计算过的哈希，再按“同名同大小”有限扫描候选并校验。
+    """
+    abs_root = os.path.abspath(root)
+    with _lock:
+        known = list(_by_hash.get(sha256, ()))
+    for abs_path in known:
+        try:
+            if abs_path.startswith(abs_root) and os.path.getsize(abs_path) == size \
+                    and file_digest(abs_path)["sha256"] == sha256:
+                return os.path.relpath(abs_path, root)
+        except OSError:
+            continue
+
+    if not name:
+        return None
+    scanned = 0
+    for folder, dirs, files in os.walk(abs_root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        scanned += len(files) + len(dirs)
+        if name in files:
+            abs_path = os.path.join(folder, name)
+            try:
+                if os.path.getsize(abs_path) == size and file_digest(abs_path)["sha256"] == sha256:
+                    return os.path.relpath(abs_path, root)
+            except OSError:
+                pass
+        if scanned > LOCATE_SCAN_LIMIT:
+            break
+    return None
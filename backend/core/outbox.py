@@ -0,0 +1,227 @@
+# backend/core/outbox.py
+# 发件箱：监视配置的目录，新文件写完（大小和 mtime 稳定）后成批通知指定设备来拉取。
+# 对方收到的是一个设备间直传任务（/api/transfers/pull），文件走它自己的下载引擎，
+# 和手动“发送到设备”是同一条路径。发件箱目录必须位于共享目录之内，对方才能下载；
+# 对方凭本机为这批文件签发的只读授权令牌来拉取，拿不到本机的访问密码。
+# 对方须已发现本机，或在它的 pull_sources 中配置了本机地址。
+#
+# 配置示例：
+#   "outboxes": [{"path": "扫描件", "peers": ["https://192.168.1.30:8010"],
+#                 "password": "对方的访问密码", "dest": "收件箱"}]
+
+import os
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from backend.config import get_settings
+from backend.core.access_policy import get_policy
+from backend.core.fs_watch import create_watcher
+
+CHECK_INTERVAL = 0.5        # 检查待发送文件是否稳定的间隔（秒）
+DEFAULT_SETTLE = 2.0        # 大小和 mtime 保持不变多久才算写完
+RETRY_INTERVAL = 30         # 通知失败后多久重试
+MAX_BATCH = 1000            # 一次通知最多包含的文件数
+MAX_SENT = 100000           # 记录已发送文件的条目上限
+# 授权令牌闲置有效期：对方的拉取任务可能排在别的任务后面，这批文件本身也要按较低速度算够时间
+PULL_QUEUE_GRACE = 3600     # 预留的排队时间（秒）
+PULL_MIN_RATE = 256 * 1024  # 估算传输时间时假设的最低速度（字节/秒）
+IGNORED_SUFFIXES = (".part", ".tmp", ".crdownload", ".swp", "~")
+
+
+def _ignored(name):
+    return name.startswith(".") or name.endswith(IGNORED_SUFFIXES)
+
+
+class Outbox:
+    def __init__(self, path, peers, password="", dest=""):
+        self.path = path
+        self.peers = [p.rstrip("/") for p in peers]
+        self.password = password
+        self.dest = dest
+        self.pending = {}       # 绝对路径 -> [大小, mtime_ns, 从何时起没有变化]
+        self.sent = {}          # 绝对路径 -> (mtime_ns, 大小)，同一版本不重复发送
+        self.retry = {}         # 设备 -> ([绝对路径], 下次重试时间)
+        self.history = deque(maxlen=50)
+
+    def status(self):
+        return {
+            "path": self.path,
+            "peers": self.peers,
+            "dest": self.dest,
+            "pending": len(self.pending),
+            "sent": len(self.sent),
+            "retrying": {peer: len(files) for peer, (files, _) in self.retry.items()},
+            "history": list(self.history),
+        }
+
+
+class OutboxService(threading.Thread):
+    def __init__(self, settings=None):
+        super().__init__(daemon=True)
+        settings = settings or get_settings()
+        self.root = os.path.abspath(settings["share_path"])
+        self.settle = float(settings.get("outbox_settle_seconds", DEFAULT_SETTLE))
+        self.lock = threading.Lock()
+        self.running = True
+        self.outboxes = []
+        for item in settings.get("outboxes", []):
+            path = os.path.abspath(os.path.join(self.root, item.get("path", "")))
+            if not path.startswith(self.root + os.sep) or not os.path.isdir(path):
+                print(f"⚠️ 发件箱 {item.get('path')} 不存在或不在共享目录内，已忽略")
+                continue
+            if not item.get("peers"):
+                print(f"⚠️ 发件箱 {item.get('path')} 没有配置目标设备，已忽略")
+                continue
+            self.outboxes.append(Outbox(path, item["peers"], item.get("password", ""), item.get("dest", "")))
+        self.watcher = create_watcher([o.path for o in self.outboxes], self.on_events) if self.outboxes else None
+
+    def _outbox_for(self, path):
+        for outbox in self.outboxes:
+            if path.startswith(outbox.path + os.sep):
+                return outbox
+        return None
+
+    def on_events(self, events):
+        """（监视线程）记录新建或修改的文件，等它稳定后再发送"""
+        with self.lock:
+            for kind, path, is_dir in events:
+                if kind == "overflow":
+                    self._rescan()
+                    continue
+                if is_dir or _ignored(os.path.basename(path)):
+                    continue
+                outbox = self._outbox_for(path)
+                if outbox is None:
+                    continue
+                if kind == "deleted":
+                    outbox.pending.pop(path, None)
+                else:
+                    outbox.pending[path] = [None, None, 0.0]
+
+    def _rescan(self):
+        """事件队列溢出后把目录里没发送过的文件都重新检查一遍（调用方持有 self.lock）"""
+        for outbox in self.outboxes:
+            for top, _, names in os.walk(outbox.path):
+                for name in names:
+                    path = os.path.join(top, name)
+                    if not _ignored(name) and path not in outbox.sent:
+                        outbox.pending.setdefault(path, [None, None, 0.0])
+
+    def _settled(self, outbox, now):
+        """（调用方持有 self.lock）取出已经稳定且未发送过的文件"""
+        ready = []
+        for path, state in list(outbox.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del outbox.pending[path]
+                continue
+            if state[0] != st.st_size or state[1] != st.st_mtime_ns:
+                state[:] = [st.st_size, st.st_mtime_ns, now]
+                continue
+            if now - state[2] < self.settle:
+                continue
+            del outbox.pending[path]
+            stamp = (st.st_mtime_ns, st.st_size)
+            if outbox.sent.get(path) == stamp:
+                continue  # 只是属性变化，内容已经发过
+            if len(outbox.sent) >= MAX_SENT:
+                outbox.sent.pop(next(iter(outbox.sent)))
+            outbox.sent[path] = stamp
+            ready.append(path)
+            if len(ready) >= MAX_BATCH:
+                break
+        return ready
+
+    def run(self):
+        if self.watcher is None:
+            return
+        print(f"📤 发件箱已启动：{', '.join(o.path for o in self.outboxes)}")
+        while self.running:
+            time.sleep(CHECK_INTERVAL)
+            now = time.monotonic()
+            for outbox in self.outboxes:
+                with self.lock:
+                    ready = self._settled(outbox, now)
+                    due = [(peer, files) for peer, (files, at) in outbox.retry.items() if at <= now]
+                    for peer, _ in due:
+                        del outbox.retry[peer]
+                if ready:
+                    for peer in outbox.peers:
+                        self.push(outbox, peer, ready)
+                for peer, files in due:
+                    self.push(outbox, peer, [f for f in files if os.path.isfile(f)])
+
+    def push(self, outbox, peer, files):
+        """通知 peer 拉取这批文件；按子目录分组，保持相对于发件箱的目录结构"""
+        from common.api_client import PeerClient, address_for_peer
+
+        if not files:
+            return
+        settings = get_settings()
+        scheme = "https" if settings.get("https_enabled", False) else "http"
+        source_url = address_for_peer(f"{scheme}://localhost:{settings['port']}", peer)
+
+        groups = {}
+        for path in files:
+            subdir = os.path.relpath(os.path.dirname(path), outbox.path)
+            groups.setdefault("" if subdir == "." else subdir, []).append(os.path.relpath(path, self.root))
+
+        client = PeerClient(peer, outbox.password)
+        failed = []
+        for subdir, paths in groups.items():
+            record = {"time": time.time(), "peer": peer, "files": len(paths)}
+            try:
+                # 授权只覆盖这批文件，绑定对方连接本机时的地址；有效期按排队时间和这批文件的大小估算
+                peer_ip = socket.gethostbyname(urlsplit(peer).hostname)
+                token, _ = get_policy().issue_grant(peer_ip, paths, idle=self._grant_idle(paths))
+                job = client.create_pull(source_url, token, paths,
+                                         dest=os.path.join(outbox.dest, subdir).replace(os.sep, "/"))
+                record["job_id"] = job.get("job_id")
+                print(f"📤 已通知 {peer} 拉取 {len(paths)} 个文件")
+            except Exception as e:
+                record["error"] = str(e)
+                failed += [os.path.join(self.root, p) for p in paths]
+                print(f"⚠️ 通知 {peer} 失败，{RETRY_INTERVAL} 秒后重试: {e}")
+            outbox.history.append(record)
+        if failed:
+            with self.lock:
+                previous = outbox.retry.get(peer, ([], 0))[0]
+                outbox.retry[peer] = (list(dict.fromkeys(previous + failed)), time.monotonic() + RETRY_INTERVAL)
+
+    def _grant_idle(self, paths):
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(os.path.join(self.root, path))
+            except OSError:
+                pass
+        return PULL_QUEUE_GRACE + size // PULL_MIN_RATE
+
+    def status(self):
+        with self.lock:
+            return {
+                "watching": self.watcher is not None,
+                "backend": type(self.watcher).__name__ if self.watcher else None,
+                "outboxes": [o.status() for o in self.outboxes],
+            }
+
+    def stop(self):
+        self.running = False
+        if self.watcher is not None:
+            self.watcher.stop()
+
+
+outbox_service = None
+
+
+def start_outboxes():
+    """按配置启动发件箱；没有配置时不创建监视线程"""
+    global outbox_service
+    if outbox_service is None:
+        outbox_service = OutboxService()
+        outbox_service.start()
+    return outbox_service
@@ -0,0 +1,471 @@
+# backend/core/preview.py
+# 文件预览：图片缩略图、文本开头、压缩包目录和音视频/图片的基本信息，让对方不必下载整个文件就能确认内容。
+# 预览在后台线程池里按需生成，结果存进有大小上限的磁盘缓存，以“路径 + 大小 + mtime + 预览参数”为键，
+# 文件改动后键随之变化，旧结果由 LRU 淘汰。
+#
+# 缩略图依赖可选的 Pillow；没有安装时只有缩略图不可用，图片尺寸改为解析文件头获得。
+# 音视频信息优先用系统里的 ffprobe，没有时解析常见容器（MP4/MOV、WAV、MP3 的 ID3 标签）。
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 可选依赖
+    Image = None
+
+THUMB_SIZES = (128, 256, 512)   # 缩略图的长边，只允许这几档以便缓存复用
+TEXT_SIZES = (4, 16, 64)        # 文本预览读取开头多少 KB
+MAX_ENTRIES = 1000              # 压缩包目录最多列出的条目数
+FFPROBE_TIMEOUT = 10
+THUMB_QUALITY = 80
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff", ".ico", ".heic", ".avif"}
+ARCHIVE_EXTENSIONS = {".zip", ".jar", ".apk", ".docx", ".xlsx", ".pptx", ".epub",
+                      ".tar", ".tgz", ".tbz2", ".txz", ".gz", ".bz2", ".xz"}
+MEDIA_EXTENSIONS = {".mp4", ".m4v", ".mov", ".m4a", ".3gp", ".mkv", ".webm", ".avi",
+                    ".mp3", ".wav", ".flac", ".ogg", ".opus", ".aac"}
+MP4_EXTENSIONS = {".mp4", ".m4v", ".mov", ".m4a", ".3gp"}
+
+KINDS = ("auto", "thumb", "text", "archive", "media")
+
+
+class PreviewError(Exception):
+    """文件无法生成这种预览（格式不支持、内容损坏或缺少依赖）"""
+
+
+def preview_kind(abs_path):
+    """kind=auto 时按扩展名选择预览方式：图片给缩略图（没有 Pillow 时给尺寸信息），其余默认按文本处理"""
+    ext = os.path.splitext(abs_path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "thumb" if Image is not None else "media"
+    if ext in ARCHIVE_EXTENSIONS or abs_path.lower().endswith((".tar.gz", ".tar.bz2", ".tar.xz")):
+        return "archive"
+    if ext in MEDIA_EXTENSIONS:
+        return "media"
+    return "text"
+
+
+def normalize_size(kind, size):
+    """把请求的尺寸归到最接近的一档；不同的请求参数共用同一份缓存"""
+    sizes = THUMB_SIZES if kind == "thumb" else TEXT_SIZES if kind == "text" else None
+    if sizes is None:
+        return 0
+    if not size:
+        return sizes[1]
+    return min(sizes, key=lambda s: abs(s - size))
+
+
+# --- 生成器 ---
+def make_thumbnail(abs_path, size):
+    if Image is None:
+        raise PreviewError("服务端没有安装 Pillow，无法生成缩略图")
+    try:
+        with Image.open(abs_path) as img:
+            img.draft("RGB", (size, size))   # JPEG 直接按缩小的比例解码，大照片也很快
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=THUMB_QUALITY)
+            return out.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise PreviewError(f"无法读取图片: {e}")
+
+
+def _decode_text(data, truncated):
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16", errors="replace"), "utf-16"
+    if data.startswith(b"\xef\xbb\xbf"):
+        data = data[3:]
+    if b"\x00" in data:
+        raise PreviewError("不是文本文件")
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError as e:
+        # 截断处可能切在多字节字符中间，去掉结尾不完整的部分再试
+        if truncated and e.start >= len(data) - 3:
+            try:
+                return data[:e.start].decode("utf-8"), "utf-8"
+            except UnicodeDecodeError:
+                pass
+    try:
+        return data.decode("gb18030"), "gb18030"
+    except UnicodeDecodeError:
+        pass
+    raise PreviewError("不是文本文件或无法识别编码")
+
+
+def read_text_head(abs_path, size_kb, file_size):
+    limit = size_kb * 1024
+    with open(abs_path, "rb") as f:
+        data = f.read(limit)
+    truncated = file_size > len(data)
+    text, encoding = _decode_text(data, truncated)
+    return {"kind": "text", "text": text, "encoding": encoding, "truncated": truncated, "size": file_size}
+
+
+def list_archive(abs_path):
+    entries = []
+    if zipfile.is_zipfile(abs_path):
+        try:
+            with zipfile.ZipFile(abs_path) as archive:
+                infos = archive.infolist()
+                for info in infos[:MAX_ENTRIES]:
+                    entries.append({"name": info.filename, "size": info.file_size,
+                                    "compressed": info.compress_size, "is_dir": info.is_dir(),
+                                    "mtime": "%04d-%02d-%02d %02d:%02d:%02d" % info.date_time})
+                return {"kind": "archive", "format": "zip", "entries": entries,
+                        "count": len(infos), "truncated": len(infos) > MAX_ENTRIES}
+        except (zipfile.BadZipFile, OSError) as e:
+            raise PreviewError(f"压缩包已损坏: {e}")
+    try:
+        # 流式读取：tar 没有集中的目录，列到上限就停，不必解压整个文件
+        with tarfile.open(abs_path, "r|*") as archive:
+            truncated = False
+            for member in archive:
+                if len(entries) >= MAX_ENTRIES:
+                    truncated = True
+                    break
+                entries.append({"name": member.name, "size": member.size, "compressed": None,
+                                "is_dir": member.isdir(), "mtime": member.mtime})
+    except (tarfile.TarError, OSError, EOFError) as e:
+        raise PreviewError(f"不支持的压缩格式或文件已损坏: {e}")
+    # 条目数超过上限时总数未知
+    return {"kind": "archive", "format": "tar", "entries": entries,
+            "count": None if truncated else len(entries), "truncated": truncated}
+
+
+def _image_size(f):
+    """不依赖 Pillow，从文件头读出常见图片格式的宽高"""
+    head = f.read(32)
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        return "png", struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif", struct.unpack("<HH", head[6:10])
+    if head.startswith(b"BM"):
+        width, height = struct.unpack("<ii", head[18:26])
+        return "bmp", (width, abs(height))
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        if head[12:16] == b"VP8X":
+            return "webp", (int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1)
+    if head.startswith(b"\xff\xd8"):
+        # 逐段查找 SOF 段，其中记录了图像尺寸
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return "jpeg", None
+            length = struct.unpack(">H", f.read(2))[0]
+            if marker[1] in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height, width = struct.unpack(">xHH", f.read(5))
+                return "jpeg", (width, height)
+            f.seek(length - 2, os.SEEK_CUR)
+    return None, None
+
+
+def _mp4_boxes(f, end):
+    """遍历 [当前位置, end) 之间的 MP4 box，产出 (类型, 数据起点, 数据终点)"""
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        header = f.read(8)
+        size, box_type = struct.unpack(">I4s", header)
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = end - start
+        if size < 8:
+            return
+        yield box_type.decode("latin-1"), f.tell(), start + size
+        f.seek(start + size)
+
+
+def _mp4_info(f, file_size):
+    info = {"format": "mp4"}
+    for box, start, end in _mp4_boxes(f, file_size):
+        if box != "moov":
+            continue
+        f.seek(start)
+        for child, c_start, c_end in _mp4_boxes(f, end):
+            f.seek(c_start)
+            if child == "mvhd":
+                version = f.read(1)[0]
+                f.seek(3 + (16 if version == 1 else 8), os.SEEK_CUR)
+                scale = struct.unpack(">I", f.read(4))[0]
+                duration = struct.unpack(">Q" if version == 1 else ">I", f.read(8 if version == 1 else 4))[0]
+                if scale:
+                    info["duration"] = round(duration / scale, 3)
+            elif child == "trak":
+                for sub, s_start, s_end in _mp4_boxes(f, c_end):
+                    if sub == "tkhd":
+                        # tkhd 最后 8 字节是 16.16 定点数的宽高；音轨为 0
+                        f.seek(s_end - 8)
+                        width, height = struct.unpack(">II", f.read(8))
+                        if width and "width" not in info:
+                            info["width"], info["height"] = width >> 16, height >> 16
+                        f.seek(s_end)
+            f.seek(c_end)
+        break
+    return info
+
+
+def _wav_info(f):
+    head = f.read(12)
+    if not (head.startswith(b"RIFF") and head[8:12] == b"WAVE"):
+        return None
+    info = {"format": "wav"}
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", f.read(16))
+            f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            info.update(channels=fmt[1], sample_rate=fmt[2], bits=fmt[5])
+        elif chunk_id == b"data":
+            if fmt and fmt[3]:
+                info["duration"] = round(size / fmt[3], 3)
+            break
+        else:
+            f.seek(size + (size & 1), os.SEEK_CUR)
+    return info
+
+
+ID3_FRAMES = {"TIT2": "title", "TPE1": "artist", "TALB": "album", "TYER": "year", "TDRC": "year"}
+
+
+def _id3_info(f):
+    head = f.read(10)
+    if not head.startswith(b"ID3"):
+        return None
+    info = {"format": "mp3"}
+    version = head[3]
+    size = _syncsafe(head[6:10])
+    data = f.read(size)
+    pos = 0
+    while pos + 10 <= len(data) and data[pos:pos + 4] != b"\x00\x00\x00\x00":
+        frame_id = data[pos:pos + 4].decode("latin-1")
+        frame_size = _syncsafe(data[pos + 4:pos + 8]) if version >= 4 else struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 10:pos + 10 + frame_size]
+        pos += 10 + frame_size
+        if frame_id in ID3_FRAMES and body:
+            encoding = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(body[0], "latin-1")
+            info[ID3_FRAMES[frame_id]] = body[1:].decode(encoding, errors="replace").strip("\x00 ")
+    return info
+
+
+def _syncsafe(b):
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+
+def _ffprobe_info(abs_path):
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", abs_path],
+            capture_output=True, timeout=FFPROBE_TIMEOUT, check=True).stdout
+        data = json.loads(output)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+    fmt = data.get("format", {})
+    info = {"format": fmt.get("format_name", "")}
+    if fmt.get("duration"):
+        info["duration"] = round(float(fmt["duration"]), 3)
+    if fmt.get("bit_rate"):
+        info["bit_rate"] = int(fmt["bit_rate"])
+    info["streams"] = []
+    for stream in data.get("streams", []):
+        entry = {"type": stream.get("codec_type"), "codec": stream.get("codec_name")}
+        if stream.get("codec_type") == "video":
+            entry.update(width=stream.get("width"), height=stream.get("height"))
+            info.setdefault("width", stream.get("width"))
+            info.setdefault("height", stream.get("height"))
+        elif stream.get("codec_type") == "audio":
+            entry.update(channels=stream.get("channels"), sample_rate=int(stream.get("sample_rate") or 0))
+        info["streams"].append(entry)
+    tags = {k.lower(): v for k, v in fmt.get("tags", {}).items()}
+    for key in ("title", "artist", "album"):
+        if tags.get(key):
+            info[key] = tags[key]
+    return info
+
+
+def media_info(abs_path, file_size):
+    ext = os.path.splitext(abs_path)[1].lower()
+    info = None
+    try:
+        if ext in IMAGE_EXTENSIONS:
+            if Image is not None:
+                with Image.open(abs_path) as img:
+                    info = {"format": (img.format or "").lower(), "width": img.width, "height": img.height,
+                            "mode": img.mode}
+            else:
+                with open(abs_path, "rb") as f:
+                    fmt, dims = _image_size(f)
+                info = {"format": fmt or ext[1:]}
+                if dims:
+                    info["width"], info["height"] = dims
+        else:
+            info = _ffprobe_info(abs_path)
+            if info is None:
+                with open(abs_path, "rb") as f:
+                    if ext in MP4_EXTENSIONS:
+                        info = _mp4_info(f, file_size)
+                    elif ext == ".wav":
+                        info = _wav_info(f)
+                    elif ext == ".mp3":
+                        info = _id3_info(f)
+    except (OSError, ValueError, struct.error, IndexError) as e:
+        raise PreviewError(f"无法读取媒体信息: {e}")
+    if info is None:
+        info = {"format": ext[1:]}  # 不认识的格式，至少告诉对方大小
+    return {"kind": "media", "size": file_size, **info}
+
+
+# --- 缓存和调度 ---
+class PreviewCache:
+    """
+    预览结果的磁盘缓存：缩略图存为 <key>.jpg，其它存为 <key>.json。
+    命中时更新 mtime 作为 LRU 时间，总大小超出预算时淘汰最久未用的结果。
+    """
+
+    def __init__(self, cache_dir, budget_bytes, workers=2):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self.pending = {}    # key -> Future（生成中的预览，用于合并相同的请求）
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)
+                         if name.endswith((".jpg", ".json")))
+
+    @staticmethod
+    def key_for(abs_path, st, kind, size):
+        raw = f"{abs_path}\0{st.st_size}\0{st.st_mtime_ns}\0{kind}\0{size}"
+        return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def path_for(self, key, kind):
+        return os.path.join(self.cache_dir, f"{key}.jpg" if kind == "thumb" else f"{key}.json")
+
+    def lookup(self, key, kind):
+        """返回缓存的结果：缩略图为 bytes，其它为 dict；未命中返回 None"""
+        path = self.path_for(key, kind)
+        if kind == "thumb" and not os.path.exists(path):
+            path = self.path_for(key, "json")   # 生成失败的记录
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data if path.endswith(".jpg") else json.loads(data)
+
+    def request(self, abs_path, st, kind, size):
+        """
+        返回 (key, future)。命中缓存时 future 已完成；否则提交到线程池，相同的请求共用一次生成。
+        结果为缩略图 bytes 或预览 dict；生成失败的结果是 {"error": 原因}，同样缓存，文件不变就不再重试。
+        """
+        key = self.key_for(abs_path, st, kind, size)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return key, future
+            cached = self.lookup(key, kind)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return key, future
+            future = self.pending[key] = self.pool.submit(self._generate, key, abs_path, st.st_size, kind, size)
+        return key, future
+
+    def _generate(self, key, abs_path, file_size, kind, size):
+        try:
+            if kind == "thumb":
+                result = make_thumbnail(abs_path, size)
+            elif kind == "text":
+                result = read_text_head(abs_path, size, file_size)
+            elif kind == "archive":
+                result = list_archive(abs_path)
+            else:
+                result = media_info(abs_path, file_size)
+        except PreviewError as e:
+            result = {"kind": kind, "error": str(e)}
+        except OSError as e:
+            # 读文件失败多半是暂时的（文件正在写、权限变化），不缓存
+            result = {"kind": kind, "error": f"读取文件失败: {e}"}
+        else:
+            self._store(key, "thumb" if isinstance(result, bytes) else "json", result)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return result
+
+    def _store(self, key, kind, result):
+        data = result if isinstance(result, bytes) else json.dumps(result, ensure_ascii=False).encode("utf-8")
+        path = self.path_for(key, kind)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[Preview] 写入缓存失败: {e}")
+            return
+        with self.lock:
+            self.total += len(data)
+            over = self.total > self.budget_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰到预算的 90%，避免每次写入都扫描目录"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith((".jpg", ".json")):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.budget_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self.lock:
+            self.total = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_preview_cache(settings):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_dir = settings.get("preview_cache_dir") or os.path.join(tempfile.gettempdir(), "flydrop-preview-cache")
+            budget = int(settings.get("preview_cache_budget_mb", 256)) * 1024 * 1024
+            _cache = PreviewCache(cache_dir, budget, int(settings.get("preview_workers", 2)))
+        return _cache
@@ -0,0 +1,211 @@
+# backend/core/request_profile.py
+# 按需开启的请求级性能分析：记录鉴权、读配置、遍历目录、压缩、读文件、写 socket 各阶段耗时，
+# 汇总成可直接交给 flamegraph.pl / speedscope 的折叠调用栈。关闭时只多一次属性判断。
+
+import random
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
+
+MAX_STACKS = 5000   # 折叠调用栈条目上限，防止路由过多时无限增长
+
+_current = ContextVar("flydrop_request_trace", default=None)
+_NULL_SPAN = nullcontext()
+
+
+class RequestTrace:
+    """
+    一次请求内的阶段计时；同一请求内各阶段是顺序执行的，调用栈不需要加锁。
+    请求派生的后台线程（见 propagate）有自己的调用栈，只有写入 frames 时加锁
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stack = []
+        self.frames = {}      # 阶段调用栈 -> [总耗时, 子阶段耗时]（秒）
+        self.top_level = 0.0  # 顶层阶段耗时之和
+        self.lock = threading.Lock()
+
+    def enter(self, name):
+        self.stack.append(name)
+        return time.perf_counter()
+
+    def exit(self, started):
+        elapsed = time.perf_counter() - started
+        key = tuple(self.stack)
+        self.stack.pop()
+        with self.lock:
+            frame = self.frames.setdefault(key, [0.0, 0.0])
+            frame[0] += elapsed
+            if self.stack:
+                self.frames.setdefault(tuple(self.stack), [0.0, 0.0])[1] += elapsed
+            else:
+                self.top_level += elapsed
+
+    def self_times(self, total):
+        """返回 [(阶段调用栈, 自身耗时)]，根节点自身耗时记为未归类部分"""
+        result = [((), max(0.0, total - self.top_level))]
+        with self.lock:
+            for key, (spent, children) in self.frames.items():
+                result.append((key, max(0.0, spent - children)))
+        return result
+
+
+class _Branch(RequestTrace):
+    """后台线程里的阶段：与请求共用 frames，调用栈独立；与请求并行执行，不计入请求的顶层耗时"""
+
+    def __init__(self, trace):
+        self.name = trace.name
+        self.started = time.perf_counter()
+        self.stack = []
+        self.frames = trace.frames
+        self.top_level = 0.0
+        self.lock = trace.lock
+
+
+def propagate(target):
+    """
+    包装要在新线程里运行的 target：复制当前上下文，并把 target 内的阶段记入当前请求的分析记录。
+    请求结束后才记录的阶段不再计入
+    """
+    ctx = copy_context()
+    trace = _current.get()
+
+    def run(*args, **kwargs):
+        if trace is not None:
+            _current.set(_Branch(trace))
+        return target(*args, **kwargs)
+
+    return lambda *args, **kwargs: ctx.run(run, *args, **kwargs)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = self.trace.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.trace.exit(self.started)
+        return False
+
+
+def span(name):
+    """在当前请求的分析记录中计时一个阶段；未被采样时返回空上下文"""
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.routes = []          # 路径前缀；为空表示所有接口
+        self.lock = threading.Lock()
+        self.reset()
+
+    def configure(self, enabled, sample_rate=1.0, routes=None):
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.routes = [r for r in (routes or []) if r]
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.stacks = {}      # 折叠调用栈 -> 微秒
+            self.summary = {}     # 路由 -> 统计
+            self.started_at = time.time()
+
+    def should_sample(self, path):
+        if self.routes and not any(path.startswith(r) for r in self.routes):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def start(self, name):
+        trace = RequestTrace(name)
+        return trace, _current.set(trace)
+
+    def finish(self, trace, token, name):
+        _current.reset(token)
+        total = time.perf_counter() - trace.started
+        with self.lock:
+            route = self.summary.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "phases": {}})
+            route["count"] += 1
+            route["total_ms"] += total * 1000
+            route["max_ms"] = max(route["max_ms"], total * 1000)
+            for key, spent in trace.self_times(total):
+                phase = key[-1] if key else "other"
+                route["phases"][phase] = route["phases"].get(phase, 0.0) + spent * 1000
+                stack = ";".join((name,) + key)
+                if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + int(spent * 1_000_000)
+
+    def status(self):
+        with self.lock:
+            routes = {
+                name: {
+                    "count": s["count"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 2),
+                    "max_ms": round(s["max_ms"], 2),
+                    "phases_ms": {k: round(v, 2) for k, v in sorted(s["phases"].items(), key=lambda kv: -kv[1])},
+                }
+                for name, s in self.summary.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "routes": self.routes,
+            "since": self.started_at,
+            "summary": routes,
+        }
+
+    def collapsed(self):
+        """折叠调用栈文本（单位：微秒），每行“帧;帧;帧 数值”"""
+        with self.lock:
+            lines = [f"{stack} {us}" for stack, us in sorted(self.stacks.items()) if us > 0]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+request_profiler = RequestProfiler()
+
+
+class RequestProfileMiddleware:
+    """
+    ASGI 中间件：对被采样的请求建立分析记录，并把响应体写入 socket 的耗时计入 socket_write。
+    流式响应在端点返回后才发送，所以要等最后一个响应体发送完才结束记录。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = request_profiler
+        if not profiler.enabled or scope["type"] != "http" or not profiler.should_sample(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        trace, token = profiler.start(scope["path"])
+
+        async def timed_send(message):
+            if message["type"] != "http.response.body":
+                return await send(message)
+            started = trace.enter("socket_write")
+            try:
+                await send(message)
+            finally:
+                trace.exit(started)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            # 路径参数还原成模板，避免 /zip/jobs/{job_id} 这类路径按 ID 分散
+            path = scope["path"]
+            for key, value in (scope.get("path_params") or {}).items():
+                path = path.replace(str(value), "{" + key + "}")
+            profiler.finish(trace, token, f"{scope['method']} {path}")
@@ -1,16 +1,23 @@
 from fastapi import Request, HTTPException
-from backend.config import get_settings
+from backend.core.access_policy import get_policy
+from backend.core.request_profile import span
+
+SESSION_AUTH = "flydrop_auth"  # WebSocket 会话建立时认证通过，scope 中记下当时的访问策略
+
 
 def verify_request(request: Request):
-    config = get_settings()
-    client_ip = request.client.host
-    allowed_ips = config.get("allowed_ips", [])
-    access_password = config.get("access_password", "")
-    auth = request.headers.get("Authorization")
+    with span("auth"):
+        # 会话内的操作沿用建立连接时的认证，握手令牌到期不影响已建立的会话；
+        # 访问策略变化（改密码、改黑白名单）后重新按握手时的凭据校验
+        if request.scope.get(SESSION_AUTH) is get_policy():
+            return
+        # 策略由配置预先编译，这里只查网段表、校验令牌签名，不读文件
+        resource = (request.url.path, request.query_params.get("path"))  # 授权令牌据此限定范围
+        denied = get_policy().check(request.client.host, request.headers.get("Authorization"), resource)
+        if denied:
+            raise HTTPException(denied[0], detail=denied[1])
 
-    if client_ip in allowed_ips:
-        # ✅ 白名单 IP 直接放行
-        return
 
-    if access_password and auth != access_password:
-        raise HTTPException(403, detail=f"未授权访问（IP {client_ip} 不在白名单，且密码错误）")
\ No newline at end of file
+def bind_session(websocket):
+    """WebSocket 握手认证通过后调用，之后该会话内的 verify_request 直接放行"""
+    websocket.scope[SESSION_AUTH] = get_policy()
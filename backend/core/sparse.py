@@ -0,0 +1,91 @@
+# backend/core/sparse.py
+# 稀疏文件传输：用 SEEK_DATA / SEEK_HOLE 找出有数据的区段，只发送这些区段和空洞表
+#
+# 响应体格式（Content-Type: application/x-flydrop-sparse）：
+#   8 字节大端头部长度 + 头部 JSON {"size", "offset", "extents": [[起点, 长度], ...]}
+#   之后按顺序紧跟每个区段的数据；区段以外的部分都是空洞（全 0）
+
+import errno
+import json
+import os
+import struct
+
+from backend.core.request_profile import span
+
+SPARSE_MEDIA_TYPE = "application/x-flydrop-sparse"
+SPARSE_MIN_SIZE = 1024 * 1024   # 小文件不值得走稀疏模式
+SPARSE_RATIO = 0.8              # 实际占用块数低于逻辑大小的这个比例才认为是稀疏文件
+MIN_HOLE = 64 * 1024            # 小于该值的空洞并入相邻区段，避免区段表过碎
+READ_CHUNK = 1024 * 1024
+
+HEADER_LEN = struct.Struct(">Q")
+
+
+def is_sparse(st):
+    blocks = getattr(st, "st_blocks", None)
+    if blocks is None or not hasattr(os, "SEEK_DATA") or st.st_size < SPARSE_MIN_SIZE:
+        return False
+    return blocks * 512 < st.st_size * SPARSE_RATIO
+
+
+def data_extents(fd, size, start=0):
+    """
+    返回 [start, size) 内有数据的区段 [(起点, 长度)]。
+    系统或文件系统不支持 SEEK_DATA 时把整个范围当作一个区段。
+    """
+    whole = [(start, size - start)] if size > start else []
+    if not hasattr(os, "SEEK_DATA"):
+        return whole
+
+    extents = []
+    pos = start
+    try:
+        while pos < size:
+            try:
+                data = os.lseek(fd, pos, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break  # 后面全是空洞
+                raise
+            if data >= size:
+                break
+            hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+            if extents and data - (extents[-1][0] + extents[-1][1]) < MIN_HOLE:
+                extents[-1] = (extents[-1][0], hole - extents[-1][0])
+            else:
+                extents.append((data, hole - data))
+            pos = hole
+    except OSError:
+        return whole
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+    return extents
+
+
+def sparse_header(size, offset, extents):
+    header = json.dumps({"size": size, "offset": offset, "extents": extents}).encode("utf-8")
+    return HEADER_LEN.pack(len(header)) + header
+
+
+def sparse_stream(abs_path, size, offset=0):
+    """返回 (Content-Length, 响应体生成器)"""
+    with open(abs_path, "rb") as f:
+        extents = data_extents(f.fileno(), size, offset)
+    header = sparse_header(size, offset, extents)
+    length = len(header) + sum(n for _, n in extents)
+
+    def body():
+        yield header
+        with open(abs_path, "rb") as f:
+            for start, n in extents:
+                f.seek(start)
+                while n > 0:
+                    with span("read"):
+                        data = f.read(min(READ_CHUNK, n))
+                    if not data:
+                        # 传输过程中文件被截短，补 0 保持帧格式完整
+                        data = bytes(min(READ_CHUNK, n))
+                    n -= len(data)
+                    yield data
+
+    return length, body()
@@ -0,0 +1,232 @@
+# backend/core/transfer_history.py
+# 传输历史：每次下载（整文件、Range、压缩、稀疏、打包、WebSocket 小文件）结束或中断时记录一行，
+# 包括实际发出的字节数、用时、区间、压缩方式、客户端和结果，存进本地 SQLite，
+# 供本机接口查询最慢/最大的传输和一段时间内的吞吐。
+#
+# 请求线程只把记录放进队列；由一个后台线程批量写入，磁盘慢或数据库被锁时也不会拖慢下载。
+# 队列满时丢弃记录并计数，宁可少记也不阻塞传输。
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+BATCH_SIZE = 500            # 一个事务最多写入的记录数
+QUEUE_LIMIT = 10000         # 待写入的记录上限
+PURGE_INTERVAL = 3600       # 多久清理一次过期记录（秒）
+SLOW_MIN_BYTES = 1024 * 1024  # 查“最慢”时忽略更小的传输，它们的吞吐主要由延迟决定
+
+COMPLETED = "completed"
+ABORTED = "aborted"        # 客户端中途断开
+FAILED = "failed"          # 服务端读文件或打包出错
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,          -- 开始时间（unix 时间戳）
+    duration REAL NOT NULL,         -- 从开始到最后一次发出数据的秒数
+    client TEXT NOT NULL,
+    action TEXT NOT NULL,           -- download / zip / ws
+    path TEXT NOT NULL,
+    range_start INTEGER,            -- 请求的字节区间，整文件为 NULL
+    range_end INTEGER,
+    file_size INTEGER,
+    bytes_sent INTEGER NOT NULL,     -- 实际发出的响应体字节数（压缩后）
+    compression TEXT,               -- gzip / sparse，未压缩为 NULL
+    outcome TEXT NOT NULL,
+    throughput REAL                 -- bytes_sent / duration（B/s）
+);
+CREATE INDEX IF NOT EXISTS transfers_started ON transfers (started);
+CREATE INDEX IF NOT EXISTS transfers_throughput ON transfers (throughput);
+CREATE INDEX IF NOT EXISTS transfers_bytes ON transfers (bytes_sent);
+CREATE INDEX IF NOT EXISTS transfers_client ON transfers (client, started);
+"""
+
+COLUMNS = ("started", "duration", "client", "action", "path", "range_start", "range_end",
+           "file_size", "bytes_sent", "compression", "outcome", "throughput")
+
+
+class TransferRecorder:
+    """
+    跟踪一次传输：包装响应体迭代器时边转发边计数；迭代结束记为完成，
+    被关闭（客户端断开后响应被丢弃）记为中断，抛出异常记为失败。
+    """
+
+    def __init__(self, history, client, action, path, range_start=None, range_end=None,
+                 file_size=None, compression=None):
+        self.history = history
+        self.record = {"client": client, "action": action, "path": path, "range_start": range_start,
+                       "range_end": range_end, "file_size": file_size, "compression": compression}
+        self.started = time.time()
+        self.started_mono = time.monotonic()
+        self.last_sent = self.started_mono
+        self.bytes_sent = 0
+
+    def sent(self, nbytes):
+        self.bytes_sent += nbytes
+        self.last_sent = time.monotonic()
+
+    def finish(self, outcome):
+        # 中断时响应可能过一段时间才被回收，用最后一次发出数据的时间计算用时
+        duration = max(self.last_sent - self.started_mono, 0.0)
+        self.history.add({**self.record, "started": self.started, "duration": duration,
+                          "bytes_sent": self.bytes_sent, "outcome": outcome,
+                          "throughput": self.bytes_sent / duration if duration > 0 else None})
+
+    def wrap(self, chunks):
+        outcome = FAILED
+        try:
+            for chunk in chunks:
+                yield chunk
+                self.sent(len(chunk))
+            outcome = COMPLETED
+        except GeneratorExit:
+            outcome = ABORTED
+            raise
+        finally:
+            self.finish(outcome)
+
+
+class TransferHistory:
+    def __init__(self, db_path, retention_days=30):
+        self.db_path = db_path
+        self.retention = retention_days * 86400
+        self.queue = queue.Queue(QUEUE_LIMIT)
+        self.dropped = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        threading.Thread(target=self._writer, daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")   # 查询和写入互不阻塞
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def recorder(self, client, action, path, **fields):
+        return TransferRecorder(self, client, action, path, **fields)
+
+    def add(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- 后台写入 ---
+    def _writer(self):
+        conn = self._connect()
+        last_purge = 0.0
+        sql = f"INSERT INTO transfers ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany(sql, [tuple(r[c] for c in COLUMNS) for r in batch])
+                    if self.retention and time.time() - last_purge > PURGE_INTERVAL:
+                        conn.execute("DELETE FROM transfers WHERE started < ?", (time.time() - self.retention,))
+                        last_purge = time.time()
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                print(f"⚠️ 写入传输历史失败: {e}")
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """等待队列里的记录写完（查询前调用，刚结束的传输也能查到）"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+
+    # --- 查询 ---
+    def _query(self, sql, params):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _filters(since, client, outcome):
+        clauses, params = ["started >= ?"], [since]
+        if client:
+            clauses.append("client = ?")
+            params.append(client)
+        if outcome:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        return clauses, params
+
+    def top(self, order="slowest", limit=20, since=0.0, client="", outcome=""):
+        """最慢（吞吐最低，忽略小文件）或最大（发出字节最多）的 limit 次传输"""
+        clauses, params = self._filters(since, client, outcome)
+        if order == "slowest":
+            clauses += ["throughput IS NOT NULL", "bytes_sent >= ?"]
+            params.append(SLOW_MIN_BYTES)
+            order_by = "throughput ASC"
+        else:
+            order_by = "bytes_sent DESC"
+        sql = (f"SELECT id, {', '.join(COLUMNS)} FROM transfers WHERE {' AND '.join(clauses)} "
+               f"ORDER BY {order_by} LIMIT ?")
+        return self._query(sql, params + [limit])
+
+    def throughput(self, since=0.0, bucket=300, client=""):
+        """
+        按 bucket 秒分桶的统计：传输次数、发出的字节、平均出口速率（字节 / 桶长），
+        以及单次传输的平均吞吐（字节 / 传输用时之和）
+        """
+        clauses, params = self._filters(since, client, "")
+        sql = (f"SELECT CAST(started / ? AS INTEGER) * ? AS t, COUNT(*) AS transfers, "
+               f"SUM(bytes_sent) AS bytes, SUM(duration) AS busy, "
+               f"SUM(outcome != '{COMPLETED}') AS incomplete "
+               f"FROM transfers WHERE {' AND '.join(clauses)} GROUP BY t ORDER BY t")
+        rows = self._query(sql, [bucket, bucket] + params)
+        for row in rows:
+            row["rate"] = row["bytes"] / bucket
+            row["transfer_throughput"] = row["bytes"] / row["busy"] if row["busy"] else None
+            del row["busy"]
+        return rows
+
+    def summary(self, since=0.0):
+        sql = (f"SELECT COUNT(*) AS transfers, COALESCE(SUM(bytes_sent), 0) AS bytes, "
+               f"SUM(outcome = '{ABORTED}') AS aborted, SUM(outcome = '{FAILED}') AS failed, "
+               f"COUNT(DISTINCT client) AS clients FROM transfers WHERE started >= ?")
+        row = self._query(sql, [since])[0]
+        row["pending"] = self.queue.qsize()
+        row["dropped"] = self.dropped
+        return row
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_transfer_history(settings):
+    """关闭记录时返回 None"""
+    global _history
+    if not settings.get("transfer_history_enabled", True):
+        return None
+    with _history_lock:
+        if _history is None:
+            db_path = settings.get("transfer_history_path") or os.path.join("logs", "transfers.db")
+            _history = TransferHistory(db_path, int(settings.get("transfer_history_days", 30)))
+        return _history
+
+
+def track(settings, chunks, client, action, path, **fields):
+    """包装响应体迭代器，传输结束时记一条历史；关闭记录时原样返回"""
+    history = get_transfer_history(settings)
+    if history is None:
+        return chunks
+    return history.recorder(client, action, path, **fields).wrap(chunks)
@@ -0,0 +1,201 @@
+# backend/core/transfer_jobs.py
+# 设备间直传：客户端让本机直接从另一台设备拉取文件，本机用自己的下载引擎执行，
+# 客户端只查询进度，文件内容不经过客户端
+
+import os
+import threading
+import time
+import uuid
+
+JOB_TTL = 3600          # 结束后保留多久（秒）
+MAX_FILES = 100000      # 单个任务最多展开的文件数
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class PullJob:
+    def __init__(self, source_url, paths, dest_dir, client_ip):
+        self.id = uuid.uuid4().hex
+        self.source_url = source_url
+        self.paths = paths
+        self.dest_dir = dest_dir
+        self.client_ip = client_ip
+        self.state = "listing"    # listing / running / done / failed / canceled
+        self.error = ""
+        self.tasks = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.canceled = False
+        self.speed = 0.0
+        self._last_sample = (0.0, 0)
+
+    def status(self):
+        from common.download_engine import DONE, FAILED, CANCELED
+
+        tasks = list(self.tasks)
+        bytes_total = sum(t.total or (t.size or 0) for t in tasks if t.state != CANCELED)
+        bytes_done = sum(t.downloaded for t in tasks if t.state != CANCELED)
+
+        # 进度查询时顺便计算平滑速度，不依赖下载引擎的快照
+        now = time.time()
+        last_t, last_bytes = self._last_sample
+        if last_t and now - last_t >= 0.2:
+            instant = max(0, bytes_done - last_bytes) / (now - last_t)
+            self.speed = instant if not self.speed else 0.7 * self.speed + 0.3 * instant
+        if not last_t or now - last_t >= 0.2:
+            self._last_sample = (now, bytes_done)
+        if self.state != "running":
+            self.speed = 0.0
+
+        remaining = max(0, bytes_total - bytes_done)
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "source": self.source_url,
+            "dest": self.dest_dir,
+            "files_total": len(tasks),
+            "files_done": sum(1 for t in tasks if t.state == DONE),
+            "files_failed": [t.name for t in tasks if t.state == FAILED],
+            "bytes_total": bytes_total,
+            "bytes_done": bytes_done,
+            "speed": self.speed,
+            "eta": round(remaining / self.speed, 1) if self.speed > 0 else None,
+            "error": self.error,
+        }
+
+
+def get_engine():
+    """本机的下载引擎，第一次直传时才创建（requests 等依赖也在那时才导入）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            from common.download_engine import DownloadEngine
+            _engine = DownloadEngine(max_workers=3, on_task_done=transfer_jobs.task_done)
+        return _engine
+
+
+class TransferJobManager:
+    def __init__(self):
+        self.jobs = {}
+        self.by_task = {}   # 下载任务 ID -> PullJob
+        self.lock = threading.Lock()
+
+    def create(self, source_url, source_token, paths, dest_dir, client_ip):
+        """source_token 为源设备签发给本机的只读授权令牌"""
+        job = PullJob(source_url, paths, dest_dir, client_ip)
+        with self.lock:
+            self._expire()
+            self.jobs[job.id] = job
+        threading.Thread(target=self._start, args=(job, source_token), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _expand(self, client, path):
+        """把选中的路径展开成 (远程路径, 相对保存路径, 大小)；文件夹由对方一次性递归列出"""
+        files = []
+        parent = os.path.dirname(path.rstrip("/"))
+        try:
+            for entry in client.walk(path):
+                if entry["type"] == "file":
+                    files.append((entry["path"], os.path.relpath(entry["path"], parent), entry.get("size")))
+                    if len(files) > MAX_FILES:
+                        raise ValueError(f"文件数超过上限 {MAX_FILES}")
+        except Exception as e:
+            # 列目录返回 404，说明它本身是文件
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status != 404:
+                raise
+            files.append((path, os.path.basename(path), None))
+        return files
+
+    def _start(self, job, source_token):
+        from common.api_client import PeerClient
+        from common.download_engine import DownloadTask
+
+        try:
+            client = PeerClient(job.source_url, grant_token=source_token)
+            engine = get_engine()
+            files = []
+            for path in job.paths:
+                files += self._expand(client, path)
+            if job.canceled:
+                return
+
+            tasks = []
+            for remote_path, rel_save, size in files:
+                save_path = os.path.abspath(os.path.join(job.dest_dir, rel_save))
+                if not save_path.startswith(job.dest_dir):
+                    continue  # 对方返回了越界的路径
+                tasks.append(DownloadTask(client.download_url(remote_path), client.headers, save_path,
+                                          size=size, name=os.path.basename(remote_path),
+                                          client=client, path=remote_path))
+            with self.lock:
+                for task in tasks:
+                    self.by_task[task.id] = job
+                job.tasks = tasks
+                job.state = "running" if tasks else "done"
+                if not tasks:
+                    job.finished_at = time.time()
+            for task in tasks:
+                engine.add(task)
+        except Exception as e:
+            job.state = "failed"
+            job.error = f"读取源设备文件列表失败: {e}"
+            job.finished_at = time.time()
+            print(f"❌ 直传任务 {job.id[:8]} 失败: {e}")
+
+    def task_done(self, task):
+        """下载引擎回调（工作线程中）：所有文件结束后更新任务状态"""
+        with self.lock:
+            job = self.by_task.get(task.id)
+        if job is not None:
+            self._check_finished(job)
+
+    def _check_finished(self, job):
+        from common.download_engine import DONE, FAILED, CANCELED
+
+        with self.lock:
+            if job.finished_at or any(t.state not in (DONE, FAILED, CANCELED) for t in job.tasks):
+                return
+            for t in job.tasks:
+                self.by_task.pop(t.id, None)
+            if job.canceled:
+                job.state = "canceled"
+            elif any(t.state == FAILED for t in job.tasks):
+                job.state = "failed"
+                job.error = next(t.error for t in job.tasks if t.state == FAILED)
+            else:
+                job.state = "done"
+            job.finished_at = time.time()
+        get_engine().clear_finished()  # 任务对象由 PullJob 保留，引擎里不再需要
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.canceled = True
+            tasks = list(job.tasks)
+            if job.state == "listing" or not tasks:
+                job.state = "canceled"
+                job.finished_at = job.finished_at or time.time()
+        if tasks:
+            engine = get_engine()
+            for task in tasks:
+                engine.cancel(task.id)
+            # 排队中的任务被取消时引擎不会回调，这里检查一次
+            self._check_finished(job)
+        return job
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and now - job.finished_at > JOB_TTL:
+                del self.jobs[job_id]
+
+
+transfer_jobs = TransferJobManager()
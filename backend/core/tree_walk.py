@@ -0,0 +1,104 @@
+# backend/core/tree_walk.py
+# 深度列目录：多线程并行 scandir 各个子目录，结果边遍历边产出，调用方可以流式返回
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+WALK_WORKERS = 8
+MAX_ENTRIES = 200000     # 单次遍历最多返回的条目数
+
+
+class TreeWalk:
+    """
+    遍历 abs_path 下的子树。depth 为 1 时只列当前目录，< 0 表示不限深度。
+    符号链接指向的目录会列出但不进入，避免循环。
+    """
+
+    def __init__(self, abs_path, root, depth=-1, show_hidden=True, q="", need_stat=True):
+        self.abs_path = abs_path
+        self.root = root
+        self.depth = depth
+        self.show_hidden = show_hidden
+        self.q = q.lower()
+        self.need_stat = need_stat
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.count = 0
+        self.errors = 0
+        self.truncated = False
+        self.stopped = False
+        self.pool = None
+
+    def _submit(self, dir_path, level):
+        with self.lock:
+            if self.stopped:
+                return
+            self.pending += 1
+        self.pool.submit(self._scan, dir_path, level)
+
+    def _scan(self, dir_path, level):
+        batch = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if self.stopped:
+                        break
+                    if not self.show_hidden and entry.name.startswith("."):
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                        if not is_dir and not entry.is_file():
+                            continue
+                        if is_dir and (self.depth < 0 or level < self.depth) and not entry.is_symlink():
+                            self._submit(entry.path, level + 1)
+                        if self.q and self.q not in entry.name.lower():
+                            continue
+                        item = {
+                            "type": "dir" if is_dir else "file",
+                            "path": os.path.relpath(entry.path, self.root),
+                            "name": entry.name,
+                            "depth": level,
+                        }
+                        if self.need_stat:
+                            st = entry.stat()
+                            item["size"] = 0 if is_dir else st.st_size
+                            item["mtime"] = st.st_mtime
+                        batch.append(item)
+                    except OSError:
+                        continue  # 扫描过程中被删除或无权限
+        except OSError:
+            with self.lock:
+                self.errors += 1
+        finally:
+            self.results.put(batch)
+            with self.lock:
+                self.pending -= 1
+                finished = self.pending == 0
+            if finished:
+                self.results.put(None)
+
+    def batches(self):
+        """按目录产出条目列表；生成器被关闭（客户端断开）时停止遍历"""
+        self.pool = ThreadPoolExecutor(max_workers=WALK_WORKERS)
+        try:
+            self._submit(self.abs_path, 1)
+            while True:
+                batch = self.results.get()
+                if batch is None:
+                    return
+                if not batch:
+                    continue
+                remaining = MAX_ENTRIES - self.count
+                if len(batch) >= remaining:
+                    batch = batch[:remaining]
+                    self.truncated = True
+                self.count += len(batch)
+                yield batch
+                if self.truncated:
+                    return
+        finally:
+            self.stopped = True
+            self.pool.shutdown(wait=False, cancel_futures=True)
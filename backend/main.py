@@ -1,17 +1,40 @@
 # backend/main.py
 
+import sys
+from common.startup_profile import startup_profiler
+
+# 尽早开启，才能统计到后面所有模块的导入耗时
+if "--profile-startup" in sys.argv:
+    startup_profiler.enable()
+
 import uvicorn
 from fastapi import FastAPI
 from backend.config import get_settings, save_settings
-from backend.cert_manager.cert_manager import ensure_https_cert, get_local_ip
 from fastapi.middleware.cors import CORSMiddleware
 import socket
-from backend.core.device_discovery import DeviceDiscoveryService
-from backend.api import clipboard, files, devices
+from backend.api import clipboard, files, devices, profiling, transfers, session, auth, outbox, probe
+from backend.core.request_profile import RequestProfileMiddleware
+from backend.core.access_policy import GrantUseMiddleware
 import threading
+from contextlib import asynccontextmanager
 
 service = None  # 全局广播服务实例
-app = FastAPI(title="FlyDrop")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 设备发现放到后台线程启动，不阻塞端口监听
+    threading.Thread(target=start_discovery, daemon=True).start()
+    if get_settings().get("outboxes"):
+        from backend.core.outbox import start_outboxes
+        threading.Thread(target=start_outboxes, daemon=True).start()
+    startup_profiler.mark("服务就绪")
+    if startup_profiler.enabled:
+        print(startup_profiler.report())
+    yield
+
+
+app = FastAPI(title="FlyDrop", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,15 +42,32 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+# 请求级性能分析，默认关闭，通过本机接口 /api/profile 开启
+app.add_middleware(RequestProfileMiddleware)
+# 授权令牌的下载进行中不因闲置失效
+app.add_middleware(GrantUseMiddleware)
 
 app.include_router(files.router, prefix="/api/files")
 app.include_router(clipboard.router, prefix="/api/clipboard")
 app.include_router(devices.router, prefix="/api")
+app.include_router(profiling.router, prefix="/api")
+app.include_router(transfers.router, prefix="/api/transfers")
+app.include_router(session.router, prefix="/api")
+app.include_router(auth.router, prefix="/api/auth")
+app.include_router(outbox.router, prefix="/api")
+app.include_router(probe.router, prefix="/api")
 
 @app.get("/")
 def root():
     return {"status": "running", "version": "1.0"}
 
+def start_discovery():
+    global service
+    # 启动设备发现服务（UDP 广播 + 接收）
+    from backend.core.device_discovery import DeviceDiscoveryService
+    service = DeviceDiscoveryService(on_device_found)
+    service.start()
+
 # 检查端口是否被占用
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -49,19 +89,25 @@ def on_device_found(name, ip):
     print(f"发现设备：{name} @ {ip}")
 
 if __name__ == "__main__":
-    config = get_settings()
+    startup_profiler.mark("模块导入完成")
+    with startup_profiler.phase("读取配置"):
+        config = get_settings()
     port = config["port"]
 
-    # 启动设备发现服务（UDP 广播 + 接收）
-    service = DeviceDiscoveryService(on_device_found)
-    service.start()
-
     if config.get("https_enabled", False):
-        cert = config.get("cert_path", "cert.pem")
-        key = config.get("key_path", "key.pem")
-        ensure_https_cert(cert, key)
+        # 证书相关依赖只在启用 HTTPS 时才加载
+        with startup_profiler.phase("检查证书"):
+            from backend.cert_manager.cert_manager import ensure_https_cert, tune_tls_context, tls_ciphers_for
+            cert = config.get("cert_path", "cert.pem")
+            key = config.get("key_path", "key.pem")
+            ensure_https_cert(cert, key)
 
-        uvicorn.run("backend.main:app", host="0.0.0.0", port=port,
-                    ssl_certfile=cert, ssl_keyfile=key)
+        # 先加载配置拿到 SSLContext，开启会话票据/复用后再启动
+        with startup_profiler.phase("加载应用"):
+            server_config = uvicorn.Config("backend.main:app", host="0.0.0.0", port=port,
+                                           ssl_certfile=cert, ssl_keyfile=key, ssl_ciphers=tls_ciphers_for(cert))
+            server_config.load()
+            tune_tls_context(server_config.ssl)
+        uvicorn.Server(server_config).run()
     else:
-        uvicorn.run("backend.main:app", host="0.0.0.0", port=port)
\ No newline at end of file
+        uvicorn.run("backend.main:app", host="0.0.0.0", port=port)
@@ -0,0 +1,380 @@
+# common/api_client.py
+# 与某个后端设备通信的客户端，所有请求共用一个 Session（连接池 + TLS 会话复用）
+
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+import urllib3
+
+from common import ws_session
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # 自签名证书
+
+TOKEN_RENEW_MARGIN = 60  # 会话令牌到期前多少秒续期
+
+
+def address_for_peer(url, peer_url):
+    """
+    url 指向本机回环地址时（如“本机”设备），换成对 peer_url 可达的局域网地址，
+    这样把 url 交给另一台设备时它也能连上
+    """
+    parts = urlsplit(url)
+    if parts.hostname not in ("localhost", "127.0.0.1", "::1"):
+        return url
+    peer_host = urlsplit(peer_url).hostname
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((peer_host, 9))  # UDP connect 不发包，只用来选出口地址
+            local_ip = s.getsockname()[0]
+    except OSError:
+        return url
+    netloc = f"{local_ip}:{parts.port}" if parts.port else local_ip
+    return urlunsplit((parts.scheme, netloc, parts.path, parts.query, parts.fragment))
+
+
+class PeerClient:
+    def __init__(self, base_url, access_password="", use_ws_session=False, grant_token=None):
+        self.base_url = base_url.rstrip("/")
+        self.access_password = access_password
+        # 对方签发的只读授权令牌（代为拉取时使用），有它时不登录、不发送密码
+        self.grant_token = grant_token
+        self.session = requests.Session()
+        self.session.verify = False
+        # 可选的 WebSocket 会话：控制请求和小文件复用一条连接，连不上就一直用 HTTP
+        self.use_ws_session = use_ws_session and ws_session.available()
+        self._mux = None
+        self._mux_lock = threading.Lock()
+        # 登录换来的会话令牌；对方是不支持登录的旧版本时每次直接发送密码
+        self._token = None
+        self._token_expires = 0.0
+        self._token_supported = True
+        self._token_lock = threading.Lock()
+
+    def mux(self):
+        """返回已连接的 WebSocket 会话；未启用、连接失败或已断开时返回 None"""
+        if not self.use_ws_session:
+            return None
+        with self._mux_lock:
+            if self._mux is not None and self._mux.closed:
+                self._mux = None
+            if self._mux is None:
+                try:
+                    self._mux = ws_session.PeerSession(self.base_url, self.authorization())
+                except Exception as e:
+                    print(f"[Session] {self.base_url} 不支持 WebSocket 会话，改用 HTTP: {e}")
+                    self.use_ws_session = False
+            return self._mux
+
+    def _renew_mux(self, stale):
+        """
+        会话内的请求返回 403：对方的访问策略变了（如改了密码）或对方重启过，
+        关掉旧会话，用新登录的令牌重新握手
+        """
+        with self._mux_lock:
+            if self._mux is stale:
+                stale.close()
+                self._mux = None
+        self.drop_token()
+        return self.mux()
+
+    def _via_mux(self, op, **args):
+        """通过会话发请求；会话不可用时返回 None，由调用方走 HTTP"""
+        mux = self.mux()
+        for attempt in range(2):
+            if mux is None:
+                return None
+            try:
+                return mux.request(op, **args)
+            except ws_session.SessionError as e:
+                if e.status is None:
+                    return None  # 连接断了，本次退回 HTTP，下次再重连
+                if e.status != 403 or attempt:
+                    raise requests.exceptions.HTTPError(f"{e.status} {e.detail}")
+            mux = self._renew_mux(mux)
+
+    def close_ws_session(self):
+        """关闭 WebSocket 会话并不再使用，之后的请求都走 HTTP"""
+        with self._mux_lock:
+            self.use_ws_session = False
+            if self._mux is not None:
+                self._mux.close()
+                self._mux = None
+
+    def authorization(self):
+        """Authorization 头的值：有效的会话令牌（快到期时重新登录），登录不可用时退回密码"""
+        if self.grant_token:
+            return f"Bearer {self.grant_token}"
+        if not self._token_supported:
+            return self.access_password
+        with self._token_lock:
+            if self._token is None or time.monotonic() > self._token_expires - TOKEN_RENEW_MARGIN:
+                try:
+                    response = self.session.post(self.url("/api/auth/login"),
+                                                 json={"password": self.access_password}, timeout=10)
+                except requests.exceptions.RequestException:
+                    return self.access_password  # 连不上时由真正的请求报错
+                if response.status_code == 404:
+                    self._token_supported = False
+                    return self.access_password
+                if response.status_code != 200:
+                    return self.access_password  # 密码错误等，由真正的请求返回 403
+                data = response.json()
+                self._token = data["token"]
+                self._token_expires = time.monotonic() + data["expires_in"]
+            return f"Bearer {self._token}"
+
+    def drop_token(self):
+        """对方重启后旧令牌失效，下次请求重新登录"""
+        with self._token_lock:
+            self._token = None
+
+    @property
+    def headers(self):
+        return {"Authorization": self.authorization()}
+
+    def url(self, endpoint):
+        return f"{self.base_url}{endpoint}"
+
+    def _send(self, method, endpoint, headers_extra=None, **kwargs):
+        kwargs.setdefault("timeout", 10)
+        extra = headers_extra or {}
+        response = self.session.request(method, self.url(endpoint), headers={**self.headers, **extra}, **kwargs)
+        if response.status_code == 403 and self._token is not None:
+            self.drop_token()
+            response = self.session.request(method, self.url(endpoint), headers={**self.headers, **extra}, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get(self, endpoint, **kwargs):
+        return self._send("GET", endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self._send("POST", endpoint, **kwargs)
+
+    def list_dir(self, path="", offset=0, limit=None, sort="name", desc=False,
+                 show_hidden=True, q="", fields="size"):
+        """分页列目录，返回 (条目列表, 总条目数)"""
+        params = {"path": path, "offset": offset, "sort": sort, "desc": desc,
+                  "show_hidden": show_hidden, "q": q, "fields": fields}
+        if limit:
+            params["limit"] = limit
+        result = self._via_mux("list", **params)
+        if result is not None:
+            return result["entries"], result["total"]
+        response = self.get("/api/files/list", params=params)
+        entries = response.json()
+        total = int(response.headers.get("X-Total-Count", len(entries)))
+        return entries, total
+
+    def list_dir_if_changed(self, etag, path="", offset=0, limit=None, sort="name", desc=False,
+                            show_hidden=True, q="", fields="size"):
+        """
+        带 If-None-Match 的分页列目录：内容没变时返回 None，
+        否则返回 (条目列表, 总条目数, 新的 ETag)
+        """
+        params = {"path": path, "offset": offset, "sort": sort, "desc": desc,
+                  "show_hidden": show_hidden, "q": q, "fields": fields}
+        if limit:
+            params["limit"] = limit
+        result = self._via_mux("list", etag=etag, **params)
+        if result is not None:
+            if result.get("not_modified"):
+                return None
+            return result["entries"], result["total"], result.get("etag")
+        headers = {"If-None-Match": etag} if etag else {}
+        response = self.get("/api/files/list", params=params, headers_extra=headers)
+        if response.status_code == 304:
+            return None
+        entries = response.json()
+        total = int(response.headers.get("X-Total-Count", len(entries)))
+        return entries, total, response.headers.get("ETag")
+
+    def walk(self, path="", depth=None, show_hidden=True, q="", fields="size"):
+        """
+        生成器：逐条返回 path 下的子树条目（depth 为 None 表示不限深度），顺序不固定。
+        服务端边遍历边以 NDJSON 推送；旧版服务端没有 /tree 时退回逐层分页列目录。
+        """
+        params = {"path": path, "show_hidden": show_hidden, "q": q, "fields": fields}
+        if depth is None:
+            params["recursive"] = True
+        else:
+            params["depth"] = depth
+        response = self.session.get(self.url("/api/files/tree"), headers=self.headers,
+                                    params=params, stream=True, timeout=(10, 60))
+        with response:
+            if response.status_code == 404 and response.json().get("detail") == "Not Found":
+                yield from self._walk_paged(path, depth, show_hidden, q, fields)
+                return
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("type") == "end":
+                    if entry.get("truncated"):
+                        raise ValueError("目录条目过多，列表不完整")
+                    return
+                yield entry
+        raise IOError("目录列表传输中断")
+
+    def _walk_paged(self, path, depth, show_hidden, q, fields):
+        stack = [(path, 1)]
+        while stack:
+            current, level = stack.pop()
+            offset, total = 0, None
+            while total is None or offset < total:
+                # 过滤条件只作用于返回的条目，子目录无论是否匹配都要继续展开
+                entries, total = self.list_dir(current, offset=offset, limit=1000,
+                                               show_hidden=show_hidden, fields=fields)
+                if not entries:
+                    break
+                offset += len(entries)
+                for entry in entries:
+                    if entry["type"] == "dir" and (depth is None or level < depth):
+                        stack.append((entry["path"], level + 1))
+                    if not q or q.lower() in entry["name"].lower():
+                        yield dict(entry, depth=level)
+
+    def changes(self, paths, cursor="", timeout=25):
+        """
+        长轮询 paths 中各目录的变化（同时续期对它们的监视），
+        返回 {"cursor", "events", "reset", "stale", "missing"}；没有变化时服务端最多等待 timeout 秒
+        """
+        params = {"paths": list(paths), "cursor": cursor, "timeout": timeout}
+        return self.get("/api/files/changes", params=params, timeout=(10, timeout + 15)).json()
+
+    def stat(self, paths):
+        """批量获取文件大小和修改时间"""
+        result = self._via_mux("stat", paths=list(paths))
+        if result is not None:
+            return result
+        return self.post("/api/files/stat", json={"paths": list(paths)}).json()
+
+    def devices(self):
+        """该设备发现的局域网设备（接口仅限本机访问）"""
+        result = self._via_mux("devices")
+        if result is not None:
+            return result
+        return self.get("/api/devices", timeout=3).json()
+
+    def clipboard_get(self):
+        result = self._via_mux("clipboard_get")
+        if result is not None:
+            return result
+        return self.get("/api/clipboard/get").json()
+
+    def clipboard_set(self, content):
+        result = self._via_mux("clipboard_set", content=content)
+        if result is not None:
+            return result
+        return self.post("/api/clipboard/set", json={"content": content}).json()
+
+    def read_small_file(self, path, write, should_continue=lambda: True):
+        """
+        通过会话读取小文件，返回元数据；会话不可用或文件过大时返回 None（调用方改走 HTTP）。
+        中途断开时抛出 IOError，已经写入的内容需要调用方丢弃。
+        """
+        mux = self.mux()
+        for attempt in range(2):
+            if mux is None:
+                return None
+            try:
+                return mux.read_file(path, write, should_continue)
+            except ws_session.SessionError as e:
+                if e.status == 413:
+                    return None
+                if e.status is None:
+                    raise IOError(e.detail)
+                if e.status != 403 or attempt:
+                    raise requests.exceptions.HTTPError(f"{e.status} {e.detail}")
+            mux = self._renew_mux(mux)  # 错误先于数据返回，重试不会重复写入
+
+    def download_url(self, path):
+        return requests.Request("GET", self.url("/api/files/download"), params={"path": path}).prepare().url
+
+    def file_hash(self, path, piece_size=None, quick=False):
+        """文件整体和分片的 sha256；quick 时对方可只返回大小和抽样分片哈希"""
+        params = {"path": path}
+        if piece_size:
+            params["piece_size"] = piece_size
+        if quick:
+            params["quick"] = 1
+        return self.get("/api/files/hash", params=params, timeout=(10, 600)).json()
+
+    def locate(self, sha256, size, name=""):
+        """在该设备上查找内容相同的文件，返回相对路径或 None"""
+        try:
+            response = self.get("/api/files/locate", params={"sha256": sha256, "size": size, "name": name},
+                                timeout=(5, 60))
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        return response.json().get("path")
+
+    def preview(self, path, kind="auto", size=0, deadline=30):
+        """
+        获取文件预览，返回 (预览类型, 内容)：缩略图为 JPEG bytes，其它为 dict。
+        服务端还在生成时返回 202，按 Retry-After 重试，直到 deadline 秒
+        """
+        params = {"path": path, "kind": kind, "size": size}
+        give_up = time.monotonic() + deadline
+        while True:
+            response = self.get("/api/files/preview", params=params, timeout=(10, 60))
+            if response.status_code != 202:
+                break
+            if time.monotonic() >= give_up:
+                raise TimeoutError("预览生成超时")
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+        kind = response.headers.get("X-Preview-Kind", kind)
+        if response.headers.get("Content-Type", "").startswith("image/"):
+            return kind, response.content
+        return kind, response.json()
+
+    def open_range(self, path, start, end, timeout=(10, 60)):
+        """以流的方式请求文件的 [start, end] 字节区间"""
+        response = self.session.get(self.url("/api/files/download"), params={"path": path},
+                                    headers={**self.headers, "Range": f"bytes={start}-{end}"},
+                                    stream=True, timeout=timeout)
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            raise IOError("服务端不支持 Range 请求")
+        return response
+
+    def create_zip_job(self, paths):
+        """创建后台打包任务，返回任务状态（含 job_id 和文件名）"""
+        return self.post("/api/files/zip/jobs", json={"paths": list(paths)}).json()
+
+    def zip_job_status(self, job_id):
+        return self.get(f"/api/files/zip/jobs/{job_id}", timeout=3).json()
+
+    def cancel_zip_job(self, job_id):
+        response = self.session.delete(self.url(f"/api/files/zip/jobs/{job_id}"), headers=self.headers, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def zip_job_download_url(self, job_id):
+        return self.url(f"/api/files/zip/jobs/{job_id}/download")
+
+    def grant(self, paths, peer):
+        """请该设备为 peer（IP）签发只读授权令牌，peer 凭它代为拉取 paths"""
+        return self.post("/api/auth/grant", json={"paths": list(paths), "peer": peer}).json()["token"]
+
+    def create_pull(self, source_url, source_token, paths, dest=""):
+        """让该设备凭 source_token 直接从 source_url 拉取文件，返回传输任务状态"""
+        return self.post("/api/transfers/pull", json={
+            "source_url": source_url, "source_token": source_token,
+            "paths": list(paths), "dest": dest}).json()
+
+    def pull_status(self, job_id):
+        return self.get(f"/api/transfers/{job_id}", timeout=3).json()
+
+    def cancel_pull(self, job_id):
+        response = self.session.delete(self.url(f"/api/transfers/{job_id}"), headers=self.headers, timeout=5)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,431 @@
+# common/download_engine.py
+# 不依赖 Qt 的下载调度核心：有界工作线程池 + 优先队列 + 暂停/继续/取消
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+
+import requests
+import urllib3
+
+from common.receive_pipeline import receive_to_file, receive_sparse_to_file, DownloadInterrupted, SPARSE_MEDIA_TYPE
+from common.swarm import fetch_swarm, discard_state, has_state, part_matches, CONNECTIONS_PER_SOURCE
+from common.link_profile import Tuning
+from common.ws_session import SMALL_FILE_MAX
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELED = "canceled"
+
+# 排队策略
+ORDER_SIZE = "size"    # 小文件优先
+ORDER_USER = "order"   # 按用户选择顺序
+
+
+class DownloadTask:
+    def __init__(self, url, headers, save_path, size=None, name=None, client=None, path=None, peers=None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.headers = headers or {}
+        self.save_path = save_path
+        self.name = name or os.path.basename(save_path)
+        self.size = size          # 列表接口给出的大小（可能未知）
+        self.total = size or 0    # 响应返回的真实大小
+        self.downloaded = 0
+        self.state = QUEUED
+        self.error = ""
+        self.seq = 0
+        self.started_at = None
+        self.finished_at = None
+        self.speed = 0.0          # 平滑后的速度 (B/s)
+        self._last_sample = (0.0, 0)
+        self._control = None      # None / PAUSED / CANCELED
+        # 多源下载所需：主设备客户端、远程相对路径、其它可能持有该文件的设备
+        self.client = client
+        self.path = path
+        self.peers = peers or []
+        self.sources = None       # 多源下载时每个来源贡献的字节数
+        self.response_time = None # 最近一次请求从发出到收到响应头的时间（秒）
+
+    @property
+    def part_path(self):
+        return self.save_path + ".part"
+
+    def snapshot(self):
+        remaining = max(0, self.total - self.downloaded)
+        eta = remaining / self.speed if self.speed > 0 and self.total else None
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "total": self.total,
+            "downloaded": self.downloaded,
+            "speed": self.speed,
+            "eta": eta,
+            "error": self.error,
+        }
+
+
+def _part_complete(task, response, offset):
+    """416 只说明 .part 不短于对方的文件；核对大小和抽样分片哈希后才当作已下载完"""
+    if has_state(task.part_path):
+        return False  # 多源下载预分配的文件，长度不代表进度
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    expected = int(total) if total.isdigit() else task.size
+    if expected != offset:
+        return False
+    if task.client is None or not task.path:
+        return True
+    return part_matches(task.part_path, task.client.file_hash(task.path, quick=True))
+
+
+def fetch_to_file(task: DownloadTask, should_continue=lambda: True, timeout=(10, 300), fsync_interval=0,
+                  compress=False, chunk_size=None):
+    """
+    把 task.url 下载到 task.save_path。
+    先写入 .part 文件，已有 .part 时用 Range 续传；完成后原子改名。
+    对方判断文件是稀疏文件时返回稀疏格式，只传数据区段，本地重建空洞。
+    compress 为 True 时允许对方对整文件下载做 gzip 压缩（慢速链路上省带宽，续传时不压缩）。
+    """
+    os.makedirs(os.path.dirname(task.save_path) or ".", exist_ok=True)
+
+    offset = os.path.getsize(task.part_path) if os.path.exists(task.part_path) else 0
+    headers = dict(task.headers)
+    if task.client is not None:
+        headers.update(task.client.headers)  # 用客户端当前的会话令牌，排队期间旧令牌可能已过期
+    headers["X-Accept-Sparse"] = "1"
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    elif compress:
+        headers["X-Accept-Compression"] = "gzip"
+
+    response = requests.get(task.url, headers=headers, stream=True, verify=False, timeout=timeout)
+    task.response_time = response.elapsed.total_seconds()
+    try:
+        if response.status_code == 416 and offset:
+            response.close()
+            if _part_complete(task, response, offset):
+                task.total = task.downloaded = offset
+                os.replace(task.part_path, task.save_path)
+                return
+            # .part 和对方的文件对不上（对方文件变短了，或是乱序写入的残留），从头下载
+            discard_state(task.part_path)
+            return fetch_to_file(task, should_continue, timeout, fsync_interval, compress, chunk_size)
+        response.raise_for_status()
+
+        if response.headers.get("content-type", "").startswith(SPARSE_MEDIA_TYPE):
+            task.total = int(response.headers.get("X-Sparse-Size", 0))
+            task.downloaded = offset
+
+            def on_sparse_progress(position):
+                task.downloaded = position
+
+            receive_sparse_to_file(response, task.part_path, should_continue=should_continue,
+                                   on_progress=on_sparse_progress, fsync_interval=fsync_interval)
+            os.replace(task.part_path, task.save_path)
+            return
+
+        if offset and response.status_code != 206:
+            offset = 0  # 服务端忽略了 Range，从头下载
+        if response.headers.get("content-encoding") == "gzip":
+            task.total = int(response.headers.get("X-Decoded-Length", 0))  # 压缩传输，进度按解压后的大小计
+        else:
+            task.total = offset + int(response.headers.get("content-length", 0))
+        task.downloaded = offset
+
+        def on_progress(received):
+            task.downloaded = offset + received
+
+        receive_to_file(response, task.part_path, offset=offset, total=task.total,
+                        should_continue=should_continue, on_progress=on_progress,
+                        fsync_interval=fsync_interval, chunk_size=chunk_size)
+    finally:
+        response.close()
+
+    os.replace(task.part_path, task.save_path)
+
+
+class DownloadEngine:
+    """
+    有界并发的下载队列。
+    状态只在内部更新，界面通过 snapshot() 定时拉取，避免每个数据块都发一次通知。
+    """
+
+    def __init__(self, max_workers=3, order=ORDER_SIZE, on_task_done=None, fsync_interval=0,
+                 swarm_min_size=64 * 1024 * 1024, link_profiles=None):
+        self.max_workers = max(1, int(max_workers))
+        self.order = order
+        self.fsync_interval = fsync_interval  # 每写入多少字节 fsync 一次
+        self.swarm_min_size = swarm_min_size  # 超过该大小且有其它设备时尝试多源下载
+        self.on_task_done = on_task_done  # 回调 (task)，在工作线程中调用
+        self.link_profiles = link_profiles  # 按设备的链路画像，为 None 时所有传输使用固定参数
+        self.tasks = {}     # id -> DownloadTask
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = True
+
+    # --- 队列操作 ---
+    def add(self, task: DownloadTask):
+        with self._cond:
+            task.seq = next(self._seq)
+            task.state = QUEUED
+            self.tasks[task.id] = task
+            self._push(task)
+            self._ensure_workers()
+            self._cond.notify()
+        return task
+
+    def _push(self, task):
+        if self.order == ORDER_SIZE:
+            key = task.size if task.size is not None else float("inf")
+        else:
+            key = task.seq
+        heapq.heappush(self._heap, (key, task.seq, task.id))
+
+    def _ensure_workers(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self):
+        with self._cond:
+            while self._running:
+                while self._heap:
+                    _, _, task_id = heapq.heappop(self._heap)
+                    task = self.tasks.get(task_id)
+                    if task and task.state == QUEUED:  # 已暂停/取消的任务直接丢弃
+                        task.state = RUNNING
+                        task._control = None
+                        return task
+                self._cond.wait()
+            return None
+
+    def _worker_loop(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            self._run_task(task)
+
+    def _run_task(self, task):
+        task.started_at = task.started_at or time.time()
+        try:
+            should_continue = lambda: self._running and task._control is None
+            tuning = self._tuning(task)
+            if not self._try_session(task, should_continue) and not self._try_swarm(task, should_continue, tuning):
+                self._fetch(task, should_continue, tuning)
+            task.state = DONE
+        except DownloadInterrupted:
+            if task._control == CANCELED:
+                task.state = CANCELED
+                self._remove_part(task)
+            else:
+                # 暂停或退出程序：保留 .part，继续（或下次再下载同一文件）时续传
+                task.state = PAUSED
+        except requests.exceptions.RequestException as e:
+            task.state = FAILED
+            task.error = f"网络错误: {e}"
+            print(f"下载失败 [{task.name}]: {task.error}")
+        except Exception as e:
+            task.state = FAILED
+            task.error = str(e)
+            print(f"下载失败 [{task.name}]: {e}")
+        finally:
+            task.finished_at = time.time()
+
+        if task.state in (DONE, FAILED, CANCELED) and self.on_task_done:
+            try:
+                self.on_task_done(task)
+            except Exception as e:
+                print(f"[DownloadEngine] 回调异常: {e}")
+
+    def _try_session(self, task, should_continue):
+        """小文件经由 WebSocket 会话下载，省去单独的 HTTPS 请求；不可用时返回 False"""
+        client = task.client
+        if not (client and task.path and client.use_ws_session):
+            return False
+        if task.size is None or task.size > SMALL_FILE_MAX:
+            return False
+        os.makedirs(os.path.dirname(task.save_path) or ".", exist_ok=True)
+        task.downloaded = 0
+        try:
+            with open(task.part_path, "wb") as f:
+                def write(data):
+                    f.write(data)
+                    task.downloaded += len(data)
+                meta = client.read_small_file(task.path, write, should_continue)
+        except IOError as e:
+            print(f"[Session] {task.name} 会话中断，改用 HTTP: {e}")
+            meta = None
+        except BaseException:
+            self._remove_part(task)
+            raise
+        if meta is None:
+            self._remove_part(task)
+            task.downloaded = 0
+            return False
+        task.total = meta["size"]
+        os.replace(task.part_path, task.save_path)
+        return True
+
+    def _tuning(self, task):
+        if self.link_profiles is None or task.client is None:
+            return Tuning()
+        return self.link_profiles.tuning(task.client)
+
+    def _fetch(self, task, should_continue, tuning):
+        """单连接下载，顺便把实测的响应时间、吞吐和断线记入链路画像"""
+        profiles = self.link_profiles if task.client is not None else None
+        offset = os.path.getsize(task.part_path) if os.path.exists(task.part_path) else 0
+        started = time.monotonic()
+        try:
+            fetch_to_file(task, should_continue=should_continue, timeout=tuning.timeout,
+                          fsync_interval=self.fsync_interval, compress=tuning.compress,
+                          chunk_size=tuning.chunk_size)
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, ConnectionError, TimeoutError):
+            if profiles:
+                profiles.record_failure(task.client)
+            raise
+        if profiles:
+            link = profiles.get(task.client.base_url)
+            if task.response_time is not None:
+                link.observe_rtt(task.response_time)
+            profiles.record_transfer(task.client, task.downloaded - offset, time.monotonic() - started)
+
+    def _try_swarm(self, task, should_continue, tuning):
+        """
+        大文件走分片下载：存在其它设备时多源；链路画像建议多条连接时（高延迟或经常断线），
+        只有一个来源也按分片并行下载。都不满足时返回 False
+        """
+        if not (task.client and task.path) or task.size is None or task.size < self.swarm_min_size \
+                or (not task.peers and tuning.connections < 2):
+            if has_state(task.part_path):
+                discard_state(task.part_path)
+            return False
+        try:
+            swarmed = fetch_swarm(task, task.client, task.peers, should_continue=should_continue,
+                                  connections_per_source=max(CONNECTIONS_PER_SOURCE, tuning.connections),
+                                  min_sources=1 if tuning.connections > 1 else 2)
+        except (DownloadInterrupted, requests.exceptions.RequestException):
+            raise
+        except Exception as e:
+            print(f"[Swarm] {task.name} 多源下载失败，改用单源: {e}")
+            discard_state(task.part_path)  # 单源按 .part 长度续传，不能沿用乱序写入的分片
+            return False
+        if not swarmed and has_state(task.part_path):
+            discard_state(task.part_path)
+        return swarmed
+
+    def _remove_part(self, task):
+        try:
+            discard_state(task.part_path)
+            if os.path.exists(task.part_path):
+                os.remove(task.part_path)
+        except Exception:
+            pass
+
+    def pause(self, task_id):
+        with self._cond:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            if task.state == QUEUED:
+                task.state = PAUSED
+            elif task.state == RUNNING:
+                task._control = PAUSED
+
+    def resume(self, task_id):
+        with self._cond:
+            task = self.tasks.get(task_id)
+            if task and task.state == RUNNING and task._control == PAUSED:
+                task._control = None  # 还没来得及停下，撤销暂停请求
+            elif task and task.state in (PAUSED, FAILED):
+                task.state = QUEUED
+                task.error = ""
+                self._push(task)
+                self._ensure_workers()
+                self._cond.notify()
+
+    def cancel(self, task_id):
+        with self._cond:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            if task.state == RUNNING:
+                task._control = CANCELED
+            elif task.state in (QUEUED, PAUSED, FAILED):
+                task.state = CANCELED
+                self._remove_part(task)
+
+    def pause_all(self):
+        for task_id in list(self.tasks):
+            self.pause(task_id)
+
+    def resume_all(self):
+        for task_id in list(self.tasks):
+            self.resume(task_id)
+
+    def cancel_all(self):
+        for task_id in list(self.tasks):
+            self.cancel(task_id)
+
+    def clear_finished(self):
+        with self._cond:
+            for task_id, task in list(self.tasks.items()):
+                if task.state in (DONE, CANCELED):
+                    del self.tasks[task_id]
+
+    def shutdown(self):
+        """停止所有工作线程；进行中的任务按暂停处理，保留已下载的部分"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    # --- 进度汇总 ---
+    def snapshot(self):
+        """返回 (每项快照列表, 汇总)；同时刷新每个运行中任务的平滑速度"""
+        now = time.time()
+        items = []
+        total = downloaded = 0
+        speed = 0.0
+        counts = {}
+        for task in list(self.tasks.values()):
+            if task.state == RUNNING:
+                last_t, last_bytes = task._last_sample
+                if last_t:
+                    dt = now - last_t
+                    if dt > 0:
+                        instant = max(0, task.downloaded - last_bytes) / dt
+                        task.speed = instant if not task.speed else 0.7 * task.speed + 0.3 * instant
+                task._last_sample = (now, task.downloaded)
+                speed += task.speed
+            else:
+                task.speed = 0.0
+                task._last_sample = (0.0, 0)
+
+            counts[task.state] = counts.get(task.state, 0) + 1
+            if task.state != CANCELED:
+                total += task.total or (task.size or 0)
+                downloaded += task.downloaded
+            items.append(task.snapshot())
+
+        remaining = max(0, total - downloaded)
+        summary = {
+            "total": total,
+            "downloaded": downloaded,
+            "speed": speed,
+            "eta": remaining / speed if speed > 0 else None,
+            "counts": counts,
+        }
+        return items, summary
@@ -0,0 +1,216 @@
+# common/link_profile.py
+# 每台设备的链路画像：往返时间、吞吐和断线率。
+# 来源有两个：切换或发现设备时用 /api/probe 做一次简短的主动探测；每次下载结束后被动记录实测结果。
+# 画像按设备保存在磁盘上，传输开始时据此选择连接数、初始块大小、是否压缩和超时。
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+PROBE_TTL = 600             # 画像多久后重新主动探测（秒）
+PROBE_PINGS = 3             # 测往返时间的空请求次数
+PROBE_SIZES = (256 * 1024, 4 * 1024 * 1024)  # 测吞吐时先小后大，小块已经很慢就不再测大块
+PROBE_FAST = 0.3            # 小块在这个时间内传完才继续测大块（秒）
+PASSIVE_MIN_BYTES = 1024 * 1024  # 太小的传输主要受延迟影响，不计入吞吐
+ALPHA = 0.3                 # 指数平滑系数
+SAVE_DELAY = 5.0
+
+# 调参阈值
+LAN_RTT = 0.01              # 低于此往返时间且几乎不断线视为有线/近距离局域网，单连接即可
+LOSSY = 0.02                # 请求失败比例高于此值时增加连接，单条连接断开不至于拖住整个传输
+SLOW_LINK = 8 * 1024 * 1024 # 吞吐低于此值（B/s）时请求压缩
+MAX_CONNECTIONS = 6
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 8 * 1024 * 1024
+CHUNK_SECONDS = 0.05        # 初始块大小约为 50ms 能收到的数据量
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def default_profile_path():
+    return os.path.join(os.path.expanduser("~"), ".cache", "flydrop", "links.json")
+
+
+def _smooth(old, new):
+    return new if old is None else (1 - ALPHA) * old + ALPHA * new
+
+
+class Tuning:
+    """一次传输使用的参数"""
+
+    def __init__(self, connections=1, chunk_size=None, compress=False, timeout=(10, 300)):
+        self.connections = connections
+        self.chunk_size = chunk_size    # None 表示使用接收管线的默认值
+        self.compress = compress
+        self.timeout = timeout
+
+    def __repr__(self):
+        return (f"Tuning(connections={self.connections}, chunk_size={self.chunk_size}, "
+                f"compress={self.compress}, timeout={self.timeout})")
+
+
+class LinkProfile:
+    def __init__(self, rtt=None, throughput=None, failure_rate=0.0, samples=0, probed_at=0.0):
+        self.rtt = rtt                  # 往返时间（秒）
+        self.throughput = throughput    # 单连接吞吐（B/s）
+        self.failure_rate = failure_rate  # 请求失败（断线、超时）比例，作为丢包的近似
+        self.samples = samples
+        self.probed_at = probed_at      # 上次主动探测的时间（time.time）
+        self.probing = False
+
+    def to_dict(self):
+        return {"rtt": self.rtt, "throughput": self.throughput, "failure_rate": self.failure_rate,
+                "samples": self.samples, "probed_at": self.probed_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("rtt"), data.get("throughput"), data.get("failure_rate", 0.0),
+                   data.get("samples", 0), data.get("probed_at", 0.0))
+
+    # --- 测量 ---
+    def observe_rtt(self, seconds):
+        # 响应时间里含有服务端处理时间，只会偏大，所以新样本更小时直接采用
+        self.rtt = seconds if self.rtt is None or seconds < self.rtt else _smooth(self.rtt, seconds)
+
+    def observe_transfer(self, nbytes, seconds):
+        self.failure_rate = _smooth(self.failure_rate, 0.0)
+        self.samples += 1
+        if nbytes >= PASSIVE_MIN_BYTES and seconds > 0:
+            self.throughput = _smooth(self.throughput, nbytes / seconds)
+
+    def observe_failure(self):
+        self.failure_rate = _smooth(self.failure_rate, 1.0)
+        self.samples += 1
+
+    # --- 调参 ---
+    def tuning(self):
+        if self.rtt is None:
+            return Tuning()  # 还没有任何测量，沿用原来的默认值
+        rtt, lossy = self.rtt, self.failure_rate > LOSSY
+        if rtt < LAN_RTT and not lossy:
+            connections = 1
+        else:
+            # 延迟越高单条 TCP 连接越难跑满带宽；经常断线时多条连接互相兜底
+            connections = min(MAX_CONNECTIONS, max(2, round(rtt / 0.025) + (1 if lossy else 0)))
+        chunk_size = None
+        if self.throughput:
+            target = self.throughput * CHUNK_SECONDS
+            chunk_size = MIN_CHUNK
+            while chunk_size < target and chunk_size < MAX_CHUNK:
+                chunk_size *= 2
+        compress = bool(self.throughput) and self.throughput < SLOW_LINK
+        connect = min(15.0, max(3.0, rtt * 20))
+        read = min(120.0, max(30.0, rtt * 100))  # 连续这么久收不到数据才算断线，比固定 300 秒更早重试
+        return Tuning(connections, chunk_size, compress, (connect, read))
+
+
+class LinkProfiles:
+    """所有设备的画像，以设备地址为键"""
+
+    def __init__(self, path=None):
+        self.path = path or default_profile_path()
+        self.lock = threading.Lock()
+        self.profiles = {}
+        self._save_timer = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.profiles = {url: LinkProfile.from_dict(d) for url, d in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, base_url):
+        with self.lock:
+            profile = self.profiles.get(base_url)
+            if profile is None:
+                profile = self.profiles[base_url] = LinkProfile()
+            return profile
+
+    def tuning(self, client):
+        """为 client 对应设备的下一次传输选择参数；画像过期时顺便在后台重新探测"""
+        self.ensure_probed(client)
+        return self.get(client.base_url).tuning()
+
+    def record_transfer(self, client, nbytes, seconds):
+        self.get(client.base_url).observe_transfer(nbytes, seconds)
+        self._schedule_save()
+
+    def record_failure(self, client):
+        self.get(client.base_url).observe_failure()
+        self._schedule_save()
+
+    # --- 主动探测 ---
+    def ensure_probed(self, client):
+        """画像不存在或已过期时在后台探测，不阻塞调用方"""
+        profile = self.get(client.base_url)
+        with self.lock:
+            if profile.probing or time.time() - profile.probed_at < PROBE_TTL:
+                return
+            profile.probing = True
+        threading.Thread(target=self._probe, args=(client, profile), daemon=True).start()
+
+    def _probe(self, client, profile):
+        try:
+            probe_link(client, profile)
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                print(f"[LinkProfile] 探测 {client.base_url} 失败: {e}")
+            # 旧版本没有 /api/probe，只靠被动测量
+        except Exception as e:
+            profile.observe_failure()
+            print(f"[LinkProfile] 探测 {client.base_url} 失败: {e}")
+        finally:
+            profile.probed_at = time.time()
+            profile.probing = False
+            self._schedule_save()
+
+    # --- 保存 ---
+    def _schedule_save(self):
+        with self.lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        with self.lock:
+            self._save_timer = None
+            data = json.dumps({url: p.to_dict() for url, p in self.profiles.items()}, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[LinkProfile] 保存链路画像失败: {e}")
+
+
+def probe_link(client, profile):
+    """主动探测：几次空请求测往返时间，再下载一小段随机数据测吞吐"""
+    rtts = []
+    for _ in range(PROBE_PINGS):
+        response = client.get("/api/probe", params={"size": 0}, timeout=(10, 10))
+        rtts.append(response.elapsed.total_seconds())
+    profile.observe_rtt(min(rtts))
+
+    for size in PROBE_SIZES:
+        started = time.monotonic()
+        response = client.get("/api/probe", params={"size": size}, timeout=(10, 30))
+        elapsed = time.monotonic() - started - profile.rtt   # 扣掉建立请求的一个往返
+        received = len(response.content)
+        if elapsed > 0:
+            profile.throughput = _smooth(profile.throughput, received / elapsed)
+        if elapsed > PROBE_FAST:
+            break
+
+
+def get_link_profiles(path=None):
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = LinkProfiles(path)
+        return _profiles
@@ -0,0 +1,282 @@
+# common/receive_pipeline.py
+# 高吞吐接收管线：进程内共享的大缓冲区 + readinto 读取 + 后台写盘线程 + 预分配
+
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+MIN_CHUNK = 256 * 1024          # 自适应块大小下限
+MAX_CHUNK = 8 * 1024 * 1024     # 自适应块大小上限（也是每个缓冲区的容量）
+POOL_DEPTH = 4                  # 每个下载的缓冲区数量：1 个在读，其余排队写盘
+POOL_KEEP = 8                   # 进程内最多保留多少个空闲的满尺寸缓冲区，供后续下载复用
+FAST_READ = 0.01                # 一次读满耗时低于这个值就加大块
+SLOW_READ = 0.25                # 高于这个值就减小块，保证取消和进度及时
+
+SPARSE_MEDIA_TYPE = "application/x-flydrop-sparse"   # 格式见 backend/core/sparse.py
+SPARSE_HEADER_LEN = struct.Struct(">Q")
+
+
+class DownloadInterrupted(Exception):
+    """用于标记下载中断的异常"""
+    pass
+
+
+def preallocate(fd, offset, length):
+    """
+    尽量为即将写入的区间预留磁盘空间，减少碎片和元数据更新。
+    Linux 上用 FALLOC_FL_KEEP_SIZE，不改变文件长度（续传依赖 .part 的长度）。
+    """
+    if length <= 0 or not sys.platform.startswith("linux"):
+        return False
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        FALLOC_FL_KEEP_SIZE = 0x01
+        ret = libc.fallocate(ctypes.c_int(fd), ctypes.c_int(FALLOC_FL_KEEP_SIZE),
+                             ctypes.c_longlong(offset), ctypes.c_longlong(length))
+        return ret == 0
+    except Exception:
+        return False
+
+
+def punch_hole(fd, offset, length):
+    """释放 [offset, offset+length) 占用的磁盘块（读出为 0），文件长度不变"""
+    if length <= 0 or not sys.platform.startswith("linux"):
+        return False
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        FALLOC_FL_KEEP_SIZE = 0x01
+        FALLOC_FL_PUNCH_HOLE = 0x02
+        ret = libc.fallocate(ctypes.c_int(fd), ctypes.c_int(FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE),
+                             ctypes.c_longlong(offset), ctypes.c_longlong(length))
+        return ret == 0
+    except Exception:
+        return False
+
+
+_spare = []                     # 空闲的 MAX_CHUNK 缓冲区，所有下载线程共享
+_spare_lock = threading.Lock()
+
+
+def _acquire_buffer(size):
+    """满尺寸的缓冲区优先从共享池取；小文件只分配刚好够用的小缓冲区"""
+    if size >= MAX_CHUNK:
+        with _spare_lock:
+            if _spare:
+                return _spare.pop()
+        return bytearray(MAX_CHUNK)
+    return bytearray(size)
+
+
+def _release_buffer(buf):
+    if len(buf) == MAX_CHUNK:
+        with _spare_lock:
+            if len(_spare) < POOL_KEEP:
+                _spare.append(buf)
+
+
+def buffer_size_for(expected):
+    """按剩余长度选择缓冲区大小；长度未知时用满尺寸"""
+    if expected is None:
+        return MAX_CHUNK
+    return min(MAX_CHUNK, max(expected, 4096))
+
+
+class WriteBehind:
+    """
+    后台写盘线程。网络线程把填满的缓冲区交过来后立刻去读下一块，
+    写完的缓冲区回到池子里复用，不会为每个块分配新的 bytes；
+    下载结束后满尺寸的缓冲区归还到进程内共享池，下一个下载直接使用。
+    """
+
+    def __init__(self, f, buffer_size=MAX_CHUNK, depth=POOL_DEPTH, fsync_interval=0):
+        self.f = f
+        self.fsync_interval = fsync_interval  # 每写入多少字节 fsync 一次，0 表示不做
+        self.buffer_size = buffer_size
+        self.free = queue.Queue()
+        for _ in range(depth):
+            self.free.put(_acquire_buffer(buffer_size))
+        self.pending = queue.Queue()
+        self.error = None
+        self.written = 0
+        self._since_sync = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def get_buffer(self):
+        buf = self.free.get()
+        if self.error:
+            raise self.error
+        return buf
+
+    def submit(self, buf, n, pos=None):
+        """pos 不为 None 时先 seek 到该位置再写（稀疏文件跳过空洞）"""
+        if self.error:
+            raise self.error
+        self.pending.put((buf, n, pos))
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            buf, n, pos = item
+            try:
+                if not self.error:
+                    if pos is not None:
+                        self.f.seek(pos)
+                    view = memoryview(buf)[:n]
+                    while view:  # 无缓冲写入可能只写了一部分
+                        view = view[self.f.write(view):]
+                    self.written += n
+                    self._since_sync += n
+                    if self.fsync_interval and self._since_sync >= self.fsync_interval:
+                        self.f.flush()
+                        os.fsync(self.f.fileno())
+                        self._since_sync = 0
+            except Exception as e:
+                self.error = e
+            finally:
+                self.free.put(buf)
+
+    def close(self):
+        """等待所有缓冲区写完；写盘出错时在调用线程里重新抛出"""
+        self.pending.put(None)
+        self.thread.join()
+        while not self.free.empty():
+            _release_buffer(self.free.get_nowait())
+        if self.error:
+            raise self.error
+        if self.fsync_interval and self._since_sync:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+
+def get_reader(response):
+    """
+    优先直接对底层 http.client 响应做 readinto（无中间 bytes 对象）；
+    有 Content-Encoding 时交给 urllib3 解码。
+    """
+    raw = response.raw
+    fp = getattr(raw, "_fp", None)
+    if not response.headers.get("content-encoding") and fp is not None and hasattr(fp, "readinto"):
+        return fp.readinto
+    raw.decode_content = True  # requests 以不解码的方式打开响应，这里要求 urllib3 解压
+    return raw.readinto
+
+
+def receive_to_file(response, path, offset=0, total=0, should_continue=lambda: True,
+                    on_progress=None, fsync_interval=0, chunk_size=None):
+    """
+    把流式响应写入 path。offset > 0 时以追加方式续传。
+    on_progress(received) 在网络线程里按块回调；返回本次接收的字节数。
+    chunk_size 是初始块大小（按链路画像估算），之后仍按实际读取速度自动调整。
+    """
+    readinto = get_reader(response)
+    received = 0
+    expected = total - offset if total > offset else None
+    buffer_size = buffer_size_for(expected)
+    chunk = min(chunk_size or MIN_CHUNK, buffer_size)
+
+    with open(path, "ab" if offset else "wb", buffering=0) as f:
+        if expected:
+            preallocate(f.fileno(), offset, expected)
+
+        writer = WriteBehind(f, buffer_size=buffer_size, fsync_interval=fsync_interval)
+        try:
+            while True:
+                if not should_continue():
+                    raise DownloadInterrupted("Download manually stopped")
+
+                buf = writer.get_buffer()
+                view = memoryview(buf)
+                started = time.monotonic()
+                n = readinto(view[:chunk])
+                elapsed = time.monotonic() - started
+                view.release()
+
+                if not n:
+                    writer.free.put(buf)
+                    break
+                writer.submit(buf, n)
+                received += n
+                if on_progress:
+                    on_progress(received)
+
+                # 根据一次读满所需时间调整块大小
+                if n == chunk and elapsed < FAST_READ and chunk < buffer_size:
+                    chunk = min(chunk * 2, buffer_size)
+                elif elapsed > SLOW_READ and chunk > MIN_CHUNK:
+                    chunk //= 2
+        finally:
+            writer.close()
+
+    # 直接对底层响应 readinto 时 urllib3 不再检查 Content-Length，对方提前断开也会读到 0；
+    # 长度不符就报错，保留 .part 等待续传，不能当作下载完成
+    if expected is not None and received != expected:
+        raise IOError(f"连接提前关闭（收到 {offset + received}/{total} 字节）")
+    return received
+
+
+def _read_exact(readinto, view):
+    got = 0
+    while got < len(view):
+        n = readinto(view[got:])
+        if not n:
+            raise IOError("连接提前关闭")
+        got += n
+
+
+def receive_sparse_to_file(response, path, should_continue=lambda: True, on_progress=None, fsync_interval=0):
+    """
+    接收稀疏格式的响应：只写入数据区段，空洞通过 seek 跳过，最后截到完整长度并打洞。
+    .part 的长度始终等于最后写到的位置，中断后仍可按长度续传。
+    on_progress(position) 回调的是已完成的逻辑位置；返回头部信息。
+    """
+    readinto = get_reader(response)
+    size_buf = bytearray(SPARSE_HEADER_LEN.size)
+    _read_exact(readinto, memoryview(size_buf))
+    header_buf = bytearray(SPARSE_HEADER_LEN.unpack(size_buf)[0])
+    _read_exact(readinto, memoryview(header_buf))
+    header = json.loads(header_buf.decode("utf-8"))
+    size, offset = header["size"], header["offset"]
+
+    with open(path, "r+b" if offset and os.path.exists(path) else "wb", buffering=0) as f:
+        os.ftruncate(f.fileno(), offset)  # 丢弃续传位置之后可能残留的内容
+        writer = WriteBehind(f, fsync_interval=fsync_interval)
+        try:
+            for start, length in header["extents"]:
+                pos = start
+                while pos < start + length:
+                    if not should_continue():
+                        raise DownloadInterrupted("Download manually stopped")
+                    buf = writer.get_buffer()
+                    view = memoryview(buf)
+                    n = readinto(view[:min(MAX_CHUNK, start + length - pos)])
+                    view.release()
+                    if not n:
+                        writer.free.put(buf)
+                        raise IOError("连接提前关闭")
+                    writer.submit(buf, n, pos)
+                    pos += n
+                    if on_progress:
+                        on_progress(pos)
+        finally:
+            writer.close()
+
+        # 尾部空洞：扩展到完整长度；之前普通下载预分配过的块在空洞处释放掉
+        os.ftruncate(f.fileno(), size)
+        pos = offset
+        for start, length in header["extents"] + [[size, 0]]:
+            punch_hole(f.fileno(), pos, start - pos)
+            pos = start + length
+    if on_progress:
+        on_progress(size)
+    return header
@@ -0,0 +1,90 @@
+# common/startup_profile.py
+# --profile-startup：统计各模块导入耗时和启动各阶段耗时（前后端共用）
+
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+REPORT_TOP = 15          # 报告中列出的最慢导入数量
+REPORT_MIN_MS = 1.0      # 低于该耗时的导入不列出
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.t0 = time.perf_counter()
+        self.phases = []      # (名称, 开始偏移 ms, 耗时 ms)
+        self.marks = []       # (名称, 偏移 ms)
+        self.imports = {}     # 模块名 -> [累计 ms, 自身 ms]
+        self._local = threading.local()
+        self._original_import = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def disable(self):
+        if self.enabled and self._original_import:
+            builtins.__import__ = self._original_import
+        self.enabled = False
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules and not fromlist:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        started = time.perf_counter()
+        stack.append(0.0)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            key = ("." * level) + name
+            record = self.imports.setdefault(key, [0.0, 0.0])
+            record[0] += elapsed
+            record[1] += max(0.0, elapsed - children)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases.append((name, (started - self.t0) * 1000, (now - started) * 1000))
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, (time.perf_counter() - self.t0) * 1000))
+
+    def report(self):
+        lines = ["", "⏱ 启动耗时分析 (ms)", "-" * 48, "阶段:"]
+        for name, offset, duration in self.phases:
+            lines.append(f"  {name:<24} {duration:>9.1f}   (起始 +{offset:.1f})")
+        for name, offset in self.marks:
+            lines.append(f"  ● {name:<22} +{offset:.1f}")
+
+        slow = sorted(self.imports.items(), key=lambda kv: kv[1][0], reverse=True)
+        lines.append(f"最慢的导入 (累计 / 自身)，共统计 {len(self.imports)} 个:")
+        for name, (cumulative, own) in slow[:REPORT_TOP]:
+            if cumulative < REPORT_MIN_MS:
+                break
+            lines.append(f"  {name:<32} {cumulative:>9.1f} {own:>9.1f}")
+        lines.append("-" * 48)
+        return "\n".join(lines)
+
+
+startup_profiler = StartupProfiler()
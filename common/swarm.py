@@ -0,0 +1,376 @@
+# common/swarm.py
+# 多源下载：从所有持有相同文件的设备同时拉取不同分片，逐片校验，自动向快的来源倾斜
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common.receive_pipeline import get_reader, preallocate, DownloadInterrupted
+
+CONNECTIONS_PER_SOURCE = 2   # 每个来源的并发连接数
+MAX_SOURCE_FAILURES = 3      # 连续失败多少次后放弃该来源
+SLOW_SOURCE_RATIO = 0.25     # 速度低于最快来源的这个比例视为慢来源
+RETRY_WAIT = 0.2
+STATE_SUFFIX = ".pieces"     # .part 旁边记录已完成分片的位图，中断后据此续传
+
+
+class Source:
+    """一个可提供该文件的设备"""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.label = client.base_url
+        self.speed = 0.0       # 平滑后的速度 (B/s)
+        self.bytes = 0
+        self.failures = 0
+        self.disabled = False
+
+    def record(self, nbytes, elapsed):
+        self.bytes += nbytes
+        self.failures = 0
+        instant = nbytes / max(elapsed, 1e-6)
+        self.speed = instant if not self.speed else 0.6 * self.speed + 0.4 * instant
+
+
+def _same_file(meta, info):
+    """
+    判断对方的文件是否与 primary 相同。对方已算过整体哈希时直接比较；
+    否则只比较大小和抽样分片（首尾两片），其余分片下载时逐片校验，不同的来源会因校验失败被放弃
+    """
+    if info.get("size") != meta["size"] or info.get("piece_size") != meta["piece_size"]:
+        return False
+    if info.get("sha256"):
+        return info["sha256"] == meta["sha256"]
+    samples = info.get("samples") or {}
+    return bool(samples) and all(
+        int(index) < len(meta["pieces"]) and meta["pieces"][int(index)] == digest
+        for index, digest in samples.items()
+    )
+
+
+def find_sources(primary, path, peers, piece_size=None):
+    """
+    以 primary 上的文件为准，找出其它设备上内容相同的副本。
+    先按相同的相对路径快速比对（不让对方读完整个文件），再让对方按 sha256 查找；返回 (哈希信息, 来源列表)。
+    """
+    meta = primary.file_hash(path, piece_size)
+    sources = [Source(primary, path)]
+    name = os.path.basename(path)
+
+    def probe(peer):
+        try:
+            if _same_file(meta, peer.file_hash(path, meta["piece_size"], quick=True)):
+                return Source(peer, path)
+        except Exception:
+            pass
+        try:
+            rel_path = peer.locate(meta["sha256"], meta["size"], name)
+            if rel_path:
+                return Source(peer, rel_path)
+        except Exception:
+            pass
+        return None
+
+    if peers:
+        with ThreadPoolExecutor(max_workers=min(8, len(peers))) as pool:
+            sources += [s for s in pool.map(probe, peers) if s]
+    return meta, sources
+
+
+def _state_path(part_path):
+    return part_path + STATE_SUFFIX
+
+
+def load_state(part_path, meta):
+    """读取上次中断时完成的分片；.part 或记录缺失、文件已变化时返回空集合"""
+    try:
+        with open(_state_path(part_path), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if (state.get("sha256") != meta["sha256"] or state.get("size") != meta["size"]
+                or state.get("piece_size") != meta["piece_size"]):
+            return set()
+        if os.path.getsize(part_path) != meta["size"]:
+            return set()
+        bitmap = bytes.fromhex(state["bitmap"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return set()
+    count = len(meta["pieces"])
+    return {i for i in range(count) if i // 8 < len(bitmap) and bitmap[i // 8] >> (i % 8) & 1}
+
+
+def save_state(part_path, meta, done):
+    bitmap = bytearray((len(meta["pieces"]) + 7) // 8)
+    for i in done:
+        bitmap[i // 8] |= 1 << (i % 8)
+    state = {"sha256": meta["sha256"], "size": meta["size"], "piece_size": meta["piece_size"],
+             "bitmap": bitmap.hex()}
+    tmp = _state_path(part_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, _state_path(part_path))
+
+
+def has_state(part_path):
+    """.part 是否由多源下载乱序写入（旁边有分片记录）"""
+    return os.path.exists(_state_path(part_path))
+
+
+def discard_state(part_path, remove_part=True):
+    """删除分片记录；remove_part 时连同 .part 一起删除（不论有没有记录）"""
+    paths = [_state_path(part_path), part_path] if remove_part else [_state_path(part_path)]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def part_matches(part_path, info):
+    """
+    核对本地文件与对方 /api/files/hash 的结果：大小一致，且抽样分片（或全部分片中的首尾两片）哈希相同
+    """
+    size = os.path.getsize(part_path)
+    if info.get("size") != size:
+        return False
+    piece_size = info["piece_size"]
+    expected = info.get("samples")
+    if expected is None:
+        pieces = info.get("pieces") or []
+        expected = {str(i): pieces[i] for i in {0, len(pieces) - 1} if 0 <= i < len(pieces)}
+    with open(part_path, "rb") as f:
+        for index, digest in expected.items():
+            f.seek(int(index) * piece_size)
+            if hashlib.sha256(f.read(piece_size)).hexdigest() != digest:
+                return False
+    return True
+
+
+class SwarmDownload:
+    def __init__(self, meta, sources, part_path, connections_per_source=CONNECTIONS_PER_SOURCE,
+                 should_continue=lambda: True, on_progress=None, done=()):
+        self.meta = meta
+        self.size = meta["size"]
+        self.piece_size = meta["piece_size"]
+        self.hashes = meta["pieces"]
+        self.sources = sources
+        self.part_path = part_path
+        self.connections = max(1, connections_per_source)
+        self.should_continue = should_continue
+        self.on_progress = on_progress
+
+        self.done = set(done)  # 续传时已写入 .part 的分片
+        self.pending = deque(i for i in range(len(self.hashes)) if i not in self.done)
+        self.in_flight = {}    # 分片 -> [(来源, 开始时间)]
+        self.done_bytes = sum(self.piece_range(i)[1] - self.piece_range(i)[0] + 1 for i in self.done)
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.fd = None
+        self.stopped = False
+        self.error = None      # 写入 .part 失败（如磁盘满）时记录，结束后抛出
+
+    def piece_range(self, index):
+        start = index * self.piece_size
+        return start, min(self.size, start + self.piece_size) - 1
+
+    # --- 调度 ---
+    def _finished(self):
+        return len(self.done) == len(self.hashes)
+
+    def _alive(self):
+        return [s for s in self.sources if not s.disabled]
+
+    def _take(self, source):
+        """为 source 挑选下一个分片；没有可做的工作时返回 None"""
+        with self.cond:
+            while True:
+                if self.stopped or self._finished() or source.disabled:
+                    return None
+                best = max((s.speed for s in self._alive()), default=0.0)
+                slow = best > 0 and source.speed and source.speed < best * SLOW_SOURCE_RATIO
+
+                # 慢来源只在队列足够长时领取分片，避免拖住最后几片
+                if self.pending and (not slow or len(self.pending) > len(self._alive()) * self.connections):
+                    index = self.pending.popleft()
+                    self.in_flight.setdefault(index, []).append((source, time.monotonic()))
+                    return index
+
+                # 收尾阶段：重复请求别的来源正在下载、耗时最久的分片
+                if not self.pending and not slow:
+                    candidates = [
+                        (min(t for _, t in owners), index)
+                        for index, owners in self.in_flight.items()
+                        if index not in self.done and all(s is not source for s, _ in owners)
+                    ]
+                    if candidates:
+                        _, index = min(candidates)
+                        self.in_flight[index].append((source, time.monotonic()))
+                        return index
+
+                if not self.pending and not self.in_flight:
+                    return None
+                self.cond.wait(RETRY_WAIT)
+
+    def _release(self, index, source, ok):
+        with self.cond:
+            owners = [o for o in self.in_flight.get(index, []) if o[0] is not source]
+            if owners:
+                self.in_flight[index] = owners
+            else:
+                self.in_flight.pop(index, None)
+                if not ok and index not in self.done:
+                    self.pending.appendleft(index)  # 失败的分片优先交给其它来源
+            self.cond.notify_all()
+
+    # --- 下载 ---
+    def _fetch_piece(self, source, index, buf):
+        start, end = self.piece_range(index)
+        length = end - start + 1
+        view = memoryview(buf)[:length]
+        response = source.client.open_range(source.path, start, end)
+        try:
+            readinto = get_reader(response)
+            got = 0
+            while got < length:
+                if not self.should_continue():
+                    raise DownloadInterrupted("Download manually stopped")
+                n = readinto(view[got:])
+                if not n:
+                    break
+                got += n
+        finally:
+            response.close()
+        if got != length:
+            raise IOError(f"分片 {index} 长度不符 ({got}/{length})")
+        if hashlib.sha256(view).hexdigest() != self.hashes[index]:
+            raise IOError(f"分片 {index} 校验失败")
+        return start, view
+
+    def _write_at(self, data, offset):
+        if hasattr(os, "pwrite"):
+            while data:
+                n = os.pwrite(self.fd, data, offset)
+                data, offset = data[n:], offset + n
+            return
+        with self.write_lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            os.write(self.fd, data)
+
+    def _worker(self, source):
+        buf = bytearray(self.piece_size)
+        while True:
+            index = self._take(source)
+            if index is None:
+                return
+            started = time.monotonic()
+            try:
+                start, view = self._fetch_piece(source, index, buf)
+            except DownloadInterrupted:
+                with self.cond:
+                    self.stopped = True
+                    self.cond.notify_all()
+                self._release(index, source, False)
+                return
+            except Exception as e:
+                source.failures += 1
+                if source.failures >= MAX_SOURCE_FAILURES:
+                    source.disabled = True
+                    print(f"[Swarm] 放弃来源 {source.label}: {e}")
+                self._release(index, source, False)
+                continue
+
+            with self.cond:
+                first = index not in self.done
+                if first:
+                    self.done.add(index)
+            if first:
+                try:
+                    self._write_at(view, start)
+                except OSError as e:
+                    with self.cond:
+                        self.done.discard(index)
+                        self.error = e
+                        self.stopped = True
+                        self.cond.notify_all()
+                    self._release(index, source, False)
+                    return
+                source.record(len(view), time.monotonic() - started)
+                with self.cond:
+                    self.done_bytes += len(view)
+                    done_bytes = self.done_bytes
+                if self.on_progress:
+                    self.on_progress(done_bytes)
+            self._release(index, source, True)
+
+    def run(self):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if not self.done:
+            flags |= os.O_TRUNC
+        self.fd = os.open(self.part_path, flags, 0o644)
+        try:
+            if not self.done:
+                os.ftruncate(self.fd, self.size)
+                preallocate(self.fd, 0, self.size)
+            threads = [
+                threading.Thread(target=self._worker, args=(source,), daemon=True)
+                for source in self.sources for _ in range(self.connections)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if not self._finished():
+                os.fsync(self.fd)   # 记录分片位图之前先落盘，位图不会比数据新
+        finally:
+            os.close(self.fd)
+
+        if self.error is not None:
+            raise self.error
+        if self.stopped and not self._finished():
+            raise DownloadInterrupted("Download manually stopped")
+        if not self._finished():
+            raise IOError(f"多源下载未完成：{len(self.done)}/{len(self.hashes)} 个分片，所有来源均失败")
+        return {s.label: s.bytes for s in self.sources}
+
+
+def fetch_swarm(task, primary, peers, should_continue=lambda: True,
+                connections_per_source=CONNECTIONS_PER_SOURCE, min_sources=2):
+    """
+    用多源方式下载 task；来源少于 min_sources 时返回 False，由调用方改走普通下载。
+    分片乱序写入，.part 不能按长度续传：中断或失败时把已完成分片的位图存在 .part 旁边，
+    下次（文件未变化时）跳过这些分片。
+    """
+    meta, sources = find_sources(primary, task.path, peers)
+    if len(sources) < min_sources:
+        return False
+
+    done = load_state(task.part_path, meta)
+    if not done and os.path.exists(task.part_path):
+        os.remove(task.part_path)
+    os.makedirs(os.path.dirname(task.save_path) or ".", exist_ok=True)
+    task.total = meta["size"]
+    print(f"[Swarm] {task.name}: {len(sources)} 个来源" + (f"，续传 {len(done)}/{len(meta['pieces'])} 个分片" if done else ""))
+
+    def on_progress(done_bytes):
+        task.downloaded = done_bytes
+
+    swarm = SwarmDownload(meta, sources, task.part_path, connections_per_source,
+                          should_continue=should_continue, on_progress=on_progress, done=done)
+    task.downloaded = swarm.done_bytes
+    # 先留下分片记录再写 .part：即使进程被强行结束，也能认出这是乱序写入、不能按长度续传的文件
+    save_state(task.part_path, meta, done)
+    try:
+        task.sources = swarm.run()
+    except BaseException:
+        if swarm.done and os.path.exists(task.part_path):
+            save_state(task.part_path, meta, swarm.done)
+        else:
+            discard_state(task.part_path)  # 一个分片也没完成，预分配的 .part 全是 0
+        raise
+    os.replace(task.part_path, task.save_path)
+    discard_state(task.part_path, remove_part=False)
+    return True
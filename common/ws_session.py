@@ -0,0 +1,166 @@
+# common/ws_session.py
+# 与某个后端设备的持久 WebSocket 会话（帧格式见 backend/api/session.py）。
+# 多个线程可同时发请求，由读线程按流 ID 分发响应；小文件内容按窗口流控接收。
+# 依赖可选的 websockets 包，没有安装或对方不支持时调用方退回 HTTP。
+
+import json
+import queue
+import ssl
+import struct
+import threading
+from urllib.parse import urlsplit
+
+from common.receive_pipeline import DownloadInterrupted
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:  # 可选依赖
+    ws_connect = None
+
+FRAME = struct.Struct(">BI")
+CREDIT = struct.Struct(">I")
+T_REQUEST, T_RESPONSE, T_DATA, T_END, T_ERROR, T_CREDIT, T_CANCEL = range(1, 8)
+
+SMALL_FILE_MAX = 4 * 1024 * 1024   # 与服务端一致，更大的文件走 HTTP Range
+WINDOW = 1024 * 1024               # 每个流的接收窗口
+CONNECT_TIMEOUT = 3
+REQUEST_TIMEOUT = 30
+
+
+class SessionError(Exception):
+    """服务端返回的错误（带 HTTP 状态码），或会话已断开（status 为 None）"""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def available():
+    return ws_connect is not None
+
+
+class PeerSession:
+    def __init__(self, base_url, authorization=""):
+        parts = urlsplit(base_url)
+        scheme = "wss" if parts.scheme == "https" else "ws"
+        url = f"{scheme}://{parts.netloc}/api/session"
+
+        kwargs = {"additional_headers": {"Authorization": authorization},
+                  "open_timeout": CONNECT_TIMEOUT, "max_size": None, "compression": None}
+        if scheme == "wss":
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE  # 自签名证书
+            kwargs["ssl"] = context
+        try:
+            self.ws = ws_connect(url, **kwargs)
+        except TypeError:  # 旧版 websockets 叫 ssl_context
+            kwargs["ssl_context"] = kwargs.pop("ssl", None)
+            self.ws = ws_connect(url, **kwargs)
+
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.streams = {}     # 流 ID -> 接收队列
+        self.next_id = 1
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    # --- 收发 ---
+    def _send(self, frame_type, stream_id, payload=b""):
+        with self.send_lock:
+            self.ws.send(FRAME.pack(frame_type, stream_id) + payload)
+
+    def _read_loop(self):
+        try:
+            for message in self.ws:
+                if isinstance(message, str) or len(message) < FRAME.size:
+                    continue
+                frame_type, stream_id = FRAME.unpack_from(message)
+                with self.lock:
+                    inbox = self.streams.get(stream_id)
+                if inbox is not None:
+                    inbox.put((frame_type, message[FRAME.size:]))
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+            with self.lock:
+                inboxes = list(self.streams.values())
+            for inbox in inboxes:
+                inbox.put((None, b""))
+
+    def _open_stream(self, request):
+        if self.closed:
+            raise SessionError(None, "会话已断开")
+        inbox = queue.Queue()
+        with self.lock:
+            stream_id = self.next_id
+            self.next_id += 1
+            self.streams[stream_id] = inbox
+        try:
+            self._send(T_REQUEST, stream_id, json.dumps(request).encode("utf-8"))
+        except Exception as e:
+            self._close_stream(stream_id)
+            self.closed = True
+            raise SessionError(None, f"会话已断开: {e}")
+        return stream_id, inbox
+
+    def _close_stream(self, stream_id):
+        with self.lock:
+            self.streams.pop(stream_id, None)
+
+    def _receive(self, inbox, timeout=REQUEST_TIMEOUT):
+        try:
+            frame_type, payload = inbox.get(timeout=timeout)
+        except queue.Empty:
+            raise SessionError(None, "请求超时")
+        if frame_type is None:
+            raise SessionError(None, "会话已断开")
+        if frame_type == T_ERROR:
+            error = json.loads(payload.decode("utf-8"))
+            raise SessionError(error.get("status"), error.get("detail", ""))
+        return frame_type, payload
+
+    # --- 接口 ---
+    def request(self, op, **args):
+        """发送一个控制请求并等待 JSON 结果"""
+        stream_id, inbox = self._open_stream({"op": op, **args})
+        try:
+            _, payload = self._receive(inbox)
+            return json.loads(payload.decode("utf-8"))
+        finally:
+            self._close_stream(stream_id)
+
+    def read_file(self, path, write, should_continue=lambda: True):
+        """
+        接收小文件内容，每收到一块调用 write(bytes)；返回元数据 {size, mtime}。
+        消费掉半个窗口就补发 CREDIT，服务端不会一次把整个文件塞进发送缓冲区。
+        """
+        stream_id, inbox = self._open_stream({"op": "read", "path": path, "window": WINDOW})
+        try:
+            _, payload = self._receive(inbox)
+            meta = json.loads(payload.decode("utf-8"))
+            unacked = 0
+            while True:
+                if not should_continue():
+                    self._send(T_CANCEL, stream_id)
+                    raise DownloadInterrupted("Download manually stopped")
+                frame_type, payload = self._receive(inbox)
+                if frame_type == T_END:
+                    return meta
+                write(payload)
+                unacked += len(payload)
+                if unacked >= WINDOW // 2:
+                    self._send(T_CREDIT, stream_id, CREDIT.pack(unacked))
+                    unacked = 0
+        finally:
+            self._close_stream(stream_id)
+
+    def close(self):
+        self.closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
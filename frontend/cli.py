@@ -0,0 +1,338 @@
+# frontend/cli.py
+# 无界面的命令行客户端：与图形界面共用配置、鉴权、API 客户端和下载引擎，
+# 便于在 cron / CI 上批量传输和做基准测试。
+#
+#   python -m frontend.cli devices
+#   python -m frontend.cli --url https://192.168.1.20:8010 ls 照片 --recursive
+#   python -m frontend.cli get 照片/2024 报告.pdf -o ~/下载 -j 8 --json
+#   python -m frontend.cli sync 照片 -o /backup/照片
+#   python -m frontend.cli zip 照片/2024 -o /tmp
+#
+# 加上 --json 后进度以 NDJSON 写到 stderr，最终统计以 JSON 写到 stdout。
+# 退出码：0 全部成功，1 有文件传输失败，2 参数错误，3 连接或认证失败，130 被中断（.part 保留，可续传）
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+import requests
+
+from frontend.config import get_settings
+from common.api_client import PeerClient
+from common.download_engine import DownloadEngine, DownloadTask, RUNNING, DONE, FAILED, CANCELED
+from common.link_profile import get_link_profiles
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CONNECTION = 3
+EXIT_INTERRUPTED = 130
+
+PROGRESS_INTERVAL = 1.0     # 进度输出间隔（秒）
+POLL_INTERVAL = 0.05        # 检查任务是否全部结束的间隔
+FINISHED = (DONE, FAILED, CANCELED)
+
+
+class Reporter:
+    """进度输出：文本模式写一行可覆盖的进度，JSON 模式每行一个事件"""
+
+    def __init__(self, as_json, quiet=False):
+        self.as_json = as_json
+        self.quiet = quiet
+
+    def event(self, kind, **fields):
+        if self.quiet:
+            return
+        if self.as_json:
+            sys.stderr.write(json.dumps({"event": kind, "time": round(time.time(), 3), **fields},
+                                        ensure_ascii=False) + "\n")
+        elif kind == "progress":
+            sys.stderr.write(f"\r{fields['files_done']}/{fields['files_total']} 个文件  "
+                             f"{format_size(fields['downloaded'])}/{format_size(fields['total'])}  "
+                             f"{format_size(fields['speed'])}/s    ")
+        elif kind == "file" and fields["state"] != DONE:
+            sys.stderr.write(f"\n❌ {fields['name']}: {fields['error'] or fields['state']}\n")
+        sys.stderr.flush()
+
+    def result(self, data):
+        if self.as_json:
+            print(json.dumps(data, ensure_ascii=False))
+        else:
+            if not self.quiet:
+                sys.stderr.write("\n")
+            speed = data["bytes"] / data["seconds"] if data["seconds"] > 0 else 0
+            print(f"完成 {data['files_done']} 个，失败 {data['files_failed']} 个，跳过 {data['files_skipped']} 个，"
+                  f"{format_size(data['bytes'])}，用时 {data['seconds']:.1f}s，平均 {format_size(speed)}/s")
+
+
+def format_size(num):
+    # 与 transfer_panel.format_size 相同，这里不导入界面模块
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+def make_engine(args, settings, on_task_done=None):
+    return DownloadEngine(
+        max_workers=args.concurrency or settings.get("max_concurrent_downloads", 3),
+        order=settings.get("download_order", "size"),
+        on_task_done=on_task_done,
+        fsync_interval=int(settings.get("fsync_interval_mb", 0)) * 1024 * 1024,
+        swarm_min_size=int(settings.get("swarm_min_size_mb", 64)) * 1024 * 1024,
+        link_profiles=get_link_profiles() if settings.get("auto_tune_enabled", True) else None)
+
+
+def expand(client, paths):
+    """把远程路径展开成 [(远程路径, 相对保存路径, 条目)]；文件夹保留它自己的目录名"""
+    items = []
+    for path in paths:
+        path = path.strip("/")
+        parent = os.path.dirname(path)
+        try:
+            entries = [e for e in client.walk(path) if e["type"] == "file"]
+        except requests.exceptions.HTTPError as e:
+            if getattr(e.response, "status_code", None) != 404:
+                raise
+            info = client.stat([path]).get(path)  # 不是目录：按单个文件处理
+            if info is None:
+                raise FileNotFoundError(f"远程路径不存在: {path}")
+            entries = [{"type": "file", "path": path, "name": os.path.basename(path), **info}]
+        for entry in entries:
+            items.append((entry["path"], os.path.relpath(entry["path"], parent), entry))
+    return items
+
+
+def run_transfers(engine, tasks, reporter, skipped=0):
+    """加入下载队列并等待全部结束，返回统计"""
+    started = time.monotonic()
+    for task in tasks:
+        engine.add(task)
+
+    reported = set()
+    interrupted = False
+    next_progress = 0.0
+
+    def on_interrupt(signum, frame):
+        nonlocal interrupted
+        interrupted = True
+
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        while True:
+            items, summary = engine.snapshot()
+            for task in tasks:
+                if task.state in FINISHED and task.id not in reported:
+                    reported.add(task.id)
+                    reporter.event("file", name=task.name, path=task.path, save_path=task.save_path,
+                                   state=task.state, bytes=task.downloaded, error=task.error)
+            finished = interrupted or all(t.state in FINISHED for t in tasks)
+            if finished or time.monotonic() >= next_progress:
+                next_progress = time.monotonic() + PROGRESS_INTERVAL
+                reporter.event("progress", files_total=len(tasks), files_done=sum(1 for t in tasks if t.state == DONE),
+                               downloaded=summary["downloaded"], total=summary["total"],
+                               speed=round(summary["speed"], 1), eta=summary["eta"])
+            if finished:
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+    if interrupted:
+        engine.pause_all()  # 正在下载的文件保留 .part，下次运行时续传
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(t.state == RUNNING for t in tasks):
+            time.sleep(0.1)
+    engine.shutdown()
+
+    seconds = time.monotonic() - started
+    transferred = sum(t.downloaded for t in tasks if t.state == DONE)
+    return {
+        "files_total": len(tasks),
+        "files_done": sum(1 for t in tasks if t.state == DONE),
+        "files_failed": sum(1 for t in tasks if t.state == FAILED),
+        "files_skipped": skipped,
+        "failed": [{"path": t.path, "error": t.error} for t in tasks if t.state == FAILED],
+        "bytes": transferred,
+        "seconds": round(seconds, 3),
+        "speed": round(transferred / seconds, 1) if seconds > 0 else 0.0,
+        "interrupted": interrupted,
+    }
+
+
+def exit_code(stats):
+    if stats["interrupted"]:
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED if stats["files_failed"] else EXIT_OK
+
+
+# --- 子命令 ---
+def cmd_devices(args, settings, client, reporter):
+    port = settings.get("port", 8010)
+    local = PeerClient(args.local_url or f"https://localhost:{port}", client.access_password)
+    devices = local.devices()
+    if args.json:
+        print(json.dumps(devices, ensure_ascii=False))
+    else:
+        for dev in devices:
+            print(f"{dev.get('name', '')}\thttps://{dev['ip']}:{port}\t{dev.get('id', '')}")
+    return EXIT_OK
+
+
+def cmd_ls(args, settings, client, reporter):
+    depth = None if args.recursive else args.depth
+    for entry in client.walk(args.path.strip("/"), depth=depth, show_hidden=args.hidden, q=args.filter):
+        if args.json:
+            print(json.dumps(entry, ensure_ascii=False))
+        else:
+            size = "" if entry["type"] == "dir" else format_size(entry.get("size", 0))
+            print(f"{'d' if entry['type'] == 'dir' else '-'} {size:>10}  {entry['path']}")
+    return EXIT_OK
+
+
+def cmd_get(args, settings, client, reporter, sync=False):
+    out_dir = os.path.abspath(os.path.expanduser(args.output or settings.get("download_dir", ".")))
+    peers = [PeerClient(url, client.access_password) for url in args.peer]
+    items = expand(client, args.paths)
+
+    remote_mtimes = {}
+
+    def on_task_done(task):
+        mtime = remote_mtimes.get(task.id)
+        if task.state == DONE and mtime:
+            try:
+                os.utime(task.save_path, (mtime, mtime))  # 下次同步时据此判断是否需要重新下载
+            except OSError:
+                pass
+
+    engine = make_engine(args, settings, on_task_done)
+    tasks, skipped = [], 0
+    for remote_path, rel_save, entry in items:
+        # 同步时保存到输出目录本身；下载时保留所选文件夹的名字
+        rel = os.path.relpath(remote_path, args.paths[0].strip("/")) if sync else rel_save
+        save_path = os.path.abspath(os.path.join(out_dir, rel))
+        if not save_path.startswith(out_dir + os.sep):
+            continue  # 对方返回了越界的路径
+        if sync and _up_to_date(save_path, entry):
+            skipped += 1
+            continue
+        task = DownloadTask(client.download_url(remote_path), client.headers, save_path,
+                            size=entry.get("size"), name=entry["name"], client=client,
+                            path=remote_path, peers=peers)
+        if sync:
+            remote_mtimes[task.id] = entry.get("mtime")
+        tasks.append(task)
+
+    reporter.event("start", files=len(tasks), skipped=skipped, bytes=sum(t.size or 0 for t in tasks))
+    stats = run_transfers(engine, tasks, reporter, skipped)
+    reporter.result(stats)
+    return exit_code(stats)
+
+
+def _up_to_date(save_path, entry):
+    try:
+        st = os.stat(save_path)
+    except OSError:
+        return False
+    return st.st_size == entry.get("size") and int(st.st_mtime) == int(entry.get("mtime") or 0)
+
+
+def cmd_sync(args, settings, client, reporter):
+    args.paths = [args.path]
+    return cmd_get(args, settings, client, reporter, sync=True)
+
+
+def cmd_zip(args, settings, client, reporter):
+    out_dir = os.path.abspath(os.path.expanduser(args.output or settings.get("download_dir", ".")))
+    job = client.create_zip_job([p.strip("/") for p in args.paths])
+    save_path = os.path.join(out_dir, job["filename"])
+    # 打包尚未完成时服务端边写边传
+    task = DownloadTask(client.zip_job_download_url(job["job_id"]), client.headers, save_path,
+                        name=job["filename"], client=client)
+    reporter.event("start", files=1, zip_job=job["job_id"])
+    stats = run_transfers(make_engine(args, settings), [task], reporter)
+    reporter.result(stats)
+    return exit_code(stats)
+
+
+def build_parser():
+    def add_common(p, default):
+        # 通用选项写在子命令前后都可以；子命令里的默认值不覆盖前面已经给出的
+        p.add_argument("--url", default=default(None), help="目标设备地址，默认使用配置中的 base_url")
+        p.add_argument("--password", default=default(None), help="访问密码，默认使用配置中的 access_password")
+        p.add_argument("--json", action="store_true", default=default(False),
+                       help="进度以 NDJSON 写到 stderr，结果以 JSON 写到 stdout")
+        p.add_argument("-q", "--quiet", action="store_true", default=default(False), help="不输出进度")
+        p.add_argument("--no-ws-session", action="store_true", default=default(False),
+                       help="不使用 WebSocket 会话，全部走 HTTP")
+
+    parser = argparse.ArgumentParser(prog="python -m frontend.cli", description="FlyDrop 命令行客户端")
+    add_common(parser, lambda value: value)
+    common = argparse.ArgumentParser(add_help=False)
+    add_common(common, lambda value: argparse.SUPPRESS)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("devices", parents=[common], help="列出本机后端发现的设备")
+    p.add_argument("--local-url", help="本机后端地址，默认 https://localhost:<port>")
+    p.set_defaults(func=cmd_devices)
+
+    p = sub.add_parser("ls", parents=[common], help="列出目录")
+    p.add_argument("path", nargs="?", default="")
+    p.add_argument("-r", "--recursive", action="store_true", help="递归列出整棵子树")
+    p.add_argument("--depth", type=int, default=1, help="列出的层数（默认 1）")
+    p.add_argument("-a", "--hidden", action="store_true", help="包含隐藏文件")
+    p.add_argument("--filter", default="", help="只显示名称包含该文本的条目")
+    p.set_defaults(func=cmd_ls)
+
+    for name, func, help_text in (("get", cmd_get, "下载文件或文件夹"),
+                                  ("sync", cmd_sync, "把远程文件夹同步到本地目录（跳过大小和时间相同的文件）")):
+        p = sub.add_parser(name, parents=[common], help=help_text)
+        if name == "get":
+            p.add_argument("paths", nargs="+", help="远程相对路径")
+        else:
+            p.add_argument("path", help="远程文件夹")
+        p.add_argument("-o", "--output", help="保存目录，默认使用配置中的 download_dir")
+        p.add_argument("-j", "--concurrency", type=int, help="同时下载的文件数，默认使用配置")
+        p.add_argument("--peer", action="append", default=[], help="可多源下载的其它设备地址（可重复）")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("zip", parents=[common], help="打包下载")
+    p.add_argument("paths", nargs="+", help="远程相对路径")
+    p.add_argument("-o", "--output", help="保存目录，默认使用配置中的 download_dir")
+    p.add_argument("-j", "--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    p.set_defaults(func=cmd_zip)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = get_settings()
+    base_url = args.url or settings.get("base_url", "https://localhost:8010")
+    password = args.password if args.password is not None else settings.get("access_password", "")
+    use_ws = settings.get("ws_session_enabled", False) and not args.no_ws_session
+    client = PeerClient(base_url, password, use_ws)
+    reporter = Reporter(args.json, args.quiet)
+    try:
+        return args.func(args, settings, client, reporter)
+    except requests.exceptions.HTTPError as e:
+        status = getattr(e.response, "status_code", None)
+        print(f"❌ 请求失败: {e}", file=sys.stderr)
+        return EXIT_CONNECTION if status in (401, 403, 429) else EXIT_FAILED
+    except requests.exceptions.RequestException as e:
+        print(f"❌ 无法连接 {base_url}: {e}", file=sys.stderr)
+        return EXIT_CONNECTION
+    except FileNotFoundError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        client.close_ws_session()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
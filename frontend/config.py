@@ -9,12 +9,34 @@ DEFAULTS = {
     "discovery_port": 17257,
     "access_password": "",
     "base_url": "https://localhost:8010",
-    "download_dir": os.path.expanduser("~/Downloads")
+    "download_dir": os.path.expanduser("~/Downloads"),
+    "max_concurrent_downloads": 3,  # 同时下载的文件数
+    "download_order": "size",       # size: 小文件优先, order: 按选择顺序
+    "fsync_interval_mb": 0,         # 每写入多少 MB 落盘一次，0 表示交给系统
+    "swarm_enabled": True,          # 大文件从所有持有相同文件的设备同时下载
+    "swarm_min_size_mb": 64,
+    "ws_session_enabled": False,    # 控制请求和小文件复用一条 WebSocket 会话（需要 websockets），默认关闭
+    "listing_cache_dir": "",        # 目录列表缓存位置，留空使用 ~/.cache/flydrop/listings
+    "auto_tune_enabled": True       # 按每台设备测得的延迟、吞吐和断线率自动选择连接数、压缩和超时
 }
 
+_cache = None  # ((mtime_ns, size), 配置)，文件没变化时直接复用
+
+def _stamp():
+    try:
+        st = os.stat(CONFIG_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
 def get_settings():
+    global _cache
+    stamp = _stamp()
+    if _cache and stamp and _cache[0] == stamp:
+        return dict(_cache[1])
+
     config = {}
-    if os.path.exists(CONFIG_PATH):
+    if stamp:
         try:
             with open(CONFIG_PATH, "r") as f:
                 config = json.load(f)
@@ -23,12 +45,17 @@ def get_settings():
     else:
         print("📂 config.json 不存在，将使用默认配置")
 
-    # 合并并写回
-    config = {**DEFAULTS, **config}
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
-    return config
+    # 合并；只有缺少配置项时才写回，避免每次读取都重写文件
+    merged = {**DEFAULTS, **config}
+    if merged != config:
+        with open(CONFIG_PATH, "w") as f:
+            json.dump(merged, f, indent=2)
+        stamp = _stamp()
+    _cache = (stamp, merged)
+    return dict(merged)
 
 def save_settings(data):
+    global _cache
     with open(CONFIG_PATH, "w") as f:
         json.dump(data, f, indent=2)
+    _cache = None
@@ -0,0 +1,100 @@
+# frontend/core/listing_cache.py
+# 按设备保存在磁盘上的目录列表缓存：打开目录时先显示缓存，再用 ETag 向服务端确认，
+# 没变化时服务端只回 304。程序重启后缓存仍在，大目录不用等网络就能显示。
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+MAX_ENTRIES = 2000          # 每台设备最多缓存的列表页数
+SAVE_DELAY = 2.0            # 合并多次更新后再写盘（秒）
+FRESH_SECONDS = 10          # 刚确认过的列表在这段时间内不再向服务端确认
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "flydrop", "listings")
+
+
+class ListingCache:
+    def __init__(self, base_url, cache_dir=None):
+        name = hashlib.sha1(base_url.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir or default_cache_dir(), f"{name}.json")
+        self.lock = threading.Lock()
+        self.entries = None     # 键 -> {"etag", "entries", "total", "time"}，首次使用时从磁盘加载
+        self.validated = {}     # 键 -> 本次运行中最后一次确认的时间（不落盘）
+        self._save_timer = None
+
+    @staticmethod
+    def key(path, sort, desc, q, offset, limit):
+        return json.dumps([path, sort, desc, q, offset, limit])
+
+    def _load(self):
+        """调用方持有 self.lock"""
+        if self.entries is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            self._load()
+            return self.entries.get(key)
+
+    def is_fresh(self, key):
+        return time.monotonic() - self.validated.get(key, float("-inf")) < FRESH_SECONDS
+
+    def mark_validated(self, key):
+        self.validated[key] = time.monotonic()
+
+    def expire(self, path):
+        """path 目录已经变化：之后再读它的缓存时重新向服务端确认"""
+        self.validated = {k: t for k, t in list(self.validated.items()) if json.loads(k)[0] != path}
+
+    def forget_validation(self):
+        """用户主动刷新时调用，之后每个列表都重新向服务端确认"""
+        self.validated.clear()
+
+    def put(self, key, etag, entries, total):
+        with self.lock:
+            self._load()
+            self.entries.pop(key, None)   # 重新插入，字典顺序即最近使用顺序
+            self.entries[key] = {"etag": etag, "entries": entries, "total": total, "time": time.time()}
+            while len(self.entries) > MAX_ENTRIES:
+                self.entries.pop(next(iter(self.entries)))
+            self.mark_validated(key)
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        with self.lock:
+            self._save_timer = None
+            if self.entries is None:
+                return
+            data = json.dumps(self.entries, ensure_ascii=False)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[ListingCache] 保存列表缓存失败: {e}")
+
+
+def get_listing_cache(base_url, cache_dir=None):
+    """同一设备共用一个缓存对象"""
+    with _caches_lock:
+        cache = _caches.get(base_url)
+        if cache is None:
+            cache = _caches[base_url] = ListingCache(base_url, cache_dir)
+        return cache
@@ -1,9 +1,15 @@
 # frontend/main.py
 
 import sys
+from common.startup_profile import startup_profiler
+
+# 尽早开启，才能统计到后面所有模块的导入耗时
+if "--profile-startup" in sys.argv:
+    startup_profiler.enable()
+
 import traceback
-from PySide6.QtWidgets import QApplication, QMainWindow
-from frontend.pages.file_download import FileDownloadPage
+from PySide6.QtWidgets import QApplication, QMainWindow, QLabel
+from PySide6.QtCore import Qt, QTimer
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -11,14 +17,32 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("FlyDrop - 局域网文件助手")
         self.setGeometry(300, 200, 1000, 600)
 
-        self.page = FileDownloadPage()
-        self.setCentralWidget(self.page)
+        # 先显示占位内容，窗口画出来后再加载文件页（requests 等依赖在那时才导入）
+        self.page = None
+        placeholder = QLabel("正在加载...")
+        placeholder.setAlignment(Qt.AlignCenter)
+        self.setCentralWidget(placeholder)
+
+    def load_page(self):
+        with startup_profiler.phase("导入文件页"):
+            from frontend.pages.file_download import FileDownloadPage
+        with startup_profiler.phase("创建文件页"):
+            self.page = FileDownloadPage()
+            self.setCentralWidget(self.page)
+        startup_profiler.mark("界面可用")
+        if startup_profiler.enabled:
+            print(startup_profiler.report())
 
 def main():
     try:
-        app = QApplication(sys.argv)
-        window = MainWindow()
-        window.show()
+        startup_profiler.mark("模块导入完成")
+        with startup_profiler.phase("创建 QApplication"):
+            app = QApplication(sys.argv)
+        with startup_profiler.phase("显示窗口"):
+            window = MainWindow()
+            window.show()
+        startup_profiler.mark("窗口已显示")
+        QTimer.singleShot(0, window.load_page)
         sys.exit(app.exec())
 
     except Exception as e:
@@ -26,4 +50,4 @@ def main():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
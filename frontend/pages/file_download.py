@@ -6,27 +6,38 @@ import traceback # 用于打印更详细的错误信息
 
 # --- PySide6 界面和核心库 ---
 from PySide6.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget,
-    QTreeWidgetItem, QFileDialog, QMessageBox, QLabel, QComboBox,
-    QProgressDialog, QApplication, QInputDialog
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeView,
+    QAbstractItemView, QFileDialog, QMessageBox, QLabel, QComboBox,
+    QProgressDialog, QApplication, QInputDialog, QSplitter, QLineEdit
 )
-from PySide6.QtCore import Qt, QTimer, Signal, QObject, QThread
+from PySide6.QtCore import Qt, QTimer, QModelIndex, QPoint, Signal
 
 # --- 项目内部模块 (根据你的结构调整) ---
 from frontend.config import get_settings         # 获取前端配置
 from frontend.pages.settings_dialog import SettingsDialog # 设置对话框
-from frontend.threads.downloader import FileDownloadThread  # 前端的下载线程
+from frontend.threads.download_manager import DownloadManager  # 下载队列管理
+from frontend.pages.transfer_panel import TransferPanel, format_size  # 传输面板
+from common.api_client import PeerClient, address_for_peer  # 后端 API 客户端
+from frontend.pages.remote_file_model import RemoteFileModel  # 分页文件树模型
+from frontend.core.listing_cache import get_listing_cache  # 按设备持久化的列表缓存
+from frontend.threads.change_watcher import ChangeWatcher  # 订阅展开目录的变化
+from common.link_profile import get_link_profiles  # 按设备的链路画像和自动调参
+from frontend.pages.preview_pane import PreviewPane  # 选中文件的预览
 
 # --- 标准库和第三方库 ---
 import requests # 用于向后端发送 HTTP 请求
 import os       # 用于处理本地文件路径
-import uuid     # 用于生成唯一ID
+import threading # 后台获取设备列表
+from urllib.parse import urlsplit # 取目标设备的地址
 
 class FileDownloadPage(QWidget):
     """
     文件浏览和下载页面 (Frontend Page)。
     负责与用户交互，向后端请求数据，并展示结果。
     """
+    devices_fetched = Signal(object) # 后台线程获取到的设备列表（失败时为 None）
+    folder_expand_failed = Signal(str, str) # 后台展开文件夹失败（文件夹名, 错误信息）
+
     def __init__(self):
         """初始化页面组件和状态"""
         super().__init__()
@@ -37,13 +48,59 @@ class FileDownloadPage(QWidget):
         self.access_password = self.config.get("access_password", "") # 访问后端的密码
         self.show_hidden = False  # 是否显示隐藏文件
         self.manual_devices = {}  # 手动添加的设备 {名称: URL}
-        self.active_download_threads = [] # 正在运行的下载线程列表
+        self.discovered_devices = {}  # 局域网发现的设备 {名称: URL}
+        self._fetching_devices = False
+        self.devices_fetched.connect(self.on_devices_fetched)
+        self.folder_expand_failed.connect(self.on_folder_expand_failed)
+        self.use_ws_session = self.config.get("ws_session_enabled", False) # 控制请求和小文件走 WebSocket 会话
+        self.client = PeerClient(self.base_url, self.access_password, self.use_ws_session)  # 当前设备的 API 客户端
+        self.local_client = None  # 查询本机后端设备列表用，首次轮询时创建
+        self.change_watcher = None  # 当前设备的目录变化订阅，切换设备时重建
+
+        # 链路画像：切换或发现设备时在后台探测，下载时据此选择连接数、压缩和超时
+        self.link_profiles = get_link_profiles() if self.config.get("auto_tune_enabled", True) else None
+
+        # 下载管理器：有界线程池 + 优先队列，所有任务在一个传输面板里显示
+        self.download_manager = DownloadManager(
+            max_workers=self.config.get("max_concurrent_downloads", 3),
+            order=self.config.get("download_order", "size"),
+            fsync_interval=int(self.config.get("fsync_interval_mb", 0)) * 1024 * 1024,
+            swarm_min_size=int(self.config.get("swarm_min_size_mb", 64)) * 1024 * 1024,
+            link_profiles=self.link_profiles,
+            parent=self)
+        self.download_manager.task_finished.connect(self.on_download_finished)
+        self.transfer_panel = TransferPanel(self.download_manager)
+        self.transfer_panel.hide()
 
         # -- 界面控件 --
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["文件名"])
-        self.tree.itemExpanded.connect(self.expand_directory) # 展开文件夹时加载内容
-        self.tree.setSelectionMode(QTreeWidget.ExtendedSelection) # 允许多选
+        # 文件树：虚拟化的 QTreeView + 按需分页加载的模型，大目录也不会一次性创建所有行
+        self.model = RemoteFileModel(self)
+        self.model.load_failed.connect(self.on_load_failed)
+        self.tree = QTreeView()
+        self.tree.setModel(self.model)
+        self.tree.setUniformRowHeights(True) # 行高一致，视图无需逐行测量
+        self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection) # 允许多选
+        self.tree.setSortingEnabled(True) # 点击表头排序（由服务端完成）
+        self.tree.sortByColumn(0, Qt.AscendingOrder)
+        self.tree.setColumnWidth(0, 420)
+        self.tree.verticalScrollBar().valueChanged.connect(self.fetch_visible_pages)
+        # 只订阅展开着的目录；重新展开时先确认一次，收起期间的变化不会漏掉
+        self.tree.expanded.connect(self.on_tree_expanded)
+        self.tree.collapsed.connect(self.update_watched_dirs)
+        self.model.modelReset.connect(self.update_watched_dirs)
+        self.model.rowsRemoved.connect(self.update_watched_dirs)
+
+        # 预览面板：选中文件时显示缩略图、文本开头、压缩包目录或媒体信息，不下载整个文件
+        self.preview_pane = PreviewPane()
+        self.tree.selectionModel().currentChanged.connect(self.on_current_changed)
+
+        # 名称过滤（服务端过滤），输入停顿后再请求
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("筛选文件名")
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(lambda: self.model.set_name_filter(self.filter_input.text()))
+        self.filter_input.textChanged.connect(lambda _: self.filter_timer.start(300))
 
         # 定时器，用于定期向后端请求设备列表
         self.device_refresh_timer = QTimer(self)
@@ -56,11 +113,13 @@ class FileDownloadPage(QWidget):
         self.download_button = QPushButton("下载")
         self.settings_button = QPushButton("⚙ 设置")
         self.zip_button = QPushButton("打包下载")
+        self.send_button = QPushButton("发送到设备")
 
         # 连接按钮信号
         self.zip_button.clicked.connect(self.download_zip)
+        self.send_button.clicked.connect(self.send_to_device)
         self.toggle_hidden_button.clicked.connect(self.toggle_hidden)
-        self.refresh_button.clicked.connect(self.refresh_root)
+        self.refresh_button.clicked.connect(self.refresh_current)
         self.download_button.clicked.connect(self.download_selected_files)
         self.settings_button.clicked.connect(self.open_settings_dialog)
 
@@ -76,19 +135,33 @@ class FileDownloadPage(QWidget):
         top_layout.addWidget(self.device_selector)
         top_layout.addWidget(self.add_device_button)
         top_layout.addStretch()
+        top_layout.addWidget(self.filter_input)
         top_layout.addWidget(self.toggle_hidden_button)
         top_layout.addWidget(self.refresh_button)
         top_layout.addWidget(self.download_button)
         top_layout.addWidget(self.zip_button)
+        top_layout.addWidget(self.send_button)
         top_layout.addWidget(self.settings_button)
 
+        browser_splitter = QSplitter(Qt.Horizontal)
+        browser_splitter.addWidget(self.tree)
+        browser_splitter.addWidget(self.preview_pane)
+        browser_splitter.setStretchFactor(0, 3)
+        browser_splitter.setStretchFactor(1, 1)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(browser_splitter)
+        splitter.addWidget(self.transfer_panel)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+
         main_layout = QVBoxLayout(self)
         main_layout.addLayout(top_layout)
-        main_layout.addWidget(self.tree)
+        main_layout.addWidget(splitter)
 
         # -- 初始化数据 --
         self.update_devices({}) # 初始化设备列表
-        self.fetch_devices()    # 首次尝试获取设备
+        QTimer.singleShot(0, self.fetch_devices) # 窗口显示后再在后台获取设备
 
     def change_device(self, index):
         """切换当前连接的后端设备"""
@@ -100,75 +173,77 @@ class FileDownloadPage(QWidget):
     def refresh_root(self):
         """刷新文件树的根目录"""
         if not self.base_url: return # 必须有后端地址
-        self.tree.clear()
-        self.load_directory("") # 请求根目录 ""
+        old_client = self.client
+        self.client = PeerClient(self.base_url, self.access_password, self.use_ws_session)
+        # 先显示该设备上次的列表缓存，再逐页用 ETag 向服务端确认
+        cache = get_listing_cache(self.base_url, self.config.get("listing_cache_dir") or None)
+        cache.forget_validation()
+        self.model.set_client(self.client, cache) # 重置模型，视图会按需请求第一页
+        self.preview_pane.set_client(self.client)
+        if old_client is not None:
+            old_client.close_ws_session() # 旧设备上还在下载的小文件会自动改走 HTTP
+        if self.change_watcher is not None:
+            self.change_watcher.stop()
+        self.change_watcher = ChangeWatcher(self.client, self)
+        self.change_watcher.changes.connect(self.model.apply_changes)
+        if self.link_profiles is not None:
+            self.link_profiles.ensure_probed(self.client)
+
+    def refresh_current(self):
+        """刷新按钮：逐个确认已加载的目录，只有变化了的目录重新加载，其它展开状态保持不变"""
+        if self.model.client is not self.client:
+            self.refresh_root()
+            return
+        self.model.revalidate_all()
+
+    def on_tree_expanded(self, index):
+        """槽：展开目录。之前加载过的目录收起期间没有订阅，先向服务端确认一次"""
+        node = self.model.node(index)
+        if node.total is not None:
+            self.model.revalidate(node)
+        self.update_watched_dirs()
+
+    def on_current_changed(self, current, _previous):
+        """槽：当前条目变化时更新预览"""
+        self.preview_pane.show_node(self.model.node(current) if current.isValid() else None)
+
+    def update_watched_dirs(self, *_):
+        if self.change_watcher is not None:
+            self.change_watcher.set_paths(self.model.expanded_dirs(self.tree.isExpanded))
 
     def toggle_hidden(self):
         """切换是否显示隐藏文件"""
         self.show_hidden = not self.show_hidden
         self.toggle_hidden_button.setText("隐藏隐藏文件" if self.show_hidden else "显示隐藏文件")
-        self.refresh_root() # 重新加载列表以应用更改
-
-    def load_directory(self, path, parent=None):
-        """向后端请求指定路径的文件列表，并在UI上显示"""
-        if not self.base_url: return
-        try:
-            # --- 前端职责：向后端 API 发送请求 ---
-            url = f"{self.base_url}/api/files/list"
-            headers = {"Authorization": self.access_password}
-            response = requests.get(url, params={"path": path}, headers=headers, verify=False, timeout=10)
-            response.raise_for_status()
-            data = response.json() # 后端返回的文件/文件夹列表
-
-            # --- 前端职责：处理响应并在 UI 上展示 ---
-            container = parent if parent else self.tree
-            if parent: parent.takeChildren() # 清除旧的占位符
-
-            for item_data in data:
-                name = item_data["name"]
-                file_path = item_data["path"]
-                if not self.show_hidden and name.startswith("."): continue
-
-                tree_item = QTreeWidgetItem([name])
-                tree_item.setData(0, Qt.UserRole, file_path) # 存储后端提供的路径
-
-                if item_data["type"] == "dir":
-                    tree_item.addChild(QTreeWidgetItem([""])) # 添加占位符显示展开图标
-                    tree_item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
-
-                if parent: parent.addChild(tree_item)
-                else: self.tree.addTopLevelItem(tree_item)
-
-        except requests.exceptions.RequestException as e:
-            QMessageBox.critical(self, "加载失败", f"无法从 {self.base_url} 加载列表。\n错误: {e}")
-            # 在界面上显示错误提示
-            err_node = QTreeWidgetItem([f"加载失败: {type(e).__name__}"])
-            if parent: parent.addChild(err_node)
-            else: self.tree.addTopLevelItem(err_node)
-        except Exception as e:
-            print(f"[Load Directory] Unexpected Error: {e}")
-            traceback.print_exc()
-            QMessageBox.critical(self, "加载失败", f"处理列表时发生未知错误: {e}")
-            err_node = QTreeWidgetItem([f"加载失败: 未知错误"])
-            if parent: parent.addChild(err_node)
-            else: self.tree.addTopLevelItem(err_node)
-
-
-    def expand_directory(self, item: QTreeWidgetItem):
-        """用户展开文件夹节点时，向后端请求该文件夹的内容"""
-        # 检查是否是首次展开（通过占位符判断）
-        is_placeholder = item.childCount() == 1 and item.child(0).text(0) == ""
-        if item.childIndicatorPolicy() == QTreeWidgetItem.ShowIndicator and is_placeholder:
-            path = item.data(0, Qt.UserRole) # 获取要加载的后端路径
-            item.takeChildren() # 移除占位符
-            item.addChild(QTreeWidgetItem(["加载中..."])) # 显示加载提示
-            QApplication.processEvents()
-            self.load_directory(path, parent=item) # 请求后端加载
+        self.model.set_show_hidden(self.show_hidden) # 在本地按缓存的列表重新过滤
+
+    def on_load_failed(self, message):
+        """槽：列表加载失败"""
+        QMessageBox.critical(self, "加载失败", f"无法从 {self.base_url} 加载列表。\n错误: {message}")
+
+    def fetch_visible_pages(self, *_):
+        """
+        QTreeView 只会自动为根节点加载下一页；滚动到某个已展开目录的末尾时，
+        在这里为它请求后续分页。
+        """
+        bottom = self.tree.indexAt(self.tree.viewport().rect().bottomLeft() - QPoint(0, 1))
+        index = bottom if bottom.isValid() else QModelIndex()
+        while index.isValid():
+            parent = index.parent()
+            if index.row() >= self.model.rowCount(parent) - 50 and self.model.canFetchMore(parent):
+                self.model.fetchMore(parent)
+            index = parent
+        if self.model.canFetchMore(QModelIndex()):
+            self.model.fetchMore(QModelIndex())
+
+    def selected_nodes(self):
+        """当前选中的文件树节点"""
+        return [self.model.node(index) for index in self.tree.selectionModel().selectedRows(0)]
 
     def download_selected_files(self):
-        """用户点击“下载”按钮，下载选中的文件"""
-        items = self.tree.selectedItems()
-        if not items:
+        """用户点击“下载”按钮，把选中的文件加入下载队列"""
+        nodes = self.selected_nodes()
+        if not nodes:
             QMessageBox.warning(self, "未选择", "请选择文件进行下载")
             return
 
@@ -183,102 +258,62 @@ class FileDownloadPage(QWidget):
              QMessageBox.warning(self, "错误", "未选择有效的设备 URL")
              return
 
-        for item in items:
-            file_path = item.data(0, Qt.UserRole) # 这是后端需要的相对路径
-            name = item.text(0) # 文件名，用于本地保存
-
-            if item.childIndicatorPolicy() == QTreeWidgetItem.ShowIndicator:
-                # print(f"[Download] Skipping directory: {name}")
-                continue # 跳过文件夹
-
-            save_path = os.path.join(download_dir, name) # 本地完整保存路径
+        headers = {"Authorization": self.access_password}
+        peers = self.peer_clients() if self.config.get("swarm_enabled", True) else []
+        for node in nodes:
+            if node.is_dir:
+                # 文件夹由后端一次性递归列出，边收到条目边加入队列，不阻塞界面
+                threading.Thread(target=self._queue_folder_worker,
+                                 args=(self.client, node, download_dir, headers, peers), daemon=True).start()
+                continue
 
             # --- 前端职责：构建对后端下载接口的请求 ---
-            url = f"{self.base_url}/api/files/download"
-            headers = {"Authorization": self.access_password}
-            params = {"path": file_path} # 将后端路径作为参数
             try:
-                req = requests.Request("GET", url, params=params)
-                prepared_req = req.prepare()
-                full_url = prepared_req.url # 最终请求的 URL
+                url = self.client.download_url(node.path) # node.path 是后端需要的相对路径
             except Exception as e:
                  QMessageBox.critical(self, "URL错误", f"构建下载链接时出错:\n{e}")
                  continue
 
-            # --- 前端职责：显示下载进度 ---
-            progress = QProgressDialog(f"下载 '{name}'...", "取消", 0, 100, self)
-            progress.setWindowTitle("文件下载")
-            progress.setMinimumDuration(500)
-            progress.setCancelButton(None) # 禁用取消
-            progress.setAutoClose(False)
-            progress.setValue(0)
+            # --- 交给下载管理器排队，由有界线程池执行 ---
+            save_path = os.path.join(download_dir, node.name) # 本地完整保存路径
+            self.download_manager.add(url, headers, save_path, size=node.size, name=node.name,
+                                      client=self.client, path=node.path, peers=peers)
 
-            # --- 前端职责：创建后台线程处理下载 IO ---
-            try:
-                # FileDownloadThread 负责请求后端、接收数据、写入本地文件
-                thread = FileDownloadThread(full_url, headers, save_path)
-            except Exception as e:
-                print(f"[Download] Error creating thread: {e}")
-                traceback.print_exc()
-                QMessageBox.critical(self, "错误", f"无法创建下载线程: {e}")
-                progress.close()
-                continue
+        self.transfer_panel.show()
 
-            self.active_download_threads.append(thread)
+    def _queue_folder_worker(self, client, node, download_dir, headers, peers):
+        """（后台线程）递归列出文件夹，按相对路径把其中的文件加入下载队列"""
+        parent = os.path.dirname(node.path.rstrip("/"))
+        root_dir = os.path.abspath(download_dir)
+        count = 0
+        try:
+            for entry in client.walk(node.path):
+                if entry["type"] != "file":
+                    continue
+                save_path = os.path.abspath(os.path.join(root_dir, os.path.relpath(entry["path"], parent)))
+                if not save_path.startswith(root_dir + os.sep):
+                    continue # 对方返回了越界的路径
+                self.download_manager.add(client.download_url(entry["path"]), headers, save_path,
+                                          size=entry.get("size"), name=entry["name"],
+                                          client=client, path=entry["path"], peers=peers)
+                count += 1
+            print(f"[Download] 文件夹 {node.name} 共加入 {count} 个文件")
+        except Exception as e:
+            self.folder_expand_failed.emit(node.name, str(e))
 
-            # --- 前端职责：连接线程信号更新 UI ---
-            try:
-                thread.progress.connect(lambda val, p=progress: self.update_progress(p, val), Qt.QueuedConnection)
-                # 假设 finished/failed 信号会传递线程实例用于清理
-                thread.finished.connect(lambda name_sig, t=thread, p=progress: self.download_finished(p, name_sig, t), Qt.QueuedConnection)
-                thread.failed.connect(lambda name_sig, err_sig, t=thread, p=progress: self.download_failed(p, name_sig, err_sig, t), Qt.QueuedConnection)
-            except Exception as e:
-                 print(f"[Download] Error connecting signals: {e}")
-                 QMessageBox.critical(self, "信号错误", f"连接线程信号时出错: {e}")
-                 if thread in self.active_download_threads: self.active_download_threads.remove(thread)
-                 progress.close()
-                 continue
+    def on_folder_expand_failed(self, name, error):
+        """槽：后台展开文件夹失败"""
+        QMessageBox.warning(self, "下载失败", f"无法列出文件夹 {name}：\n{error}")
 
-            # --- 前端职责：启动后台线程 ---
-            try:
-                thread.start()
-                progress.show()
-            except Exception as e:
-                print(f"[Download] Error starting thread: {e}")
-                traceback.print_exc()
-                QMessageBox.critical(self, "启动错误", f"启动下载线程时出错: {e}")
-                if thread in self.active_download_threads: self.active_download_threads.remove(thread)
-                progress.close()
-
-    def update_progress(self, progress_dialog: QProgressDialog, value: int):
-        """槽：更新进度条"""
-        if progress_dialog and progress_dialog.isVisible():
-            progress_dialog.setValue(value)
-
-    def download_finished(self, progress_dialog: QProgressDialog, name: str, thread_instance: FileDownloadThread):
-        """槽：下载成功"""
-        if progress_dialog and progress_dialog.isVisible():
-            progress_dialog.setValue(progress_dialog.maximum())
-            progress_dialog.setLabelText(f"'{name}' 下载完成!")
-            progress_dialog.setCancelButtonText("关闭")
-            progress_dialog.setAutoClose(True)
-        else:
-            QMessageBox.information(self, "下载完成", f"'{name}' 已成功下载。")
-        self.cleanup_thread(thread_instance) # 从活动列表移除
-
-    def download_failed(self, progress_dialog: QProgressDialog, name: str, error_message: str, thread_instance: FileDownloadThread):
-        """槽：下载失败"""
-        if progress_dialog and progress_dialog.isVisible():
-            progress_dialog.setLabelText(f"'{name}' 下载失败!")
-            progress_dialog.setCancelButtonText("关闭")
-            progress_dialog.setAutoClose(True)
-        QMessageBox.critical(self, "下载失败", f"下载 '{name}' 时发生错误:\n{error_message}")
-        self.cleanup_thread(thread_instance) # 从活动列表移除
-
-    def cleanup_thread(self, thread_instance: FileDownloadThread):
-        """从活动线程列表中安全移除线程实例"""
-        if thread_instance in self.active_download_threads:
-            self.active_download_threads.remove(thread_instance)
+    def peer_clients(self):
+        """除当前设备外的其它已知设备，多源下载时用来查找相同文件"""
+        urls = set(self.discovered_devices.values()) | set(self.manual_devices.values())
+        urls.discard(self.base_url)
+        return [PeerClient(url, self.access_password) for url in sorted(urls)]
+
+    def on_download_finished(self, name: str, state: str):
+        """槽：单个任务结束（只打印日志，汇总信息显示在传输面板里）"""
+        print(f"[Download] {name}: {state}")
 
     def open_settings_dialog(self):
         """打开设置对话框"""
@@ -290,101 +325,230 @@ class FileDownloadPage(QWidget):
             self.update_devices({}) # 更新设备列表（可能改变本机 URL）
 
     def download_zip(self):
-        """用户点击“打包下载”按钮"""
-        items = self.tree.selectedItems()
-        if not items:
+        """用户点击“打包下载”按钮：创建后台打包任务，边打包边下载"""
+        nodes = self.selected_nodes()
+        if not nodes:
             QMessageBox.warning(self, "未选择", "请选择要打包下载的文件或文件夹")
             return
         if not self.base_url:
              QMessageBox.warning(self, "错误", "未选择有效的设备 URL")
              return
 
-        paths = [item.data(0, Qt.UserRole) for item in items] # 获取选中的后端路径
-
-        # --- 前端职责：向后端打包接口发送请求 ---
-        url = f"{self.base_url}/api/files/zip"
-        headers = {"Authorization": self.access_password}
-        params = {"paths": ",".join(paths)}
-        progress = None
+        paths = [node.path for node in nodes] # 获取选中的后端路径
 
         try:
-            # 请求后端生成并开始传输 Zip 流
-            response = requests.get(url, params=params, headers=headers, stream=True, verify=False, timeout=(10, 600))
-            response.raise_for_status()
-
-            # --- 前端职责：获取文件名，准备本地保存 ---
-            content_disposition = response.headers.get("Content-Disposition", "")
-            zip_filename = response.headers.get("X-Zip-Filename") # 优先使用后端指定的头
-            if not zip_filename and "filename=" in content_disposition:
-                 filename_part = content_disposition.split("filename=")[1]
-                 if filename_part: zip_filename = filename_part.strip('" ')
-            if not zip_filename: zip_filename = f"flydrop_{uuid.uuid4().hex[:6]}.zip"
+            # --- 前端职责：向后端创建打包任务（立即返回任务 ID） ---
+            job = self.client.create_zip_job(paths)
+            zip_filename = job["filename"]
 
             download_dir = self.config.get("download_dir", os.path.expanduser("~/Downloads/FlyDrop"))
             os.makedirs(download_dir, exist_ok=True)
             save_path = os.path.join(download_dir, zip_filename) # 本地保存路径
 
-            # --- 前端职责：显示打包下载进度 ---
-            total_size = int(response.headers.get("Content-Length", 0))
-            progress = QProgressDialog(f"下载 '{zip_filename}'...", "取消", 0, max(1, total_size), self)
-            progress.setWindowTitle("打包下载")
-            progress.setMinimumDuration(0)
-            progress.setCancelButton(None)
-            progress.setValue(0)
-            progress.show()
-            QApplication.processEvents()
-
-            # --- 前端职责：接收后端数据流并写入本地文件 ---
-            downloaded = 0
-            with open(save_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                       f.write(chunk) # 写入本地文件
-                       downloaded += len(chunk)
-                       if total_size > 0: progress.setValue(downloaded)
-                       else: progress.setLabelText(f"下载中... ({downloaded / (1024*1024):.2f} MB)")
-                    QApplication.processEvents() # 保持 UI 响应
-
-            if total_size > 0: progress.setValue(total_size)
-            else: progress.setValue(progress.maximum())
-            QMessageBox.information(self, "下载完成", f"打包文件 '{zip_filename}' 已保存到:\n{save_path}")
-
+            # --- 下载交给下载管理器，打包尚未完成时服务端会边写边传 ---
+            headers = {"Authorization": self.access_password}
+            task = self.download_manager.add(self.client.zip_job_download_url(job["job_id"]), headers,
+                                             save_path, name=zip_filename)
+            self.transfer_panel.show()
         except requests.exceptions.RequestException as e:
-            QMessageBox.critical(self, "打包失败", f"请求打包文件失败: {e}")
+            QMessageBox.critical(self, "打包失败", f"创建打包任务失败: {e}")
+            return
         except Exception as e:
             print(f"[Download Zip] Unexpected Error: {e}")
             traceback.print_exc()
             QMessageBox.critical(self, "打包失败", f"处理打包下载时发生未知错误: {e}")
-        finally:
-            if progress: progress.close() # 确保关闭进度条
+            return
+
+        # --- 前端职责：显示真实的打包进度（非模态，可取消） ---
+        progress = QProgressDialog(f"正在打包 '{zip_filename}'...", "取消", 0, 1000, self)
+        progress.setWindowTitle("打包下载")
+        progress.setWindowModality(Qt.NonModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setValue(0)
+
+        timer = QTimer(progress)
+        timer.timeout.connect(lambda: self.poll_zip_job(job["job_id"], task.id, progress, timer))
+        progress.canceled.connect(lambda: self.cancel_zip_job(job["job_id"], task.id, timer))
+        timer.start(500)
+        self.update_zip_progress(progress, job)
+
+    def update_zip_progress(self, progress: QProgressDialog, status: dict):
+        """根据任务状态更新打包进度对话框"""
+        total = status.get("bytes_total") or 0
+        done = status.get("bytes_done") or 0
+        progress.setValue(int(1000 * done / total) if total else 0)
+        eta = status.get("eta")
+        eta_text = f"，剩余约 {int(eta)} 秒" if eta is not None else ""
+        progress.setLabelText(
+            f"正在打包 '{status['filename']}'\n"
+            f"文件 {status['files_done']}/{status['files_total']}，"
+            f"{format_size(done)}/{format_size(total)}{eta_text}")
+
+    def poll_zip_job(self, job_id: str, task_id: str, progress: QProgressDialog, timer: QTimer):
+        """定时查询打包任务进度"""
+        try:
+            status = self.client.zip_job_status(job_id)
+        except requests.exceptions.RequestException as e:
+            print(f"[Download Zip] 查询进度失败: {e}")
+            return
+
+        if status["state"] == "building":
+            self.update_zip_progress(progress, status)
+            return
+
+        timer.stop()
+        progress.blockSignals(True) # 关闭对话框时不触发取消
+        progress.close()
+        if status["state"] == "failed":
+            self.download_manager.cancel(task_id)
+            QMessageBox.critical(self, "打包失败", f"服务端打包失败: {status.get('error', '')}")
+
+    def cancel_zip_job(self, job_id: str, task_id: str, timer: QTimer):
+        """用户取消打包：先停止下载，再取消服务端任务"""
+        timer.stop()
+        self.download_manager.cancel(task_id)
+        try:
+            self.client.cancel_zip_job(job_id)
+        except requests.exceptions.RequestException as e:
+            print(f"[Download Zip] 取消任务失败: {e}")
+
+    def send_to_device(self):
+        """用户点击“发送到设备”：让目标设备直接从当前设备拉取选中的文件，数据不经过本机"""
+        nodes = self.selected_nodes()
+        if not nodes:
+            QMessageBox.warning(self, "未选择", "请选择要发送的文件或文件夹")
+            return
+
+        targets = {}
+        for i in range(self.device_selector.count()):
+            url = self.device_selector.itemData(i)
+            if url and url != self.base_url:
+                targets[self.device_selector.itemText(i)] = url
+        if not targets:
+            QMessageBox.warning(self, "没有其它设备", "没有发现可以发送到的其它设备")
+            return
 
+        target_name, ok = QInputDialog.getItem(self, "发送到设备", "目标设备：", list(targets), 0, False)
+        if not ok:
+            return
+        dest, ok = QInputDialog.getText(self, "发送到设备", "保存到对方共享目录下的文件夹：", text="FlyDrop")
+        if not ok:
+            return
+
+        target_url = targets[target_name]
+        target = PeerClient(target_url, self.access_password)
+        source_url = address_for_peer(self.base_url, target_url) # “本机”要换成对方能访问的地址
+        paths = [node.path for node in nodes]
+        try:
+            # 源设备为目标设备签发只能读取这些路径的令牌，目标设备凭它用自己的下载引擎去拉取
+            target_ip = urlsplit(address_for_peer(target_url, self.base_url)).hostname
+            token = self.client.grant(paths, target_ip)
+        except requests.exceptions.RequestException as e:
+            QMessageBox.critical(self, "发送失败", f"源设备无法签发授权: {e}")
+            return
+        try:
+            job = target.create_pull(source_url, token, paths, dest.strip())
+        except requests.exceptions.RequestException as e:
+            QMessageBox.critical(self, "发送失败", f"目标设备拒绝了传输请求: {e}")
+            return
+
+        # --- 只接收进度，非模态，可取消 ---
+        progress = QProgressDialog(f"正在发送到 {target_name}...", "取消", 0, 1000, self)
+        progress.setWindowTitle("发送到设备")
+        progress.setWindowModality(Qt.NonModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setValue(0)
+
+        timer = QTimer(progress)
+        timer.timeout.connect(lambda: self.poll_pull_job(target, target_name, job["job_id"], progress, timer))
+        progress.canceled.connect(lambda: self.cancel_pull_job(target, job["job_id"], timer))
+        timer.start(500)
+
+    def poll_pull_job(self, target: PeerClient, target_name: str, job_id: str,
+                      progress: QProgressDialog, timer: QTimer):
+        """定时查询目标设备上的传输进度"""
+        try:
+            status = target.pull_status(job_id)
+        except requests.exceptions.RequestException as e:
+            print(f"[Send] 查询进度失败: {e}")
+            return
+
+        total = status.get("bytes_total") or 0
+        done = status.get("bytes_done") or 0
+        if status["state"] in ("listing", "running"):
+            progress.setValue(int(1000 * done / total) if total else 0)
+            eta = status.get("eta")
+            eta_text = f"，剩余约 {int(eta)} 秒" if eta is not None else ""
+            progress.setLabelText(
+                f"正在发送到 {target_name}\n"
+                f"文件 {status['files_done']}/{status['files_total']}，"
+                f"{format_size(done)}/{format_size(total)}，{format_size(status.get('speed') or 0)}/s{eta_text}")
+            return
+
+        timer.stop()
+        progress.blockSignals(True) # 关闭对话框时不触发取消
+        progress.close()
+        if status["state"] == "failed":
+            failed = "、".join(status.get("files_failed", [])[:5])
+            QMessageBox.critical(self, "发送失败", f"{status.get('error', '')}\n{failed}")
+        elif status["state"] == "done":
+            print(f"[Send] 已发送 {status['files_total']} 个文件到 {target_name}")
+
+    def cancel_pull_job(self, target: PeerClient, job_id: str, timer: QTimer):
+        timer.stop()
+        try:
+            target.cancel_pull(job_id)
+        except requests.exceptions.RequestException as e:
+            print(f"[Send] 取消任务失败: {e}")
 
     def fetch_devices(self):
-        """向后端请求已发现的设备列表"""
-        # 通常设备发现服务在本机运行
-        discovery_url = f"https://localhost:{self.config.get('port', 8010)}/api/devices"
+        """在后台线程向后端请求已发现的设备列表，不阻塞界面"""
+        if self._fetching_devices: return # 上一次请求还没结束
+        self._fetching_devices = True
+        port = self.config.get('port', 8010)
+        threading.Thread(target=self._fetch_devices_worker, args=(port,), daemon=True).start()
+
+    def _fetch_devices_worker(self, port):
+        """（后台线程）请求设备列表，结果通过信号交回主线程"""
+        # 通常设备发现服务在本机运行；5 秒一次的轮询复用同一条会话/连接
+        local_url = f"https://localhost:{port}"
+        if self.local_client is None or self.local_client.base_url != local_url:
+            self.local_client = PeerClient(local_url, self.access_password, self.use_ws_session)
+        discovered_devices = None
         try:
             # --- 前端职责：向后端设备接口发送请求 ---
-            headers = {"Authorization": self.access_password}
-            response = requests.get(discovery_url, headers=headers, verify=False, timeout=3)
-            response.raise_for_status()
-            data = response.json() # 后端返回的设备列表
+            data = self.local_client.devices() # 后端返回的设备列表
 
             # --- 前端职责：处理响应数据 ---
-            if not isinstance(data, list): return # 忽略无效数据
-            discovered_devices = {}
-            for dev in data:
-                if isinstance(dev, dict) and "name" in dev and "ip" in dev:
-                     port = self.config.get('port', 8010)
-                     discovered_devices[dev["name"]] = f"https://{dev['ip']}:{port}"
-
-            self.update_devices(discovered_devices) # 更新 UI 列表
+            if isinstance(data, list): # 忽略无效数据
+                discovered_devices = {}
+                for dev in data:
+                    if isinstance(dev, dict) and "name" in dev and "ip" in dev:
+                         label = dev["name"]
+                         if label in discovered_devices: # 同名设备按 ID 区分，不互相覆盖
+                             label = f"{label} #{str(dev.get('id', dev['ip']))[-6:]}"
+                         discovered_devices[label] = f"https://{dev['ip']}:{port}"
 
         except requests.exceptions.RequestException:
             pass # 后台刷新失败，静默处理
         except Exception as e:
             print(f"[Fetch Devices] Error: {e}") # 打印其他错误到控制台
-            pass
+        finally:
+            self.devices_fetched.emit(discovered_devices)
+
+    def on_devices_fetched(self, discovered_devices):
+        """槽：后台设备请求完成"""
+        self._fetching_devices = False
+        if discovered_devices is None: return
+        self.discovered_devices = discovered_devices
+        self.update_devices(discovered_devices) # 更新 UI 列表
+        if self.link_profiles is not None:
+            for client in self.peer_clients(): # 画像过期的设备在后台重新探测
+                self.link_profiles.ensure_probed(client)
 
     def update_devices(self, discovered_devices: dict):
         """更新设备下拉框的选项"""
@@ -424,7 +588,7 @@ class FileDownloadPage(QWidget):
              self.device_selector.setCurrentIndex(new_index_to_select)
              # 如果设置索引后，URL 没变，但树是空的，需要手动刷新
              new_selected_url = self.device_selector.itemData(new_index_to_select)
-             if self.base_url == new_selected_url and not self.tree.topLevelItemCount():
+             if self.base_url == new_selected_url and self.model.client is None:
                   self.refresh_root()
              # 如果 base_url 尚未初始化，则进行初始化
              elif not self.base_url:
@@ -453,12 +617,17 @@ class FileDownloadPage(QWidget):
     def closeEvent(self, event):
         """窗口关闭时停止定时器和可能的下载"""
         self.device_refresh_timer.stop()
-        for thread in self.active_download_threads[:]:
-            try:
-                if hasattr(thread, 'stop') and callable(thread.stop):
-                    thread.stop() # 请求线程停止
-            except Exception as e:
-                print(f"Error stopping thread {thread}: {e}")
+        self.download_manager.shutdown() # 停止所有下载，未完成的 .part 保留，下次下载同一文件时续传
+        self.model.shutdown()
+        if self.link_profiles is not None:
+            self.link_profiles.save()
+        if self.change_watcher is not None:
+            self.change_watcher.stop()
+        if self.model.cache is not None:
+            self.model.cache.save()
+        self.client.close_ws_session()
+        if self.local_client is not None:
+            self.local_client.close_ws_session()
         super().closeEvent(event)
 
 # --- 用于独立测试此文件的入口 ---
@@ -470,14 +639,6 @@ if __name__ == '__main__':
          return {"base_url": "https://localhost:8010", "access_password": "YOUR_PASSWORD", "port": 8010, "download_dir": os.path.expanduser("~/Downloads/FlyDropTest")}
     import frontend.config
     frontend.config.get_settings = get_settings_for_test
-    # --- 确保线程类存在 (或用占位符) ---
-    try: from frontend.threads.downloader import FileDownloadThread
-    except ImportError:
-        class FileDownloadThread(QThread): # 最小占位符
-            progress=Signal(int); finished=Signal(str); failed=Signal(str,str)
-            def __init__(self,u,h,s,p=None): super().__init__(p);self.name=os.path.basename(s)
-            def run(self): print("Placeholder run"); self.progress.emit(100); self.finished.emit(self.name)
-            def stop(self): pass
     # --- 显示窗口 ---
     main_window = QWidget()
     main_window.setWindowTitle("File Download Test")
@@ -0,0 +1,158 @@
+# frontend/pages/preview_pane.py
+
+import threading
+from collections import OrderedDict
+
+import requests
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPlainTextEdit, QStackedWidget
+from PySide6.QtCore import Qt, QObject, QTimer, Signal
+from PySide6.QtGui import QPixmap
+
+from frontend.pages.transfer_panel import format_size
+
+THUMB_SIZE = 256        # 请求的缩略图长边
+MEMORY_ENTRIES = 64     # 内存里保留的最近预览数
+SELECT_DELAY = 200      # 选中停留这么久（毫秒）才请求，方向键快速移动时不会逐个请求
+
+MEDIA_LABELS = {"format": "格式", "width": "宽度", "height": "高度", "duration": "时长（秒）",
+                "channels": "声道", "sample_rate": "采样率", "bits": "位深", "bit_rate": "码率",
+                "mode": "色彩模式", "title": "标题", "artist": "艺术家", "album": "专辑", "year": "年份"}
+
+
+class _Bridge(QObject):
+    loaded = Signal(int, object, str, object)   # 请求序号, 缓存键, 预览类型, 内容
+    failed = Signal(int, str)
+
+
+class PreviewPane(QWidget):
+    """
+    文件树旁的预览面板：选中文件时向设备请求预览（缩略图、文本开头、压缩包目录或媒体信息），
+    不下载整个文件。服务端生成并缓存预览，这里按“路径 + 大小 + mtime”再缓存最近的几十个。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.client = None
+        self.node = None
+        self.request_id = 0     # 每次选中变化递增，丢弃过期的结果
+        self.memory = OrderedDict()
+
+        self.bridge = _Bridge()
+        self.bridge.loaded.connect(self._on_loaded)
+        self.bridge.failed.connect(self._on_failed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._request)
+
+        self.title_label = QLabel()
+        self.title_label.setWordWrap(True)
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.text_view = QPlainTextEdit()
+        self.text_view.setReadOnly(True)
+        self.text_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.stack = QStackedWidget()
+        self.stack.addWidget(self.image_label)  # 图片，也用来显示提示和媒体信息
+        self.stack.addWidget(self.text_view)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.title_label)
+        layout.addWidget(self.stack, 1)
+        self._show_message("选择文件以预览")
+
+    def set_client(self, client):
+        self.client = client
+        self.memory.clear()
+        self.show_node(None)
+
+    def show_node(self, node):
+        """槽：当前选中的条目变化"""
+        self.node = node
+        self.request_id += 1
+        self.timer.stop()
+        if node is None or node.is_dir:
+            self.title_label.clear()
+            self._show_message("选择文件以预览")
+            return
+        size = f"（{format_size(node.size)}）" if node.size is not None else ""
+        self.title_label.setText(f"{node.name}{size}")
+        cached = self.memory.get(self._key(node))
+        if cached is not None:
+            self.memory.move_to_end(self._key(node))
+            self._render(*cached)
+            return
+        self._show_message("正在加载预览…")
+        self.timer.start(SELECT_DELAY)
+
+    def _key(self, node):
+        return node.path, node.size, node.mtime
+
+    def _request(self):
+        if self.client is None or self.node is None:
+            return
+        threading.Thread(target=self._fetch, args=(self.client, self.node, self.request_id), daemon=True).start()
+
+    def _fetch(self, client, node, request_id):
+        try:
+            kind, result = client.preview(node.path, size=THUMB_SIZE)
+        except requests.exceptions.HTTPError as e:
+            response = e.response
+            if response is not None and response.status_code == 404 and response.json().get("detail") == "Not Found":
+                message = "对方版本不支持预览"   # 旧版本没有这个接口
+            elif response is not None and response.status_code == 415:
+                message = f"无法预览：{response.json().get('detail', '')}"
+            else:
+                message = f"预览失败：{e}"
+            self.bridge.failed.emit(request_id, message)
+            return
+        except Exception as e:
+            self.bridge.failed.emit(request_id, f"预览失败：{e}")
+            return
+        self.bridge.loaded.emit(request_id, self._key(node), kind, result)
+
+    def _on_loaded(self, request_id, key, kind, result):
+        self.memory[key] = (kind, result)
+        while len(self.memory) > MEMORY_ENTRIES:
+            self.memory.popitem(last=False)
+        if request_id == self.request_id:
+            self._render(kind, result)
+
+    def _on_failed(self, request_id, message):
+        if request_id == self.request_id:
+            self._show_message(message)
+
+    # --- 显示 ---
+    def _show_message(self, text):
+        self.image_label.setPixmap(QPixmap())
+        self.image_label.setText(text)
+        self.stack.setCurrentWidget(self.image_label)
+
+    def _render(self, kind, result):
+        if kind == "thumb":
+            pixmap = QPixmap()
+            if not pixmap.loadFromData(result):
+                self._show_message("缩略图无法显示")
+                return
+            self.image_label.setText("")
+            self.image_label.setPixmap(pixmap)
+            self.stack.setCurrentWidget(self.image_label)
+        elif kind == "text":
+            text = result["text"]
+            if result.get("truncated"):
+                text += "\n…（只显示开头部分）"
+            self.text_view.setPlainText(text)
+            self.stack.setCurrentWidget(self.text_view)
+        elif kind == "archive":
+            lines = [f"{'' if e['is_dir'] else format_size(e['size']):>10}  {e['name']}" for e in result["entries"]]
+            count = result.get("count")
+            summary = f"共 {count} 项" if count is not None else f"超过 {len(lines)} 项"
+            if result.get("truncated"):
+                summary += f"，只列出前 {len(lines)} 项"
+            self.text_view.setPlainText("\n".join([summary, ""] + lines))
+            self.stack.setCurrentWidget(self.text_view)
+        else:
+            lines = [f"{label}：{result[key]}" for key, label in MEDIA_LABELS.items() if result.get(key)]
+            for stream in result.get("streams", []):
+                lines.append(f"流：{stream.get('type')} {stream.get('codec') or ''}")
+            self._show_message("\n".join(lines) or "没有可显示的信息")
@@ -0,0 +1,463 @@
+# frontend/pages/remote_file_model.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import (
+    QAbstractItemModel, QModelIndex, Qt, QObject, QTimer, Signal
+)
+
+from frontend.pages.transfer_panel import format_size
+
+PAGE_SIZE = 500          # 每次向后端请求的条目数
+STAT_BATCH = 200         # 每次批量获取元数据的条目数
+STAT_DELAY_MS = 50       # 合并可见行元数据请求的等待时间
+
+COLUMNS = ["文件名", "大小", "修改时间"]
+SORT_FIELDS = {0: "name", 1: "size", 2: "mtime"}
+
+
+class Node:
+    """树中的一个条目；目录的子节点按页追加"""
+    __slots__ = ("name", "path", "is_dir", "parent", "children", "total", "fetched",
+                 "fetching", "size", "mtime", "stat_pending", "row", "epoch")
+
+    def __init__(self, name, path, is_dir, parent=None, row=0):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.parent = parent
+        self.row = row
+        self.children = []
+        self.total = None      # 服务端返回的总条目数，未加载时为 None
+        self.fetched = 0       # 已取回的服务端条目数（含本地过滤掉的隐藏文件）
+        self.fetching = False
+        self.size = None
+        self.mtime = None
+        self.stat_pending = False
+        self.epoch = 0         # 节点被重新加载或移除时递增，丢弃它过期的后台结果
+
+    def can_fetch_more(self):
+        if not self.is_dir or self.fetching:
+            return False
+        return self.total is None or self.fetched < self.total
+
+
+class _Bridge(QObject):
+    """把后台线程的结果切回主线程"""
+    page_loaded = Signal(object, int, int, int, object, int)   # 节点, 代数, 节点代数, 偏移, 条目, 总数
+    page_failed = Signal(object, int, int, str)
+    page_stale = Signal(object, int, int)            # 已显示的缓存页在服务端已变化
+    page_revalidated = Signal(object, int, int, bool)  # 节点, 代数, 节点代数, 是否有变化
+    stats_loaded = Signal(int, object)               # 代数, {path: stat}
+
+
+class RemoteFileModel(QAbstractItemModel):
+    """
+    按需分页加载的远程文件树模型。
+    只为已加载的条目创建轻量 Node，视图只渲染可见行；
+    排序和名称过滤交给服务端，大小/时间列在行可见时才请求。
+    设置了列表缓存时先显示缓存再用 ETag 确认；隐藏文件在本地过滤，切换时不必重新请求。
+    已加载完的目录收到服务端推送的变化时就地增删行，不重新加载整棵树。
+    """
+    load_failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.client = None
+        self.cache = None
+        self.show_hidden = False
+        self.name_filter = ""
+        self.sort_field = "name"
+        self.sort_desc = False
+        self.root = Node("", "", True)
+        self.generation = 0   # 每次重置递增，丢弃过期的后台结果
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self._nodes_by_path = {}
+        self._stat_queue = []
+
+        self.bridge = _Bridge()
+        self.bridge.page_loaded.connect(self._on_page_loaded)
+        self.bridge.page_failed.connect(self._on_page_failed)
+        self.bridge.page_stale.connect(self._on_page_stale)
+        self.bridge.page_revalidated.connect(self._on_page_revalidated)
+        self.bridge.stats_loaded.connect(self._on_stats_loaded)
+
+        self.stat_timer = QTimer(self)
+        self.stat_timer.setSingleShot(True)
+        self.stat_timer.timeout.connect(self._flush_stats)
+
+    # --- 对外接口 ---
+    def set_client(self, client, cache=None):
+        self.client = client
+        self.cache = cache
+        self.reset()
+
+    def set_show_hidden(self, show_hidden):
+        self.show_hidden = show_hidden
+        self.reset()
+
+    def set_name_filter(self, text):
+        self.name_filter = text.strip()
+        self.reset()
+
+    def reset(self):
+        self.beginResetModel()
+        self.generation += 1
+        self.root = Node("", "", True)
+        self._nodes_by_path = {}
+        self._stat_queue = []
+        self.endResetModel()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def dir_node(self, path):
+        """已加载的目录节点，没有时返回 None"""
+        node = self.root if path == "" else self._nodes_by_path.get(path)
+        return node if node is not None and node.is_dir else None
+
+    def expanded_dirs(self, is_expanded):
+        """已加载并展开的目录路径（含根目录 ""），is_expanded(index) 由视图提供"""
+        paths, stack = [""], list(self.root.children)
+        while stack:
+            node = stack.pop()
+            if node.is_dir and node.total is not None and is_expanded(self._index_of(node)):
+                paths.append(node.path)
+                stack.extend(node.children)
+        return paths
+
+    def revalidate(self, node):
+        """向服务端确认该目录已加载的列表，有变化时重新加载（展开状态会收起）"""
+        if self.client is None or node.total is None or node.fetching:
+            return
+        if self.cache is None:
+            self.bridge.page_stale.emit(node, self.generation, node.epoch)
+            return
+        self.cache.expire(node.path)
+        node.fetching = True
+        self.executor.submit(self._revalidate, node, self.generation, node.epoch, node.fetched)
+
+    def revalidate_all(self):
+        """刷新：确认所有已加载的目录，只有变化了的目录会重新加载"""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            self.revalidate(node)
+            stack.extend(child for child in node.children if child.total is not None)
+
+    def apply_changes(self, result):
+        """应用 /api/files/changes 返回的变化"""
+        if result.get("reset"):
+            self.revalidate_all()
+            return
+        for path in result.get("stale", []):
+            node = self.dir_node(path)
+            if node is not None:
+                self.revalidate(node)
+        for event in result.get("events", []):
+            node = self.dir_node(event["dir"])
+            if node is None or node.total is None:
+                continue  # 没有加载过的目录，展开时自然会拿到最新列表
+            if self.cache is not None:
+                self.cache.expire(node.path)
+            if node.fetching or node.fetched < node.total:
+                self.revalidate(node)  # 只加载了一部分，插入的位置无法确定，整目录确认
+                continue
+            kind = event["type"]
+            if kind == "modified":
+                self._patch_modified(event["path"])
+            elif kind == "deleted":
+                self._patch_deleted(node, event["path"], event["name"])
+            elif kind == "created":
+                self._patch_created(node, event)
+            elif kind == "renamed":
+                self._patch_deleted(node, event["old_path"], event["old_path"].rsplit("/", 1)[-1])
+                self._patch_created(node, event)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- QAbstractItemModel ---
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if 0 <= row < len(node.children) and 0 <= column < len(COLUMNS):
+            return self.createIndex(row, column, node.children[row])
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        parent = node.parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() and parent.column() != 0:
+            return 0
+        return len(self.node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if not node.is_dir:
+            return False
+        return node.total is None or node.total > 0
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return node.name
+            if node.size is None:
+                self._request_stat(node)  # 只有真正被绘制的行才会走到这里
+                return ""
+            if column == 1:
+                return "" if node.is_dir else format_size(node.size)
+            if column == 2:
+                return time.strftime("%Y-%m-%d %H:%M", time.localtime(node.mtime))
+        elif role == Qt.UserRole:
+            return node.path
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return self.client is not None and self.node(parent).can_fetch_more()
+
+    def fetchMore(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if not self.canFetchMore(parent):
+            return
+        node.fetching = True
+        self.executor.submit(self._load_page, node, self.generation, node.epoch, node.fetched)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        field = SORT_FIELDS.get(column, "name")
+        desc = order == Qt.DescendingOrder
+        if field == self.sort_field and desc == self.sort_desc:
+            return
+        self.sort_field, self.sort_desc = field, desc
+        self.reset()  # 排序由服务端完成，重新按页加载
+
+    # --- 后台加载 ---
+    def _load_page(self, node, generation, epoch, offset):
+        # 总是请求包含隐藏文件的列表，是否显示在本地过滤，这样切换时可以直接用缓存
+        params = {"path": node.path, "offset": offset, "limit": PAGE_SIZE, "sort": self.sort_field,
+                  "desc": self.sort_desc, "show_hidden": True, "q": self.name_filter, "fields": ""}
+        cache, key, cached = self.cache, None, None
+        if cache is not None:
+            key = cache.key(node.path, self.sort_field, self.sort_desc, self.name_filter, offset, PAGE_SIZE)
+            cached = cache.get(key)
+            if cached is not None:
+                self.bridge.page_loaded.emit(node, generation, epoch, offset, cached["entries"], cached["total"])
+                if cache.is_fresh(key):
+                    return
+
+        try:
+            result = self.client.list_dir_if_changed(cached["etag"] if cached else None, **params)
+        except Exception as e:
+            if cached is None:  # 有缓存时离线也继续显示缓存
+                self.bridge.page_failed.emit(node, generation, epoch, f"{type(e).__name__}: {e}")
+            return
+        if result is None:  # 304，缓存仍然有效
+            cache.mark_validated(key)
+            return
+        entries, total, etag = result
+        if cache is not None:
+            cache.put(key, etag, entries, total)
+        if cached is None:
+            self.bridge.page_loaded.emit(node, generation, epoch, offset, entries, total)
+        else:
+            self.bridge.page_stale.emit(node, generation, epoch)
+
+    def _revalidate(self, node, generation, epoch, fetched):
+        """（后台线程）逐页带 ETag 确认，任何一页变化都重新加载整个目录"""
+        params = {"path": node.path, "limit": PAGE_SIZE, "sort": self.sort_field, "desc": self.sort_desc,
+                  "show_hidden": True, "q": self.name_filter, "fields": ""}
+        changed = False
+        try:
+            for offset in range(0, max(fetched, 1), PAGE_SIZE):
+                key = self.cache.key(node.path, self.sort_field, self.sort_desc, self.name_filter, offset, PAGE_SIZE)
+                cached = self.cache.get(key)
+                result = self.client.list_dir_if_changed(cached["etag"] if cached else None, offset=offset, **params)
+                if result is None:
+                    self.cache.mark_validated(key)
+                    continue
+                entries, total, etag = result
+                self.cache.put(key, etag, entries, total)
+                changed = True
+                break
+        except Exception as e:
+            print(f"[RemoteFileModel] 确认 {node.path or '/'} 失败: {e}")
+        self.bridge.page_revalidated.emit(node, generation, epoch, changed)
+
+    def _on_page_revalidated(self, node, generation, epoch, changed):
+        if generation != self.generation or epoch != node.epoch:
+            return
+        node.fetching = False
+        if changed:
+            self._on_page_stale(node, generation, epoch)
+
+    def _patch_modified(self, path):
+        node = self._nodes_by_path.get(path)
+        if node is None:
+            return
+        node.size = node.mtime = None   # 下次绘制时重新获取元数据
+        node.stat_pending = False
+        self.dataChanged.emit(self.createIndex(node.row, 1, node), self.createIndex(node.row, 2, node))
+
+    def _matches_filter(self, name):
+        return not self.name_filter or self.name_filter.lower() in name.lower()
+
+    def _patch_deleted(self, parent, path, name):
+        child = self._nodes_by_path.get(path)
+        if child is not None and child.parent is parent:
+            row = child.row
+            self.beginRemoveRows(self._index_of(parent), row, row)
+            del parent.children[row]
+            for sibling in parent.children[row:]:
+                sibling.row -= 1
+            self._discard(child)
+            self.endRemoveRows()
+        elif not self._matches_filter(name):
+            return  # 服务端按名称过滤掉的条目，从未计入总数
+        parent.total -= 1
+        parent.fetched -= 1
+        if parent.total == 0:
+            self.dataChanged.emit(self._index_of(parent), self._index_of(parent))
+
+    def _patch_created(self, parent, event):
+        if event["path"] in self._nodes_by_path:
+            self._patch_modified(event["path"])
+            return
+        if not self._matches_filter(event["name"]):
+            return
+        parent.total += 1
+        parent.fetched += 1
+        if not self.show_hidden and event["name"].startswith("."):
+            return
+        row = self._insert_position(parent, event["name"], event["is_dir"])
+        self.beginInsertRows(self._index_of(parent), row, row)
+        child = Node(event["name"], event["path"], event["is_dir"], parent, row)
+        parent.children.insert(row, child)
+        for sibling in parent.children[row + 1:]:
+            sibling.row += 1
+        self._nodes_by_path[child.path] = child
+        self.endInsertRows()
+
+    def _insert_position(self, parent, name, is_dir):
+        """按服务端的名称排序规则（目录在前，忽略大小写）找到插入位置；其它排序方式放到末尾"""
+        if self.sort_field != "name":
+            return len(parent.children)
+        key = (not is_dir, name.lower())
+        for i, child in enumerate(parent.children):
+            child_key = (not child.is_dir, child.name.lower())
+            if (child_key > key) != self.sort_desc:
+                return i
+        return len(parent.children)
+
+    def _index_of(self, node):
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def _on_page_loaded(self, node, generation, epoch, offset, entries, total):
+        if generation != self.generation or epoch != node.epoch or offset != node.fetched:
+            return
+        node.fetching = False
+        node.total = total
+        node.fetched += len(entries)
+        if not entries:
+            node.total = node.fetched
+            self.dataChanged.emit(self._index_of(node), self._index_of(node))
+            return
+
+        if not self.show_hidden:
+            entries = [e for e in entries if not e["name"].startswith(".")]
+        if entries:
+            first = len(node.children)
+            self.beginInsertRows(self._index_of(node), first, first + len(entries) - 1)
+            for i, entry in enumerate(entries):
+                child = Node(entry["name"], entry["path"], entry["type"] == "dir", node, first + i)
+                node.children.append(child)
+                self._nodes_by_path[child.path] = child
+            self.endInsertRows()
+        elif node.can_fetch_more():
+            self.fetchMore(self._index_of(node))  # 这一页全是隐藏文件，视图不会再来要下一页
+
+    def _on_page_failed(self, node, generation, epoch, message):
+        if generation != self.generation or epoch != node.epoch:
+            return
+        node.fetching = False
+        node.total = node.fetched  # 停止自动重试，刷新后再加载
+        self.load_failed.emit(message)
+
+    def _on_page_stale(self, node, generation, epoch):
+        """缓存的列表已过期：清空该目录已显示的条目，从刚更新的缓存重新加载"""
+        if generation != self.generation or epoch != node.epoch:
+            return
+        index = self._index_of(node)
+        if node.children:
+            self.beginRemoveRows(index, 0, len(node.children) - 1)
+            for child in node.children:
+                self._discard(child)
+            node.children = []
+            self.endRemoveRows()
+        node.epoch += 1
+        node.total = None
+        node.fetched = 0
+        node.fetching = False
+        self.fetchMore(index)
+
+    def _discard(self, node):
+        self._nodes_by_path.pop(node.path, None)
+        node.epoch += 1
+        for child in node.children:
+            self._discard(child)
+
+    def _request_stat(self, node):
+        if node.stat_pending:
+            return
+        node.stat_pending = True
+        self._stat_queue.append(node.path)
+        if not self.stat_timer.isActive():
+            self.stat_timer.start(STAT_DELAY_MS)
+
+    def _flush_stats(self):
+        paths, self._stat_queue = self._stat_queue, []
+        for i in range(0, len(paths), STAT_BATCH):
+            self.executor.submit(self._load_stats, paths[i:i + STAT_BATCH], self.generation)
+
+    def _load_stats(self, paths, generation):
+        try:
+            self.bridge.stats_loaded.emit(generation, self.client.stat(paths))
+        except Exception as e:
+            print(f"[RemoteFileModel] 获取元数据失败: {e}")
+
+    def _on_stats_loaded(self, generation, stats):
+        if generation != self.generation:
+            return
+        for path, info in stats.items():
+            node = self._nodes_by_path.get(path)
+            if node is None:
+                continue
+            node.size = info.get("size", 0)
+            node.mtime = info.get("mtime", 0)
+            self.dataChanged.emit(self.createIndex(node.row, 1, node),
+                                  self.createIndex(node.row, 2, node))
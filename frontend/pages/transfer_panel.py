@@ -0,0 +1,134 @@
+# frontend/pages/transfer_panel.py
+
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget,
+    QTreeWidgetItem, QLabel, QAbstractItemView
+)
+from PySide6.QtCore import Qt
+
+from frontend.core import download_engine as engine
+
+STATE_TEXT = {
+    engine.QUEUED: "排队中",
+    engine.RUNNING: "下载中",
+    engine.PAUSED: "已暂停",
+    engine.DONE: "已完成",
+    engine.FAILED: "失败",
+    engine.CANCELED: "已取消",
+}
+
+
+def format_size(num):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class TransferPanel(QWidget):
+    """统一的传输面板：每项进度/速度/剩余时间 + 总体吞吐量"""
+
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.rows = {}   # task id -> QTreeWidgetItem
+        self.last = {}   # task id -> 上次显示的 (state, downloaded)，没变化就不重绘
+
+        self.list = QTreeWidget()
+        self.list.setHeaderLabels(["文件名", "大小", "进度", "速度", "剩余时间", "状态"])
+        self.list.setRootIsDecorated(False)
+        self.list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.list.setColumnWidth(0, 260)
+
+        self.summary_label = QLabel("没有传输任务")
+
+        self.pause_button = QPushButton("暂停")
+        self.resume_button = QPushButton("继续")
+        self.cancel_button = QPushButton("取消")
+        self.pause_all_button = QPushButton("全部暂停")
+        self.resume_all_button = QPushButton("全部继续")
+        self.clear_button = QPushButton("清除已完成")
+
+        self.pause_button.clicked.connect(lambda: self._for_selected(self.manager.pause))
+        self.resume_button.clicked.connect(lambda: self._for_selected(self.manager.resume))
+        self.cancel_button.clicked.connect(lambda: self._for_selected(self.manager.cancel))
+        self.pause_all_button.clicked.connect(self.manager.pause_all)
+        self.resume_all_button.clicked.connect(self.manager.resume_all)
+        self.clear_button.clicked.connect(self.manager.clear_finished)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.summary_label)
+        buttons.addStretch()
+        for button in (self.pause_button, self.resume_button, self.cancel_button,
+                       self.pause_all_button, self.resume_all_button, self.clear_button):
+            buttons.addWidget(button)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(buttons)
+        layout.addWidget(self.list)
+
+        self.manager.updated.connect(self.on_updated)
+
+    def _for_selected(self, action):
+        for row in self.list.selectedItems():
+            action(row.data(0, Qt.UserRole))
+
+    def on_updated(self, items, summary):
+        """槽：根据引擎快照更新列表和汇总"""
+        seen = set()
+        for item in items:
+            task_id = item["id"]
+            seen.add(task_id)
+            row = self.rows.get(task_id)
+            if row is None:
+                row = QTreeWidgetItem([item["name"], "", "", "", "", ""])
+                row.setData(0, Qt.UserRole, task_id)
+                self.list.addTopLevelItem(row)
+                self.rows[task_id] = row
+
+            key = (item["state"], item["downloaded"], item["total"])
+            if self.last.get(task_id) == key and item["state"] != engine.RUNNING:
+                continue
+            self.last[task_id] = key
+
+            total = item["total"]
+            percent = int(100 * item["downloaded"] / total) if total else 0
+            running = item["state"] == engine.RUNNING
+            row.setText(1, format_size(total) if total else "--")
+            row.setText(2, f"{percent}%")
+            row.setText(3, f"{format_size(item['speed'])}/s" if running else "")
+            row.setText(4, format_eta(item["eta"]) if running else "")
+            row.setText(5, STATE_TEXT.get(item["state"], item["state"]))
+            row.setToolTip(5, item["error"])
+
+        # 已被清除的任务
+        for task_id in list(self.rows):
+            if task_id not in seen:
+                row = self.rows.pop(task_id)
+                self.last.pop(task_id, None)
+                self.list.takeTopLevelItem(self.list.indexOfTopLevelItem(row))
+
+        if not items:
+            self.summary_label.setText("没有传输任务")
+            return
+        counts = summary["counts"]
+        done = counts.get(engine.DONE, 0)
+        active = counts.get(engine.RUNNING, 0) + counts.get(engine.QUEUED, 0)
+        text = (f"完成 {done}/{len(items)}  进行中 {active}  "
+                f"{format_size(summary['downloaded'])}/{format_size(summary['total'])}  "
+                f"{format_size(summary['speed'])}/s  剩余 {format_eta(summary['eta'])}")
+        failed = counts.get(engine.FAILED, 0)
+        if failed:
+            text += f"  失败 {failed}"
+        self.summary_label.setText(text)
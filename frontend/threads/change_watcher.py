@@ -0,0 +1,69 @@
+# frontend/threads/change_watcher.py
+
+import threading
+
+import requests
+from PySide6.QtCore import QObject, Signal
+
+POLL_TIMEOUT = 25   # 每次长轮询在服务端最多等待的时间（秒）
+RETRY_DELAY = 5     # 请求失败后多久重试（秒）
+
+
+class ChangeWatcher(QObject):
+    """
+    在后台线程里长轮询设备的 /api/files/changes，把正在浏览的目录里的变化交给界面就地更新。
+    对方是不支持变化订阅的旧版本时安静地停止，界面仍然可以手动刷新。
+    长轮询可能阻塞几十秒，所以用守护线程而不是 QThread，停止时不必等它返回。
+    """
+    changes = Signal(object)   # 服务端返回的 {"events", "reset", "stale", "missing"}
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.paths = {""}
+        self.cursor = ""
+        self._running = True
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def set_paths(self, paths):
+        """更新订阅的目录（根目录为 ""）"""
+        paths = set(paths)
+        with self._lock:
+            added = paths - self.paths
+            self.paths = paths
+        if added and self.cursor:
+            # 进行中的长轮询不包含新目录，先单独登记监视；之后的变化在下一轮返回
+            threading.Thread(target=self._register, args=(sorted(added),), daemon=True).start()
+
+    def _register(self, paths):
+        try:
+            self.client.changes(paths, timeout=0)
+        except Exception as e:
+            print(f"[ChangeWatch] 订阅目录失败: {e}")
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                paths = sorted(self.paths)
+            try:
+                result = self.client.changes(paths, self.cursor, POLL_TIMEOUT)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    print(f"[ChangeWatch] {self.client.base_url} 不支持目录变化订阅")
+                    return
+                self._stopped.wait(RETRY_DELAY)
+                continue
+            except Exception:
+                self._stopped.wait(RETRY_DELAY)  # 对方离线，稍后重试；重连后的 reset 会让界面重新确认
+                continue
+            if not self._running:
+                return
+            self.cursor = result["cursor"]
+            if result["events"] or result["reset"] or result["stale"]:
+                self.changes.emit(result)
+
+    def stop(self):
+        self._running = False
+        self._stopped.set()
@@ -0,0 +1,68 @@
+# frontend/threads/download_manager.py
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from common.download_engine import DownloadEngine, DownloadTask, ORDER_SIZE
+
+REFRESH_INTERVAL_MS = 250  # 界面刷新间隔
+
+
+class DownloadManager(QObject):
+    """
+    DownloadEngine 的 Qt 包装。
+    引擎在工作线程里下载，这里用定时器拉取快照，再以信号的形式交给界面，
+    这样无论多少个任务，界面每秒最多只刷新几次。
+    """
+    updated = Signal(list, dict)        # 每项快照, 汇总
+    task_finished = Signal(str, str)    # 文件名, 状态
+
+    def __init__(self, max_workers=3, order=ORDER_SIZE, fsync_interval=0,
+                 swarm_min_size=64 * 1024 * 1024, link_profiles=None, parent=None):
+        super().__init__(parent)
+        self._finished = []  # 工作线程完成的任务，等待定时器在主线程派发
+        self.engine = DownloadEngine(max_workers=max_workers, order=order,
+                                     on_task_done=self._finished.append,
+                                     fsync_interval=fsync_interval,
+                                     swarm_min_size=swarm_min_size,
+                                     link_profiles=link_profiles)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._refresh)
+        self.timer.start(REFRESH_INTERVAL_MS)
+
+    def add(self, url, headers, save_path, size=None, name=None, client=None, path=None, peers=None):
+        return self.engine.add(DownloadTask(url, headers, save_path, size=size, name=name,
+                                            client=client, path=path, peers=peers))
+
+    def pause(self, task_id):
+        self.engine.pause(task_id)
+
+    def resume(self, task_id):
+        self.engine.resume(task_id)
+
+    def cancel(self, task_id):
+        self.engine.cancel(task_id)
+
+    def pause_all(self):
+        self.engine.pause_all()
+
+    def resume_all(self):
+        self.engine.resume_all()
+
+    def cancel_all(self):
+        self.engine.cancel_all()
+
+    def clear_finished(self):
+        self.engine.clear_finished()
+        self._refresh()
+
+    def shutdown(self):
+        self.timer.stop()
+        self.engine.shutdown()
+
+    def _refresh(self):
+        while self._finished:
+            task = self._finished.pop(0)
+            self.task_finished.emit(task.name, task.state)
+        items, summary = self.engine.snapshot()
+        self.updated.emit(items, summary)
@@ -3,78 +3,69 @@
 from PySide6.QtCore import QThread, Signal
 import requests
 import os
+import time
+
+from common.download_engine import DownloadTask, fetch_to_file, DownloadInterrupted
+
+PROGRESS_INTERVAL = 0.2  # 进度信号最小间隔（秒）
 
-class InterruptedError(Exception):
-    """用于标记下载中断的异常"""
-    pass
 
 class FileDownloadThread(QThread):
+    """单文件下载线程，复用 download_engine 的接收逻辑"""
     progress = Signal(int)
     finished = Signal(str)  # 文件名
     failed = Signal(str, str)  # 文件名, 错误信息
 
     def __init__(self, url, headers, save_path, parent=None):
         super().__init__(parent)
-        self.url = url
-        self.headers = headers
+        self.task = DownloadTask(url, headers, save_path)
         self.save_path = save_path
-        self.name = os.path.basename(save_path)
+        self.name = self.task.name
         self._is_running = True
+        self._last_emit = 0.0
+
+    def _should_continue(self):
+        # 借用取消检查点做节流的进度通知
+        now = time.monotonic()
+        if self.task.total > 0 and now - self._last_emit >= PROGRESS_INTERVAL:
+            self._last_emit = now
+            self.progress.emit(int(100 * self.task.downloaded / self.task.total))
+        return self._is_running
 
     def run(self):
         try:
             print(f"开始下载: {self.name}")
-            response = requests.get(self.url, headers=self.headers, stream=True, verify=False, timeout=(10, 300))
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-
-            os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
-
-            with open(self.save_path, 'wb') as f:
-                for chunk in response.iter_content(8192):
-                    if not self._is_running:
-                        print(f"中断下载: {self.name}")
-                        if os.path.exists(self.save_path):
-                            os.remove(self.save_path)
-                        raise InterruptedError("Download manually stopped")
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            percent = int(100 * downloaded / total_size)
-                            self.progress.emit(percent)
-
+            fetch_to_file(self.task, should_continue=self._should_continue)
             self.progress.emit(100)
             print(f"下载完成: {self.name}")
             self.finished.emit(self.name)
 
-        except InterruptedError as ie:
+        except DownloadInterrupted as ie:
+            print(f"中断下载: {self.name}")
+            self._remove_part()
             self.failed.emit(self.name, str(ie))
 
         except requests.exceptions.RequestException as e:
             err = f"网络错误: {e}"
             print(f"下载失败 [{self.name}]: {err}")
             self.failed.emit(self.name, err)
-            try:
-                if os.path.exists(self.save_path):
-                    os.remove(self.save_path)
-            except Exception:
-                pass
+            self._remove_part()
 
         except Exception as e:
             print(f"下载失败 [{self.name}]: {e}")
             self.failed.emit(self.name, str(e))
-            try:
-                if os.path.exists(self.save_path):
-                    os.remove(self.save_path)
-            except Exception:
-                pass
+            self._remove_part()
 
         finally:
             self._is_running = False
 
+    def _remove_part(self):
+        try:
+            if os.path.exists(self.task.part_path):
+                os.remove(self.task.part_path)
+        except Exception:
+            pass
+
     def stop(self):
         """请求中止线程"""
-        self._is_running = False
\ No newline at end of file
+        self._is_running = False
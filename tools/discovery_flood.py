@@ -0,0 +1,134 @@
+# tools/discovery_flood.py
+# 设备发现压力测试：向发现端口灌入大量伪造的设备广播，统计接收线程的 CPU 占用和设备表结果。
+#
+# 本进程内测试（默认，启动一个独立的接收线程和设备表）：
+#   python -m tools.discovery_flood --devices 3000 --rate 20000 --duration 10
+# 压测正在运行的后端：
+#   python -m tools.discovery_flood --target 127.0.0.1:17257
+
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+DUPLICATE_NAME = "未命名设备"
+
+
+def make_devices(count, duplicate_ratio):
+    devices = []
+    for i in range(count):
+        name = DUPLICATE_NAME if random.random() < duplicate_ratio else f"sim-{i:05d}"
+        payload = json.dumps({"id": uuid.uuid4().hex, "name": name}).encode("utf-8")
+        devices.append(payload)
+    return devices
+
+
+def open_senders(sources):
+    """Linux 上整个 127/8 都指向本机，绑定不同的源地址来模拟不同的主机"""
+    socks = []
+    for i in range(sources):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((f"127.0.{i // 250}.{i % 250 + 1}", 0))
+        except OSError:
+            sock.close()
+            if socks:
+                break
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        socks.append(sock)
+    return socks
+
+
+def flood(target, devices, socks, rate, duration):
+    """按设备轮流发送，直到时长用完；返回实际发送数"""
+    sent = 0
+    batch = max(1, rate // 100)
+    interval = batch / rate
+    deadline = time.monotonic() + duration
+    next_tick = time.monotonic()
+    while time.monotonic() < deadline:
+        for _ in range(batch):
+            index = sent % len(devices)
+            try:
+                socks[index % len(socks)].sendto(devices[index], target)
+            except OSError:
+                pass  # 发送缓冲区满，丢掉即可（广播本来就不可靠）
+            sent += 1
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    return sent
+
+
+def thread_cpu_clock(thread):
+    try:
+        clock_id = time.pthread_getcpuclockid(thread.ident)
+        return lambda: time.clock_gettime(clock_id)
+    except (AttributeError, OSError):
+        return time.process_time  # 非 Linux 退化为整个进程的 CPU 时间
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_local(args, devices, socks):
+    from backend.core.device_discovery import DeviceDiscoveryThread, FLUSH_INTERVAL
+    from backend.core.device_manager import DeviceManager
+
+    manager = DeviceManager()
+    found = []
+    receiver = DeviceDiscoveryThread(lambda name, ip: found.append(name), port=free_udp_port(), manager=manager)
+    receiver.start()
+    if not receiver.bound.wait(3):
+        sys.exit("❌ 接收线程启动失败")
+
+    cpu = thread_cpu_clock(receiver)
+    cpu_start, wall_start = cpu(), time.monotonic()
+    sent = flood(("127.0.0.1", receiver.port), devices, socks, args.rate, args.duration)
+    time.sleep(FLUSH_INTERVAL * 2)
+    cpu_used, wall = cpu() - cpu_start, time.monotonic() - wall_start
+    receiver.stop()
+
+    listed = manager.get_devices()
+    duplicates = len(manager.find_by_name(DUPLICATE_NAME))
+    print(f"发送 {sent} 个广播，接收 {receiver.received}，去重后处理 {receiver.processed}")
+    print(f"设备表 {len(listed)} / {len(devices)} 台，其中 {duplicates} 台同名“{DUPLICATE_NAME}”，回调 {len(found)} 次")
+    print(f"接收线程 CPU {cpu_used:.2f}s / 墙钟 {wall:.1f}s = {cpu_used / wall * 100:.1f}%"
+          f"，每个广播 {cpu_used / max(receiver.received, 1) * 1e6:.1f}µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlyDrop 设备发现压力测试")
+    parser.add_argument("--devices", type=int, default=3000, help="模拟的设备数")
+    parser.add_argument("--sources", type=int, default=200, help="模拟的源 IP 数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="使用默认设备名的比例")
+    parser.add_argument("--rate", type=int, default=20000, help="每秒发送的广播数")
+    parser.add_argument("--duration", type=float, default=10, help="持续时间（秒）")
+    parser.add_argument("--target", help="压测正在运行的后端，如 127.0.0.1:17257；不填则在本进程内测试")
+    args = parser.parse_args()
+
+    devices = make_devices(args.devices, args.duplicate_ratio)
+    socks = open_senders(args.sources)
+    print(f"🚀 {args.devices} 台模拟设备，{len(socks)} 个源地址，{args.rate}/s，持续 {args.duration}s")
+    try:
+        if args.target:
+            host, port = args.target.rsplit(":", 1)
+            sent = flood((host, int(port)), devices, socks, args.rate, args.duration)
+            print(f"发送 {sent} 个广播")
+        else:
+            run_local(args, devices, socks)
+    finally:
+        for sock in socks:
+            sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# tools/download_bench.py
+# 下载基准测试：在临时目录启动一个后端，经由 netem_proxy 模拟的链路下载测试文件，
+# 比较单连接、断线重下、断点续传、分段下载和打包下载的有效吞吐、首字节时间、重试次数和内存。
+#
+#   python -m tools.download_bench
+#   python -m tools.download_bench --links wifi,lossy-wifi --scenarios resume,segmented --size-mb 64
+#   python -m tools.download_bench --json > result.json
+#
+# 内存一栏是本进程（下载逻辑 + 代理）在场景期间的 RSS 峰值增量，只用于同一次运行内横向比较。
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+import requests
+
+from common.api_client import PeerClient
+from common.download_engine import DownloadTask, fetch_to_file
+from common.receive_pipeline import DownloadInterrupted
+from common.swarm import fetch_swarm
+from tools.netem_proxy import LinkProfile, NetemProxy
+
+PASSWORD = "bench"
+MAX_RETRIES = 30
+RETRY_WAIT = 0.2
+SAMPLE_INTERVAL = 0.01
+ZIP_FILES = 16
+
+LINKS = {
+    "lan": LinkProfile(),
+    "wifi": LinkProfile(latency_ms=3, jitter_ms=2, rate_kbps=12 * 1024),
+    "lossy-wifi": LinkProfile(latency_ms=15, jitter_ms=10, rate_kbps=4 * 1024, reset_mb=6),
+    "wan": LinkProfile(latency_ms=60, jitter_ms=10, rate_kbps=1024),
+}
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_random(path, size):
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            block = os.urandom(min(remaining, 1 << 20))
+            digest.update(block)
+            f.write(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Backend:
+    """在临时目录里运行的后端进程，带一份测试数据"""
+
+    def __init__(self, workdir, size):
+        self.workdir = workdir
+        self.share = os.path.join(workdir, "share")
+        os.makedirs(os.path.join(self.share, "zipme"), exist_ok=True)
+        self.sha256 = write_random(os.path.join(self.share, "data.bin"), size)
+        for i in range(ZIP_FILES):
+            write_random(os.path.join(self.share, "zipme", f"part{i:02d}.bin"), max(size // ZIP_FILES, 1))
+        self.port = free_port()
+        config = {
+            "share_path": self.share, "port": self.port, "discovery_port": free_port(socket.SOCK_DGRAM),
+            "access_password": PASSWORD, "allowed_ips": [], "https_enabled": False,
+            "zip_cache_dir": os.path.join(workdir, "zipcache"),
+        }
+        with open(os.path.join(workdir, "config.json"), "w") as f:
+            json.dump(config, f, indent=2)
+        self.process = None
+
+    @property
+    def address(self):
+        return "127.0.0.1", self.port
+
+    def start(self):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.workdir, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(self.workdir, "server.log"), "w"))
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"http://127.0.0.1:{self.port}/api/files/list", timeout=1)
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        sys.exit(f"❌ 后端启动失败，见 {self.workdir}/server.log")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(10)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # 非 Linux 退化为进程峰值
+
+
+class Sampler(threading.Thread):
+    """采样下载进度和内存：首字节时间取 downloaded 第一次大于 0 的时刻"""
+
+    def __init__(self, task):
+        super().__init__(daemon=True)
+        self.task = task
+        self.started = time.monotonic()
+        self.first_byte = None
+        self.base_rss = rss_bytes()
+        self.peak_rss = self.base_rss
+        self.running = True
+
+    def run(self):
+        while self.running:
+            if self.first_byte is None and self.task.downloaded > 0:
+                self.first_byte = time.monotonic() - self.started
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+def with_retries(attempt, task, keep_part):
+    """反复调用 attempt 直到成功；keep_part=False 时每次从头下载。返回重试次数"""
+    retries = 0
+    while True:
+        try:
+            attempt()
+            return retries
+        except DownloadInterrupted:
+            raise
+        except (requests.exceptions.RequestException, IOError) as e:
+            if retries >= MAX_RETRIES:
+                raise IOError(f"重试 {retries} 次仍失败: {e}")
+            retries += 1
+            if not keep_part and os.path.exists(task.part_path):
+                os.remove(task.part_path)
+            time.sleep(RETRY_WAIT)
+
+
+def scenario_single(client, task):
+    """单连接，失败即放弃（FileDownloadThread 的行为）"""
+    fetch_to_file(task)
+    return 0
+
+
+def scenario_restart(client, task):
+    """单连接，失败后删掉 .part 从头重下"""
+    return with_retries(lambda: fetch_to_file(task), task, keep_part=False)
+
+
+def scenario_resume(client, task):
+    """单连接，失败后用 Range 从 .part 续传"""
+    return with_retries(lambda: fetch_to_file(task), task, keep_part=True)
+
+
+def scenario_segmented(client, task):
+    """同一来源多条连接按分片并行下载，分片失败由 SwarmDownload 内部重试"""
+    def attempt():
+        if not fetch_swarm(task, client, [], min_sources=1):
+            raise IOError("分段下载不可用")
+    return with_retries(attempt, task, keep_part=False)
+
+
+def scenario_zip(client, task):
+    """后台打包 zipme/ 并边打包边下载，失败后续传"""
+    job = client.create_zip_job(["zipme"])
+    task.url = client.zip_job_download_url(job["job_id"])
+    return with_retries(lambda: fetch_to_file(task), task, keep_part=True)
+
+
+SCENARIOS = {
+    "single": scenario_single,
+    "restart": scenario_restart,
+    "resume": scenario_resume,
+    "segmented": scenario_segmented,
+    "zip": scenario_zip,
+}
+
+
+def run_one(backend, proxy, name, out_dir):
+    client = PeerClient(proxy.url, PASSWORD)
+    save_path = os.path.join(out_dir, f"{name}.out")
+    task = DownloadTask(client.download_url("data.bin"), {}, save_path, client=client, path="data.bin")
+    proxy.reset_stats()
+    sampler = Sampler(task)
+    sampler.start()
+    result = {"scenario": name, "ok": False, "retries": 0, "error": ""}
+    try:
+        result["retries"] = SCENARIOS[name](client, task)
+        if name == "zip":
+            with zipfile.ZipFile(save_path) as archive:
+                result["ok"] = archive.testzip() is None and len(archive.namelist()) == ZIP_FILES
+        else:
+            result["ok"] = sha256_of(save_path) == backend.sha256
+        if not result["ok"]:
+            result["error"] = "内容校验失败"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        sampler.stop()
+        client.close_ws_session()
+    elapsed = time.monotonic() - sampler.started
+    size = os.path.getsize(save_path) if os.path.exists(save_path) else 0
+    stats = proxy.snapshot()
+    result.update(
+        seconds=round(elapsed, 2),
+        bytes=size,
+        goodput_mbps=round(size / elapsed / 1048576, 2) if result["ok"] else 0,
+        ttfb_ms=round(sampler.first_byte * 1000) if sampler.first_byte is not None else None,
+        wire_bytes=stats["down"],
+        connections=stats["connections"],
+        resets=stats["resets"],
+        peak_rss_mb=round((sampler.peak_rss - sampler.base_rss) / 1048576, 1),
+    )
+    for path in (save_path, task.part_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return result
+
+
+def print_table(link, profile, results):
+    print(f"\n📶 {link}（{profile.describe()}）")
+    print(f"{'场景':<10}{'结果':<6}{'用时':>8}{'吞吐MB/s':>10}{'首字节ms':>10}{'重试':>6}"
+          f"{'连接':>6}{'重置':>6}{'线上/文件':>10}{'内存MB':>8}")
+    for r in results:
+        overhead = f"{r['wire_bytes'] / r['bytes']:.2f}" if r["bytes"] else "-"
+        print(f"{r['scenario']:<10}{'✅' if r['ok'] else '❌':<6}{r['seconds']:>8.2f}{r['goodput_mbps']:>10.2f}"
+              f"{r['ttfb_ms'] if r['ttfb_ms'] is not None else '-':>10}{r['retries']:>6}"
+              f"{r['connections']:>6}{r['resets']:>6}{overhead:>10}{r['peak_rss_mb']:>8.1f}")
+        if r["error"]:
+            print(f"    {r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlyDrop 下载基准测试（经由模拟链路）")
+    parser.add_argument("--links", default="lan,wifi,lossy-wifi", help=f"链路，可选 {','.join(LINKS)}")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"场景，可选 {','.join(SCENARIOS)}")
+    parser.add_argument("--size-mb", type=float, default=32, help="测试文件大小")
+    parser.add_argument("--seed", type=int, default=1, help="代理的随机种子，相同种子在同一场景下断线位置相同")
+    parser.add_argument("--json", action="store_true", help="结果以 JSON 输出到 stdout")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录（含后端日志）")
+    args = parser.parse_args()
+
+    links = [l for l in args.links.split(",") if l]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = [x for x in links if x not in LINKS] + [x for x in scenarios if x not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的链路或场景: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="flydrop-bench-")
+    out_dir = os.path.join(workdir, "downloads")
+    os.makedirs(out_dir)
+    if not args.json:
+        print(f"🚀 准备 {args.size_mb:g}MB 测试数据，工作目录 {workdir}")
+    backend = Backend(workdir, int(args.size_mb * 1048576))
+    backend.start()
+    proxy = NetemProxy(backend.address).start()
+    report = {}
+    try:
+        for link in links:
+            profile = LINKS[link]
+            results = []
+            for name in scenarios:
+                proxy.set_profile(profile)
+                proxy.random.seed(args.seed)
+                results.append(run_one(backend, proxy, name, out_dir))
+            report[link] = results
+            if not args.json:
+                print_table(link, profile, results)
+    finally:
+        proxy.stop()
+        backend.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# tools/netem_proxy.py
+# 模拟真实网络的 TCP 代理：放在客户端和后端之间，注入延迟、抖动、带宽上限和连接重置，
+# 用来观察下载逻辑在高延迟、易断线的 Wi-Fi 上的表现。
+#
+# 单独运行（客户端改连 127.0.0.1:18100）：
+#   python -m tools.netem_proxy --listen 18100 --target 127.0.0.1:8010 --latency 40 --jitter 20 --rate 2048 --reset-mb 16
+# 脚本里使用：
+#   proxy = NetemProxy(("127.0.0.1", 8010), LinkProfile(latency_ms=40, rate_kbps=2048)); proxy.start()
+
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+CHUNK = 16 * 1024           # 每次转发的最大字节数
+QUEUE_LIMIT = 256 * 1024    # 每个方向在途的最大字节数，满了就不再读，对端自然被 TCP 反压
+
+
+@dataclass
+class LinkProfile:
+    latency_ms: float = 0        # 单向延迟
+    jitter_ms: float = 0         # 延迟的随机波动（均匀分布 ±jitter），不会造成乱序
+    rate_kbps: float = 0         # 每个方向的总带宽上限（KB/s），所有连接共享，0 表示不限
+    reset_mb: float = 0          # 平均每传输多少 MB 重置一次连接（指数分布），0 表示不重置
+    seed: int = None
+
+    def describe(self):
+        parts = []
+        if self.latency_ms:
+            parts.append(f"延迟 {self.latency_ms:g}±{self.jitter_ms:g}ms")
+        if self.rate_kbps:
+            parts.append(f"带宽 {self.rate_kbps:g}KB/s")
+        if self.reset_mb:
+            parts.append(f"每 ~{self.reset_mb:g}MB 断一次")
+        return "，".join(parts) or "不限速"
+
+
+class TokenBucket:
+    """多个连接共享的限速器，模拟一条链路"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next_free, now)
+            self.next_free = start + nbytes / self.rate
+            wait = self.next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _Pipe:
+    """一个方向的转发：读线程打上到达时间放进队列，写线程按时间和带宽发出"""
+
+    def __init__(self, proxy, conn, src, dst, bucket, direction):
+        self.proxy = proxy
+        self.conn = conn
+        self.src = src
+        self.dst = dst
+        self.bucket = bucket
+        self.direction = direction
+        self.queue = deque()
+        self.queued = 0
+        self.eof = False
+        self.cond = threading.Condition()
+        self.last_due = 0.0
+
+    def start(self):
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def _delay(self):
+        profile = self.proxy.profile
+        delay = profile.latency_ms / 1000
+        if profile.jitter_ms:
+            delay += self.proxy.random.uniform(-profile.jitter_ms, profile.jitter_ms) / 1000
+        # 同一连接上的数据不能被抖动打乱顺序
+        due = max(time.monotonic() + max(delay, 0), self.last_due)
+        self.last_due = due
+        return due
+
+    def _read_loop(self):
+        try:
+            while not self.conn.closed:
+                with self.cond:
+                    while self.queued >= QUEUE_LIMIT and not self.conn.closed:
+                        self.cond.wait(0.5)
+                data = self.src.recv(CHUNK)
+                if not data:
+                    break
+                with self.cond:
+                    self.queue.append((self._delay(), data))
+                    self.queued += len(data)
+                    self.cond.notify_all()
+        except OSError:
+            pass
+        with self.cond:
+            self.eof = True
+            self.cond.notify_all()
+
+    def _write_loop(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.queue and not self.eof and not self.conn.closed:
+                        self.cond.wait(0.5)
+                    if self.conn.closed or (not self.queue and self.eof):
+                        break
+                    due, data = self.queue.popleft()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.bucket.consume(len(data))
+                if self.conn.closed:
+                    break
+                self.dst.sendall(data)
+                with self.cond:
+                    self.queued -= len(data)
+                    self.cond.notify_all()
+                if self.conn.account(self.direction, len(data)):
+                    return  # 连接已被重置
+            if not self.conn.closed:
+                self.dst.shutdown(socket.SHUT_WR)  # 转发对端的 FIN
+        except OSError:
+            self.conn.close()
+        self.conn.pipe_done()
+
+
+class _Connection:
+    def __init__(self, proxy, client, upstream):
+        self.proxy = proxy
+        self.client = client
+        self.upstream = upstream
+        self.closed = False
+        self.lock = threading.Lock()
+        self.open_pipes = 2
+        self.reset_budget = proxy.next_reset_budget()
+
+    def start(self):
+        _Pipe(self.proxy, self, self.client, self.upstream, self.proxy.up_bucket, "up").start()
+        _Pipe(self.proxy, self, self.upstream, self.client, self.proxy.down_bucket, "down").start()
+
+    def account(self, direction, nbytes):
+        """记录转发量；用完重置额度时向两端发送 RST，返回 True"""
+        self.proxy.count(direction, nbytes)
+        if self.reset_budget is None:
+            return False
+        with self.lock:
+            self.reset_budget -= nbytes
+            if self.reset_budget > 0:
+                return False
+        self.proxy.count("resets", 1)
+        self.close(reset=True)
+        return True
+
+    def pipe_done(self):
+        with self.lock:
+            self.open_pipes -= 1
+            finished = self.open_pipes == 0
+        if finished:
+            self.close()
+
+    def close(self, reset=False):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        for sock in (self.client, self.upstream):
+            try:
+                if reset:
+                    # SO_LINGER 为 0 时 close 直接发 RST，和 Wi-Fi 掉线后 NAT 表项失效的效果相同
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                sock.shutdown(socket.SHUT_RD)  # 唤醒阻塞在 recv 上的读线程，不发送任何报文
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self.proxy.forget(self)
+
+
+class NetemProxy:
+    """
+    在 listen 地址上接受连接并转发到 target。
+    profile 可以在运行中替换，之后的数据按新参数处理（带宽在新连接上生效）。
+    """
+
+    def __init__(self, target, profile=None, listen=("127.0.0.1", 0)):
+        self.target = target
+        self.profile = profile or LinkProfile()
+        self.random = random.Random(self.profile.seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(listen)
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        self.connections = set()
+        self.stats_lock = threading.Lock()
+        self._running = False
+        self.set_profile(self.profile)
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def set_profile(self, profile):
+        self.profile = profile
+        self.up_bucket = TokenBucket(profile.rate_kbps * 1024)
+        self.down_bucket = TokenBucket(profile.rate_kbps * 1024)
+
+    def next_reset_budget(self):
+        if not self.profile.reset_mb:
+            return None
+        return self.random.expovariate(1 / (self.profile.reset_mb * 1024 * 1024))
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"connections": 0, "up": 0, "down": 0, "resets": 0}
+
+    def count(self, key, n):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def snapshot(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def forget(self, conn):
+        self.connections.discard(conn)
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.sock.close()
+        for conn in list(self.connections):
+            conn.close()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(self.target, timeout=10)
+                upstream.settimeout(None)
+            except OSError:
+                client.close()
+                continue
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = _Connection(self, client, upstream)
+            self.connections.add(conn)
+            self.count("connections", 1)
+            conn.start()
+
+
+def parse_address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlyDrop 网络模拟代理")
+    parser.add_argument("--listen", type=int, default=18100, help="本地监听端口")
+    parser.add_argument("--target", default="127.0.0.1:8010", help="后端地址")
+    parser.add_argument("--latency", type=float, default=0, help="单向延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="延迟抖动（毫秒）")
+    parser.add_argument("--rate", type=float, default=0, help="每个方向的带宽上限（KB/s），0 表示不限")
+    parser.add_argument("--reset-mb", type=float, default=0, help="平均每传输多少 MB 重置一次连接")
+    parser.add_argument("--seed", type=int, help="随机种子，便于复现")
+    args = parser.parse_args()
+
+    profile = LinkProfile(args.latency, args.jitter, args.rate, args.reset_mb, args.seed)
+    proxy = NetemProxy(parse_address(args.target), profile, listen=("0.0.0.0", args.listen)).start()
+    print(f"🚦 127.0.0.1:{proxy.port} → {args.target}（{profile.describe()}）")
+    try:
+        while True:
+            time.sleep(5)
+            stats = proxy.snapshot()
+            print(f"连接 {stats['connections']}，上行 {stats['up'] / 1048576:.1f}MB，"
+                  f"下行 {stats['down'] / 1048576:.1f}MB，重置 {stats['resets']}")
+    except KeyboardInterrupt:
+        proxy.stop()
+
+
+if __name__ == "__main__":
+    main()